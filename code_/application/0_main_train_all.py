@@ -16,14 +16,38 @@ import logging
 
 import settings as stg
 
+from code_.domain.cached_pipeline import make_cached_pipeline
 from code_.domain.data_processing import CategoricalProjectorOnTeamChange, CategoricalProjectorOnAvgDistance as CatProjAvg
-from code_.domain.games_info import SeasonFirstHalfAggregator
+from code_.domain.games_info import SeasonFirstHalfAggregator, get_club_ids
+from code_.domain.pipeline_optimizer import optimize_pipeline
+from code_.domain.predictors import TeamConditionedClassifier
+from code_.infrastructure.event_store import EventStore
+from code_.infrastructure.submission_modules import copy_submission_modules
+from code_.infrastructure.transformer_cache import TransformerCache
 
 
 if __name__ == '__main__':
     stg.enable_logging(log_filename='{}.log'.format(splitext(basename(__file__))[0]),
                        logging_level=logging.DEBUG)
 
+
+def get_optimized_pipeline(pipeline, X, step):
+    """Pipeline without no-op steps nor duplicate copied columns if enabled, predictions being checked equal on X.
+
+    Pipeline is kept as is if optimized one predicts differently.
+    """
+    if not stg.BOOL_OPTIMIZE_PIPELINES:
+        return pipeline
+    try:
+        optimized_pipeline, rewrites = optimize_pipeline(pipeline=pipeline, X=X)
+    except ValueError as error:
+        logging.warning('{} - Pipeline not optimized: {}'.format(step, error))
+        return pipeline
+    for rewrite in rewrites:
+        logging.debug('{} - Pipeline optimized: {}'.format(step, rewrite))
+    return optimized_pipeline
+
+
 logging.info('Start of script {}'.format(basename(__file__)))
 check = input('Have you updated latest TPOT pipelines? [y/n]: ')
 
@@ -31,10 +55,12 @@ if check == 'y':
     logging.info('Step 1 - Player prediction model..')
 
     logging.info('Step 1 - Load data ..')
-    sfha = SeasonFirstHalfAggregator(saved_filename=stg.FILENAME_STATS_AGGREGATED)
+    sfha = SeasonFirstHalfAggregator(saved_filename=stg.FILENAME_STATS_AGGREGATED,
+                                     event_store=EventStore() if stg.BOOL_USE_EVENT_STORE else None)
     df = sfha.build_players_stats_dataset(sliding_interval_min=5,
                                           list_events_number=stg.EVENTS_COMPUTE_NUMBER,
-                                          list_events_with_success_rate=stg.EVENTS_COMPUTE_SUCCESS_RATE,)
+                                          list_events_with_success_rate=stg.EVENTS_COMPUTE_SUCCESS_RATE,
+                                          columns=stg.PLAYER_FEATURES + [stg.PLAYER_TARGET, stg.GAME_ID_COL])
     logging.info('Step 1 - .. Done')
 
     X_player, y_player = df[stg.PLAYER_FEATURES], df[stg.PLAYER_TARGET]
@@ -46,31 +72,55 @@ if check == 'y':
     logging.info('Step 1 - .. Done')
 
     logging.info('Step 1 - Fit and save pipeline to predict players..')
-    player_pipeline = make_pipeline(
+    # Both pipelines share their FastICA, fitted once and reused from cache by next runs
+    transformer_cache = TransformerCache()
+    player_pipeline = make_cached_pipeline(
         make_union(
             FastICA(tol=0.85),
             FunctionTransformer(copy)
         ),
         ExtraTreesClassifier(n_estimators=75, max_depth=18, bootstrap=False,
                              criterion="gini", max_features=0.1,
-                             min_samples_leaf=1, min_samples_split=2)
+                             min_samples_leaf=1, min_samples_split=2),
+        cache=transformer_cache
     )
-    player_pipeline_light = make_pipeline(
+    player_pipeline_light = make_cached_pipeline(
         make_union(
             FastICA(tol=0.85),
             FunctionTransformer(copy)
         ),
         ExtraTreesClassifier(n_estimators=75, max_depth=17, bootstrap=False,
                              criterion="gini", max_features=0.1,
-                             min_samples_leaf=1, min_samples_split=2)
+                             min_samples_leaf=1, min_samples_split=2),
+        cache=transformer_cache
     )
+    # Same pipeline fitted by club, used by submission instead of player_pipeline if saved
+    player_team_pipeline = TeamConditionedClassifier(estimator=make_pipeline(
+        make_union(
+            FastICA(tol=0.85),
+            FunctionTransformer(copy)
+        ),
+        ExtraTreesClassifier(n_estimators=75, max_depth=18, bootstrap=False,
+                             criterion="gini", max_features=0.1,
+                             min_samples_leaf=1, min_samples_split=2)
+    ))
     player_pipeline.fit(X_player, y_player)
     player_pipeline_light.fit(X_player, y_player)
-    logging.debug('Step 1 - Fit ok')
-
+    player_team_pipeline.fit(X_player.assign(**{stg.CLUB_COL: get_club_ids(game_ids=df[stg.GAME_ID_COL],
+                                                                           team_ids=df[stg.TEAM_COL])}),
+                             y_player)
+    logging.debug('Step 1 - Fit ok - transformers fitted {} times, reused {} times'
+                  .format(transformer_cache.nb_misses, transformer_cache.nb_hits))
+
+    # Saved as sklearn pipelines, loaded by submission without code_
+    player_pipeline = get_optimized_pipeline(pipeline=player_pipeline.get_pipeline(), X=X_player, step='Step 1')
+    player_pipeline_light = get_optimized_pipeline(pipeline=player_pipeline_light.get_pipeline(), X=X_player,
+                                                   step='Step 1')
     dump(player_pipeline, join(stg.MODELS_DIR, stg.PLAYER_MODEL_NAME), compress=('lz4', 9))
     dump(player_pipeline, join(stg.SUBMISSION_DIR, stg.PLAYER_MODEL_NAME), compress=('lz4', 9))
     dump(player_pipeline_light, join(stg.SUBMISSION_DIR, stg.PLAYER_MODEL_LIGHT_NAME), compress=('lz4', 9))
+    player_team_pipeline.save(directory=stg.MODELS_DIR, compress=('lz4', 9))
+    player_team_pipeline.save(directory=stg.SUBMISSION_DIR, compress=('lz4', 9))
     file_size = getsize(join(stg.MODELS_DIR, stg.PLAYER_MODEL_NAME))
     logging.debug('Step 1 - Final compression: model size {}'.format(file_size / 1e6))
 
@@ -86,7 +136,8 @@ if check == 'y':
     logging.info('Step 2 - Next team prediction ..')
 
     logging.info('Step 2 - Load data ..')
-    sfha = SeasonFirstHalfAggregator(saved_filename=stg.FILENAME_NEXT_EVENT)
+    sfha = SeasonFirstHalfAggregator(saved_filename=stg.FILENAME_NEXT_EVENT,
+                                     event_store=EventStore() if stg.BOOL_USE_EVENT_STORE else None)
     df_next_events = sfha.build_next_event_dataset(columns_to_lag=stg.NEXT_EVENT_COLS_TO_LAG,
                                                    lags_to_add=stg.NEXT_EVENT_LAGS)
     logging.info('Step 2 - .. Done')
@@ -117,6 +168,7 @@ if check == 'y':
     )
     next_team_pipeline.fit(X_team, y_team)
     logging.debug('Step 2 - Fit ok')
+    next_team_pipeline = get_optimized_pipeline(pipeline=next_team_pipeline, X=X_team, step='Step 2')
     dump(next_team_pipeline, join(stg.MODELS_DIR, stg.NEXT_TEAM_MODEL_NAME), compress=('lz4', 3))
     dump(next_team_pipeline, join(stg.SUBMISSION_DIR, stg.NEXT_TEAM_MODEL_NAME), compress=('lz4', 3))
 
@@ -178,6 +230,8 @@ if check == 'y':
     )
     yproj_pipeline.fit(X_ycoords, y_ycoords)
     logging.debug('Step 3 - Fit ok')
+    xproj_pipeline = get_optimized_pipeline(pipeline=xproj_pipeline, X=X_xcoords, step='Step 3')
+    yproj_pipeline = get_optimized_pipeline(pipeline=yproj_pipeline, X=X_ycoords, step='Step 3')
 
     dump(xproj_pipeline, join(stg.MODELS_DIR, stg.X_PROJ_MODEL_NAME), compress=('lz4', 3))
     dump(xproj_pipeline, join(stg.SUBMISSION_DIR, stg.X_PROJ_MODEL_NAME), compress=('lz4', 3))
@@ -198,6 +252,9 @@ if check == 'y':
     logging.info('Step 3 - .. Done')
     logging.info('Step 3 - Done')
     logging.info('--------------------------------')
+    logging.info('Copy modules shared with code_ in submission ..')
+    copy_submission_modules()
+    logging.info('.. Done')
 elif check == 'n':
     print('You\'d better update TPOT pipelines before launching this script')
     logging.info('Not latest version of TPOT pipelines - script not run')
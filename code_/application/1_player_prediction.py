@@ -1,14 +1,16 @@
 from os.path import basename, splitext, join
 from sklearn.model_selection import train_test_split
-from tpot import TPOTClassifier
 
 import logging
 import pandas as pd
 
 from code_.domain.data_processing import DataQualityChecker
-from code_.domain.games_info import SeasonFirstHalfAggregator
+from code_.domain.early_exit_forest import EarlyExitForest, is_early_exit_compatible
+from code_.domain.games_info import SeasonFirstHalfAggregator, get_club_ids
 from code_.domain.predictors import Modeler
 from code_.domain.performance_analyzer import PerformanceAnalyzer
+from code_.domain.resumable_tpot import ResumableTPOTClassifier
+from code_.infrastructure.event_store import EventStore
 
 import settings as stg
 
@@ -19,10 +21,12 @@ if __name__ == '__main__':
 logging.info('Start of script {}'.format(basename(__file__)))
 
 logging.info('Load data ..')
-sfha = SeasonFirstHalfAggregator(saved_filename=stg.FILENAME_STATS_AGGREGATED)
+sfha = SeasonFirstHalfAggregator(saved_filename=stg.FILENAME_STATS_AGGREGATED,
+                                 event_store=EventStore() if stg.BOOL_USE_EVENT_STORE else None)
 df = sfha.build_players_stats_dataset(sliding_interval_min=5,
                                       list_events_number=stg.EVENTS_COMPUTE_NUMBER,
                                       list_events_with_success_rate=stg.EVENTS_COMPUTE_SUCCESS_RATE)
+df[stg.CLUB_COL] = get_club_ids(game_ids=df[stg.GAME_ID_COL], team_ids=df[stg.TEAM_COL])
 logging.info('.. Done')
 
 logging.info('Data quality check ..')
@@ -31,18 +35,22 @@ dqc.print_completeness()
 dqc.print_min_nb_observations_by_target(target=stg.PLAYER_COL)
 logging.info('.. Done')
 
+# Models by club route rows on club, with a sub-model fitted on players of every club
+is_team_model = stg.PLAYER_MODEL_TYPE in stg.PLAYER_TEAM_MODEL_TYPES
+player_features = stg.PLAYER_FEATURES + ([stg.CLUB_COL] if is_team_model else [])
+
 train, test = train_test_split(df, test_size=0.3, random_state=42)
-X_train, y_train = train[stg.PLAYER_FEATURES], train[stg.PLAYER_TARGET]
-X_test, y_test = test[stg.PLAYER_FEATURES], test[stg.PLAYER_TARGET]
+X_train, y_train = train[player_features], train[stg.PLAYER_TARGET]
+X_test, y_test = test[player_features], test[stg.PLAYER_TARGET]
 
 logging.info('Impute missing values with median ..')
-X_test.fillna(X_train.median(), inplace=True)
-X_train.fillna(X_train.median(), inplace=True)
+X_test.fillna(X_train[stg.PLAYER_FEATURES].median(), inplace=True)
+X_train.fillna(X_train[stg.PLAYER_FEATURES].median(), inplace=True)
 logging.info('.. Done')
 
 if stg.BOOL_TPOT_PLAYER:
     logging.info('Starting TPOT - max time: {} min ..'.format(stg.PLAYER_TPOT_LIMIT_TIME))
-    pipeline_optimizer = TPOTClassifier(**stg.PLAYER_TPOT_HYPERPARAMS)
+    pipeline_optimizer = ResumableTPOTClassifier(**stg.PLAYER_TPOT_HYPERPARAMS)
     pipeline_optimizer.fit(X_train, y_train)
     logging.info('TPOT Score: {}'.format(pipeline_optimizer.score(X_test, y_test)))
     pipeline_optimizer.export(join(stg.OUTPUTS_DIR, stg.PLAYER_TPOT_FILENAME))
@@ -50,26 +58,33 @@ if stg.BOOL_TPOT_PLAYER:
 else:
     player_pred = Modeler(model_type=stg.PLAYER_MODEL_TYPE,
                           hyperparameters=stg.PLAYER_MODEL_BASE_HYPERPARAMS,
-                          target=stg.PLAYER_TARGET, features=stg.PLAYER_FEATURES)
+                          target=stg.PLAYER_TARGET, features=player_features)
 
     if stg.BOOL_TRAIN_PLAYER_MODEL:
         if stg.BOOL_PLAYER_RS:
             logging.info('Cross-validation ..')
-            player_pred.perform_random_search_cv(training_data=pd.concat([X_train, y_train], axis=1),
-                                                 score='accuracy',
-                                                 param_distributions=stg.PLAYER_RANDOM_SEARCH_HYPERPARAMS,
-                                                 n_jobs=stg.N_JOBS)
+            if stg.HYPERPARAMS_SEARCH == 'successive_halving':
+                player_pred.perform_successive_halving_cv(training_data=pd.concat([X_train, y_train], axis=1),
+                                                          groups=train[stg.GAME_ID_COL],
+                                                          score='accuracy',
+                                                          param_distributions=stg.PLAYER_RANDOM_SEARCH_HYPERPARAMS,
+                                                          n_jobs=stg.N_JOBS)
+            else:
+                player_pred.perform_random_search_cv(training_data=pd.concat([X_train, y_train], axis=1),
+                                                     score='accuracy',
+                                                     param_distributions=stg.PLAYER_RANDOM_SEARCH_HYPERPARAMS,
+                                                     n_jobs=stg.N_JOBS)
             logging.info('.. Done')
 
         logging.info('Model to predict players..')
-        player_pred.model.set_params(**{'n_jobs': 3})
+        player_pred.model.set_params(**{stg.PLAYER_MODEL_N_JOBS_PARAMS.get(stg.PLAYER_MODEL_TYPE, 'n_jobs'): 3})
         player_pred.fit(training_data=pd.concat([X_train, y_train], axis=1))
         logging.debug('Fit ok')
-        player_pred.save_model(save_modelname=stg.PLAYER_MODEL_NAME)
+        player_pred.save_model(save_modelname=stg.PLAYER_TEAM_MODEL_NAME if is_team_model else stg.PLAYER_MODEL_NAME)
         logging.info('.. Done')
     else:
         logging.info('Loading latest model ..')
-        player_pred.load_model(save_modelname=stg.PLAYER_MODEL_NAME)
+        player_pred.load_model(save_modelname=stg.PLAYER_TEAM_MODEL_NAME if is_team_model else stg.PLAYER_MODEL_NAME)
         logging.info('.. Done')
 
     logging.info('Performance evaluation ..')
@@ -79,4 +94,13 @@ else:
     logging.info('Classification accuracy: {}'.format(accuracy))
     logging.info('.. Done')
 
+    if is_early_exit_compatible(player_pred.predictor):
+        logging.info('Early-exit voting ..')
+        early_exit_forest = EarlyExitForest(model=player_pred.predictor)
+        nb_equal_predictions = (early_exit_forest.predict(X_test) == pred).sum()
+        logging.info('{} predictions out of {} equal to full forest | {:.1f} trees evaluated on average out of {}'
+                     .format(nb_equal_predictions, len(pred), early_exit_forest.mean_nb_evaluated_trees,
+                             len(early_exit_forest.forest.estimators_)))
+        logging.info('.. Done')
+
 logging.info('End of script {}'.format(basename(__file__)))
@@ -1,6 +1,5 @@
 from os.path import basename, splitext, join
 from sklearn.model_selection import train_test_split
-from tpot import TPOTClassifier
 
 import logging
 import pandas as pd
@@ -9,6 +8,8 @@ from code_.domain.data_processing import CategoricalProjectorOnTeamChange, DataQ
 from code_.domain.games_info import SeasonFirstHalfAggregator
 from code_.domain.predictors import Modeler
 from code_.domain.performance_analyzer import PerformanceAnalyzer
+from code_.domain.resumable_tpot import ResumableTPOTClassifier
+from code_.infrastructure.event_store import EventStore
 
 import settings as stg
 
@@ -19,7 +20,8 @@ if __name__ == '__main__':
 logging.info('Start of script {}'.format(basename(__file__)))
 
 logging.info('Load data ..')
-sfha = SeasonFirstHalfAggregator(saved_filename=stg.FILENAME_NEXT_EVENT)
+sfha = SeasonFirstHalfAggregator(saved_filename=stg.FILENAME_NEXT_EVENT,
+                                 event_store=EventStore() if stg.BOOL_USE_EVENT_STORE else None)
 df = sfha.build_next_event_dataset(columns_to_lag=stg.NEXT_EVENT_COLS_TO_LAG,
                                    lags_to_add=stg.NEXT_EVENT_LAGS)
 logging.info('.. Done')
@@ -49,7 +51,7 @@ logging.info('.. Done')
 
 if stg.BOOL_TPOT_NEXT_TEAM:
     logging.info('Starting TPOT - max time: {} min ..'.format(stg.NEXT_TEAM_TPOT_LIMIT_TIME))
-    pipeline_optimizer = TPOTClassifier(**stg.NEXT_TEAM_TPOT_HYPERPARAMS)
+    pipeline_optimizer = ResumableTPOTClassifier(**stg.NEXT_TEAM_TPOT_HYPERPARAMS)
     pipeline_optimizer.fit(X_train, y_train)
     logging.info('TPOT Score: {}'.format(pipeline_optimizer.score(X_test, y_test)))
     pipeline_optimizer.export(join(stg.OUTPUTS_DIR, stg.NEXT_TEAM_TPOT_FILENAME))
@@ -63,10 +65,17 @@ else:
     if stg.BOOL_TRAIN_NEXT_TEAM_MODEL:
         if stg.BOOL_NEXT_TEAM_RS:
             logging.info('Cross-validation ..')
-            next_team_model.perform_random_search_cv(training_data=pd.concat([X_train, y_train], axis=1),
-                                                     score='accuracy',
-                                                     param_distributions=stg.NEXT_TEAM_RANDOM_SEARCH_HYPERPARAMS,
-                                                     n_jobs=stg.N_JOBS)
+            if stg.HYPERPARAMS_SEARCH == 'successive_halving':
+                next_team_model.perform_successive_halving_cv(training_data=pd.concat([X_train, y_train], axis=1),
+                                                              groups=train[stg.GAME_ID_COL],
+                                                              score='accuracy',
+                                                              param_distributions=stg.NEXT_TEAM_RANDOM_SEARCH_HYPERPARAMS,
+                                                              n_jobs=stg.N_JOBS)
+            else:
+                next_team_model.perform_random_search_cv(training_data=pd.concat([X_train, y_train], axis=1),
+                                                         score='accuracy',
+                                                         param_distributions=stg.NEXT_TEAM_RANDOM_SEARCH_HYPERPARAMS,
+                                                         n_jobs=stg.N_JOBS)
             logging.info('.. Done')
 
         logging.info('Model to predict next event..')
@@ -1,6 +1,5 @@
 from os.path import basename, splitext, join
 from sklearn.model_selection import train_test_split
-from tpot import TPOTRegressor
 
 import logging
 import pandas as pd
@@ -9,6 +8,8 @@ from code_.domain.data_processing import CategoricalProjectorOnAvgDistance as Ca
 from code_.domain.games_info import SeasonFirstHalfAggregator
 from code_.domain.predictors import Modeler
 from code_.domain.performance_analyzer import PerformanceAnalyzer
+from code_.domain.resumable_tpot import ResumableTPOTRegressor
+from code_.infrastructure.event_store import EventStore
 
 import settings as stg
 
@@ -19,7 +20,8 @@ if __name__ == '__main__':
 logging.info('Start of script {}'.format(basename(__file__)))
 
 logging.info('Load data ..')
-sfha = SeasonFirstHalfAggregator(saved_filename=stg.FILENAME_NEXT_EVENT)
+sfha = SeasonFirstHalfAggregator(saved_filename=stg.FILENAME_NEXT_EVENT,
+                                 event_store=EventStore() if stg.BOOL_USE_EVENT_STORE else None)
 df = sfha.build_next_event_dataset(columns_to_lag=stg.NEXT_EVENT_COLS_TO_LAG,
                                    lags_to_add=stg.NEXT_EVENT_LAGS)
 logging.info('.. Done')
@@ -68,7 +70,7 @@ logging.info('.. Done')
 
 if stg.BOOL_TPOT_COORDS:
     logging.info('Starting TPOT (X proj) - max time: {} min ..'.format(stg.COORDS_TPOT_LIMIT_TIME))
-    pipeline_optimizer = TPOTRegressor(**stg.COORDS_TPOT_HYPERPARAMS)
+    pipeline_optimizer = ResumableTPOTRegressor(**stg.COORDS_TPOT_HYPERPARAMS)
     pipeline_optimizer.fit(X_train_xcoords, y_train_xcoords)
     logging.info('TPOT Score: {}'.format(pipeline_optimizer.score(X_test_xcoords, y_test_xcoords)))
     pipeline_optimizer.export(join(stg.OUTPUTS_DIR, stg.X_PROJ_TPOT_FILENAME))
@@ -76,7 +78,7 @@ if stg.BOOL_TPOT_COORDS:
     logging.debug('Done for X coordinate')
 
     logging.info('Starting TPOT (Y proj) - max time: {} min ..'.format(stg.COORDS_TPOT_LIMIT_TIME))
-    pipeline_optimizer = TPOTRegressor(**stg.COORDS_TPOT_HYPERPARAMS)
+    pipeline_optimizer = ResumableTPOTRegressor(**stg.COORDS_TPOT_HYPERPARAMS)
     pipeline_optimizer.fit(X_train_xcoords, y_train_xcoords)
     logging.info('TPOT Score: {}'.format(pipeline_optimizer.score(X_test_xcoords, y_test_xcoords)))
     pipeline_optimizer.export(join(stg.OUTPUTS_DIR, stg.Y_PROJ_TPOT_FILENAME))
@@ -93,16 +95,28 @@ else:
     if stg.BOOL_TRAIN_COORDS_MODEL:
         if stg.BOOL_COORDS_RS:
             logging.info('Cross-validation ..')
-            xcoords_model.perform_random_search_cv(training_data=pd.concat([X_train_xcoords, y_train_xcoords], axis=1),
-                                                   score='neg_mean_squared_error',
-                                                   param_distributions=stg.X_PROJ_RANDOM_SEARCH_HYPERPARAMS,
-                                                   n_jobs=stg.N_JOBS)
-            logging.debug('Done for X coordinate')
-            ycoords_model.perform_random_search_cv(training_data=pd.concat([X_train_ycoords, y_train_ycoords], axis=1),
-                                                   score='neg_mean_squared_error',
-                                                   param_distributions=stg.Y_PROJ_RANDOM_SEARCH_HYPERPARAMS,
-                                                   n_jobs=stg.N_JOBS)
-            logging.debug('Done for Y coordinate')
+            if stg.HYPERPARAMS_SEARCH == 'successive_halving':
+                xcoords_model.perform_successive_halving_cv(
+                    training_data=pd.concat([X_train_xcoords, y_train_xcoords], axis=1),
+                    groups=train[stg.GAME_ID_COL], score='neg_mean_squared_error',
+                    param_distributions=stg.X_PROJ_RANDOM_SEARCH_HYPERPARAMS, n_jobs=stg.N_JOBS)
+                logging.debug('Done for X coordinate')
+                ycoords_model.perform_successive_halving_cv(
+                    training_data=pd.concat([X_train_ycoords, y_train_ycoords], axis=1),
+                    groups=train[stg.GAME_ID_COL], score='neg_mean_squared_error',
+                    param_distributions=stg.Y_PROJ_RANDOM_SEARCH_HYPERPARAMS, n_jobs=stg.N_JOBS)
+                logging.debug('Done for Y coordinate')
+            else:
+                xcoords_model.perform_random_search_cv(training_data=pd.concat([X_train_xcoords, y_train_xcoords], axis=1),
+                                                       score='neg_mean_squared_error',
+                                                       param_distributions=stg.X_PROJ_RANDOM_SEARCH_HYPERPARAMS,
+                                                       n_jobs=stg.N_JOBS)
+                logging.debug('Done for X coordinate')
+                ycoords_model.perform_random_search_cv(training_data=pd.concat([X_train_ycoords, y_train_ycoords], axis=1),
+                                                       score='neg_mean_squared_error',
+                                                       param_distributions=stg.Y_PROJ_RANDOM_SEARCH_HYPERPARAMS,
+                                                       n_jobs=stg.N_JOBS)
+                logging.debug('Done for Y coordinate')
             logging.info('.. Done')
 
         logging.info('Model to predict coordinates..')
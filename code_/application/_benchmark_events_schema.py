@@ -0,0 +1,67 @@
+from os.path import basename, splitext
+from time import time
+
+import logging
+import os
+import pandas as pd
+
+from code_.domain.games_info import NextEventInGame
+from code_.infrastructure.game import Game
+
+import settings as stg
+
+if __name__ == '__main__':
+    stg.enable_logging(log_filename='{}.log'.format(splitext(basename(__file__))[0]),
+                       logging_level=logging.INFO)
+
+
+class StringGame(Game):
+    """Game keeping cleaned events as raw strings, as before typed schema."""
+
+    def _apply_events_schema(self, df):
+        return df
+
+
+def project_coordinates_with_apply(df):
+    """Former projection of coordinates, converting strings row by row."""
+    return df.assign(**{stg.X_PROJECTED_COL: lambda x: x[stg.TEAM_COL].apply(int) * x[stg.X_COL].apply(float) + (1 - x[stg.TEAM_COL].apply(int)) * (100 - x[stg.X_COL].apply(float)),
+                        stg.Y_PROJECTED_COL: lambda x: x[stg.TEAM_COL].apply(int) * x[stg.Y_COL].apply(float) + (1 - x[stg.TEAM_COL].apply(int)) * (100 - x[stg.Y_COL].apply(float))
+                        })
+
+
+def time_function(function, **kwargs):
+    start = time()
+    function(**kwargs)
+    return time() - start
+
+
+logging.info('Start of script {}'.format(basename(__file__)))
+
+files = sorted(os.listdir(stg.GAMES_DIR))
+string_data = pd.concat([StringGame(filename=file_).clean_game_data() for file_ in files],
+                        axis=0, ignore_index=True, sort=False)
+typed_data = pd.concat([Game(filename=file_).clean_game_data() for file_ in files],
+                       axis=0, ignore_index=True, sort=False)\
+               .astype({stg.GAME_ID_COL: 'category', stg.ZONE_COL: 'category'})
+
+string_memory, typed_memory = string_data.memory_usage(deep=True).sum(), typed_data.memory_usage(deep=True).sum()
+logging.info('Season events ({} rows) memory - strings {:.1f} Mo | typed {:.1f} Mo | reduction x{:.1f}'
+             .format(typed_data.shape[0], string_memory / 1e6, typed_memory / 1e6, string_memory / typed_memory))
+
+raw_times = pd.concat([Game(filename=file_).data[[stg.MINUTES_COL, stg.SECONDS_COL]] for file_ in files],
+                      axis=0, ignore_index=True)
+projection = NextEventInGame.__new__(NextEventInGame)
+benchmark = pd.DataFrame([
+    {'operation': 'coordinates projection',
+     'strings': time_function(project_coordinates_with_apply, df=string_data),
+     'typed': time_function(projection._project_coordinates_along_team1_axis, df=typed_data)},
+    {'operation': 'time conversion',
+     'strings': time_function(lambda df: 60 * df[stg.MINUTES_COL].apply(int) + df[stg.SECONDS_COL].apply(int), df=raw_times),
+     'typed': time_function(lambda df: 60 * df[stg.MINUTES_COL].astype(int) + df[stg.SECONDS_COL].astype(int), df=raw_times)},
+])
+
+for _, row in benchmark.iterrows():
+    logging.info('{} - strings {:.3f}s | typed {:.3f}s | speed-up x{:.1f}'
+                 .format(row['operation'], row['strings'], row['typed'], row['strings'] / row['typed']))
+
+logging.info('End of script {}'.format(basename(__file__)))
@@ -0,0 +1,80 @@
+from os.path import basename, join, splitext
+from lxml import etree
+from time import time
+
+import logging
+import os
+import pandas as pd
+
+from code_.infrastructure.game import Game
+
+import settings as stg
+
+if __name__ == '__main__':
+    stg.enable_logging(log_filename='{}.log'.format(splitext(basename(__file__))[0]),
+                       logging_level=logging.INFO)
+
+
+class LegacyGame(Game):
+    """Game with the former event gathering (one DataFrame concatenated by event)."""
+
+    def __init__(self, filename):
+        """Initialize class."""
+        self.filename = filename
+        self.data = self._gather_events()
+
+        game_info = etree.parse(join(stg.GAMES_DIR, self.filename)).xpath(stg.XML_PATH_TO_GAME_INFO)[0]
+        self.home_id, self.away_id = game_info.get('home_team_id'), game_info.get('away_team_id')
+
+    def _gather_events(self):
+        tree = etree.parse(join(stg.GAMES_DIR, self.filename))
+        df_events = pd.DataFrame()
+
+        for event in tree.xpath(stg.XML_PATH_TO_EVENTS):
+            df_event = pd.DataFrame(dict(event.attrib), index=[0])
+            qualifiers = event.findall('{}/[@{}="{}"]'.format(stg.XML_QUALIFIER_TAG,
+                                                               stg.QUALIFIER_COL,
+                                                               stg.QUALIFIER_MAP['ZONE']))
+            df_qualifiers = pd.DataFrame({
+                stg.QUALIFIER_COL: list(map(lambda x: x.get(stg.QUALIFIER_COL), qualifiers)),
+                stg.XML_QUALIFIER_VALUE_ATTRIBUTE: list(map(lambda x: x.get(stg.XML_QUALIFIER_VALUE_ATTRIBUTE), qualifiers)),
+            })
+            df_in_row = df_qualifiers.set_index(stg.QUALIFIER_COL)\
+                                     .transpose()\
+                                     .reset_index(drop=True)\
+                                     .fillna('value')
+            df_in_row.columns = ['{}_{}'.format(stg.QUALIFIER_COL, col)
+                                 for col in df_in_row.columns]
+
+            with_qualifiers = pd.merge(left=df_event, right=df_in_row,
+                                       left_index=True, right_index=True, how='left')
+            df_events = pd.concat([df_events, with_qualifiers],
+                                  axis=0, ignore_index=True, sort=False)
+
+        return df_events
+
+
+logging.info('Start of script {}'.format(basename(__file__)))
+
+benchmark = list()
+for file_ in sorted(os.listdir(stg.GAMES_DIR)):
+    start = time()
+    legacy_data = LegacyGame(filename=file_).clean_game_data()
+    legacy_time = time() - start
+
+    start = time()
+    streaming_data = Game(filename=file_).clean_game_data()
+    streaming_time = time() - start
+
+    pd.testing.assert_frame_equal(legacy_data, streaming_data)
+    benchmark.append({'file': file_, 'nb_events': streaming_data.shape[0],
+                      'legacy_time': legacy_time, 'streaming_time': streaming_time})
+    logging.info('{} - {} events - legacy {:.3f}s | streaming {:.3f}s'
+                 .format(file_, streaming_data.shape[0], legacy_time, streaming_time))
+
+df_benchmark = pd.DataFrame(benchmark)
+logging.info('Average parse time by match - legacy {:.3f}s | streaming {:.3f}s | speed-up x{:.1f}'
+             .format(df_benchmark['legacy_time'].mean(), df_benchmark['streaming_time'].mean(),
+                     df_benchmark['legacy_time'].sum() / df_benchmark['streaming_time'].sum()))
+
+logging.info('End of script {}'.format(basename(__file__)))
@@ -0,0 +1,100 @@
+from os.path import basename, splitext
+from time import time
+
+import logging
+import pandas as pd
+
+from code_.domain.games_info import SeasonFirstHalfAggregator, StatsGameAnalyzer
+
+import settings as stg
+
+if __name__ == '__main__':
+    stg.enable_logging(log_filename='{}.log'.format(splitext(basename(__file__))[0]),
+                       logging_level=logging.INFO)
+
+
+class LegacyStatsGameAnalyzer(StatsGameAnalyzer):
+    """StatsGameAnalyzer with the former stats computation, all queries and merges redone by window."""
+
+    def build_game_dataset_eligible_players(self, sliding_interval_min,
+                                            list_events_number,
+                                            list_events_with_success_rate):
+        df_game_stats = pd.DataFrame()
+
+        for period, starts in [(1, range(0, 31, sliding_interval_min)), (2, range(45, 76, sliding_interval_min))]:
+            for start in starts:
+                df = self._get_info_on_15_minutes(period=period, start_in_min=start,
+                                                  list_events_number=list_events_number,
+                                                  list_events_with_success_rate=list_events_with_success_rate)\
+                         .loc[lambda x: x[stg.PLAYER_COL].isin(self.eligible_players.tolist())]
+                df_game_stats = pd.concat([df_game_stats, df], axis=0,
+                                          ignore_index=True, sort=False)
+
+        df_game_stats.fillna({col: 0 for col in df_game_stats.columns if col.endswith('_nb')},
+                             inplace=True)
+
+        return df_game_stats
+
+    def _get_info_on_15_minutes(self, period, start_in_min, **kwargs):
+        df_15_min = self.game.query('{start}*60 <= {col} <= ({start}+15)*60'.format(start=start_in_min,
+                                                                                    col=stg.GAME_TIME_COL))\
+                             .query('{} == {}'.format(stg.PERIOD_COL, period))
+
+        df_players = df_15_min.filter(items=[stg.GAME_ID_COL, stg.PLAYER_COL, stg.TEAM_COL])\
+                              .drop_duplicates()\
+                              .assign(time_period='{}-{}'.format(start_in_min, start_in_min + 15))
+
+        df_player_stats = self._get_agg_stats(df_with_events=df_15_min, agg_column=stg.PLAYER_COL, **kwargs)
+        df_player_stats.columns = ['p_{}'.format(col) if col != stg.PLAYER_COL else col
+                                   for col in df_player_stats.columns]
+
+        df_team_stats = self._get_agg_stats(df_with_events=df_15_min, agg_column=stg.TEAM_COL, **kwargs)
+        df_team_stats.columns = ['t_{}'.format(col) if col != stg.TEAM_COL else col
+                                 for col in df_team_stats.columns]
+
+        df_player_info = self._build_dataset_from_bool_columns(df_with_events=df_15_min)
+        df_player_position = self._get_player_position(df_with_events=df_15_min)
+
+        df_all_stats = df_players.merge(right=df_player_info, on=stg.PLAYER_COL, how='left')\
+                                 .merge(right=df_player_position, on=stg.PLAYER_COL, how='left')\
+                                 .merge(right=df_player_stats, on=stg.PLAYER_COL, how='left')\
+                                 .merge(right=df_team_stats, on=stg.TEAM_COL, how='left')
+        return df_all_stats
+
+
+def sort_stats(df, columns):
+    return df[columns].astype(float)\
+                      .assign(time_period=df['time_period'])\
+                      .sort_values(by=['time_period', stg.PLAYER_COL])\
+                      .reset_index(drop=True)
+
+
+logging.info('Start of script {}'.format(basename(__file__)))
+
+benchmark = list()
+for file_ in SeasonFirstHalfAggregator(saved_filename=stg.FILENAME_STATS_AGGREGATED)._get_games_files():
+    stats_kwargs = {'sliding_interval_min': 5,
+                    'list_events_number': stg.EVENTS_COMPUTE_NUMBER,
+                    'list_events_with_success_rate': stg.EVENTS_COMPUTE_SUCCESS_RATE}
+
+    start = time()
+    legacy_stats = LegacyStatsGameAnalyzer(filename=file_).build_game_dataset_eligible_players(**stats_kwargs)
+    legacy_time = time() - start
+
+    start = time()
+    window_stats = StatsGameAnalyzer(filename=file_).build_game_dataset_eligible_players(**stats_kwargs)
+    window_time = time() - start
+
+    # Legacy stats only have columns of events happening in game
+    common_columns = [stg.PLAYER_COL] + [col for col in stg.PLAYER_FEATURES if col in legacy_stats.columns]
+    pd.testing.assert_frame_equal(sort_stats(df=legacy_stats, columns=common_columns),
+                                  sort_stats(df=window_stats, columns=common_columns))
+    benchmark.append({'file': file_, 'legacy_time': legacy_time, 'window_time': window_time})
+    logging.info('{} - legacy {:.3f}s | prefix sums {:.3f}s'.format(file_, legacy_time, window_time))
+
+df_benchmark = pd.DataFrame(benchmark)
+logging.info('Average stats time by match - legacy {:.3f}s | prefix sums {:.3f}s | speed-up x{:.1f}'
+             .format(df_benchmark['legacy_time'].mean(), df_benchmark['window_time'].mean(),
+                     df_benchmark['legacy_time'].sum() / df_benchmark['window_time'].sum()))
+
+logging.info('End of script {}'.format(basename(__file__)))
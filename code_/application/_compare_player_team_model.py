@@ -0,0 +1,102 @@
+from copy import copy
+from os.path import basename, getsize, join, splitext
+from sklearn.decomposition import FastICA
+from sklearn.ensemble import ExtraTreesClassifier
+from sklearn.externals.joblib import dump, load
+from sklearn.model_selection import train_test_split
+from sklearn.pipeline import make_pipeline, make_union
+from sklearn.preprocessing import FunctionTransformer
+from time import time
+
+import logging
+import pandas as pd
+
+from code_.domain.games_info import SeasonFirstHalfAggregator, get_club_ids
+from code_.domain.performance_analyzer import PerformanceAnalyzer
+from code_.domain.predictors import TeamConditionedClassifier
+from code_.infrastructure.event_store import EventStore
+
+import settings as stg
+
+if __name__ == '__main__':
+    stg.enable_logging(log_filename='{}.log'.format(splitext(basename(__file__))[0]),
+                       logging_level=logging.INFO)
+
+
+FLAT_MODEL_NAME = 'player_model_flat_comparison.h5'
+TEAM_MODEL_NAME = 'player_model_by_team_comparison.h5'
+TEAM_SUBMODEL_NAME = 'player_model_team{team}_comparison.h5'
+
+
+def time_function(function, **kwargs):
+    start = time()
+    output = function(**kwargs)
+    return time() - start, output
+
+
+def make_player_pipeline():
+    """Player pipeline of 0_main_train_all.py."""
+    return make_pipeline(
+        make_union(
+            FastICA(tol=0.85),
+            FunctionTransformer(copy)
+        ),
+        ExtraTreesClassifier(n_estimators=75, max_depth=18, bootstrap=False,
+                             criterion="gini", max_features=0.1,
+                             min_samples_leaf=1, min_samples_split=2)
+    )
+
+
+logging.info('Start of script {}'.format(basename(__file__)))
+
+logging.info('Load data ..')
+sfha = SeasonFirstHalfAggregator(saved_filename=stg.FILENAME_STATS_AGGREGATED,
+                                 event_store=EventStore() if stg.BOOL_USE_EVENT_STORE else None)
+df = sfha.build_players_stats_dataset(sliding_interval_min=5,
+                                      list_events_number=stg.EVENTS_COMPUTE_NUMBER,
+                                      list_events_with_success_rate=stg.EVENTS_COMPUTE_SUCCESS_RATE,
+                                      columns=stg.PLAYER_FEATURES + [stg.PLAYER_TARGET, stg.GAME_ID_COL])
+df[stg.CLUB_COL] = get_club_ids(game_ids=df[stg.GAME_ID_COL], team_ids=df[stg.TEAM_COL])
+train, test = train_test_split(df, test_size=0.3, random_state=42)
+
+X_train, y_train = train[stg.PLAYER_FEATURES + [stg.CLUB_COL]], train[stg.PLAYER_TARGET]
+X_test, y_test = test[stg.PLAYER_FEATURES + [stg.CLUB_COL]], test[stg.PLAYER_TARGET]
+X_test.fillna(X_train[stg.PLAYER_FEATURES].median(), inplace=True)
+X_train.fillna(X_train[stg.PLAYER_FEATURES].median(), inplace=True)
+logging.info('.. Done')
+
+logging.info('Flat model ..')
+flat_pipeline = make_player_pipeline().fit(X_train[stg.PLAYER_FEATURES], y_train)
+dump(flat_pipeline, join(stg.MODELS_DIR, FLAT_MODEL_NAME), compress=('lz4', 9))
+flat_load_time, flat_pipeline = time_function(load, filename=join(stg.MODELS_DIR, FLAT_MODEL_NAME))
+flat_accuracy = PerformanceAnalyzer(y_true=y_test, y_pred=flat_pipeline.predict(X_test[stg.PLAYER_FEATURES]))\
+    .compute_classification_accuracy()
+logging.info('.. Done')
+
+logging.info('Model by club ..')
+team_pipeline = TeamConditionedClassifier(estimator=make_player_pipeline()).fit(X_train, y_train)
+team_filenames = team_pipeline.save(index_filename=TEAM_MODEL_NAME, submodel_filename=TEAM_SUBMODEL_NAME,
+                                    compress=('lz4', 9))
+team_accuracy = PerformanceAnalyzer(y_true=y_test, y_pred=team_pipeline.predict(X_test))\
+    .compute_classification_accuracy()
+
+# Submission loads index, then sub-model of club of player to predict only
+submodels_load_times = pd.Series({filename: time_function(load, filename=join(stg.MODELS_DIR, filename))[0]
+                                  for filename in team_filenames[1:]})
+index_load_time, _ = time_function(load, filename=join(stg.MODELS_DIR, TEAM_MODEL_NAME))
+submodels_sizes = pd.Series({filename: getsize(join(stg.MODELS_DIR, filename)) for filename in team_filenames[1:]})
+nb_classes = pd.Series([len(estimator.classes_) for estimator in team_pipeline.estimators_.values()])
+logging.info('.. Done')
+
+logging.info('Flat model - {} classes | size {:.1f} Mo | load time {:.2f}s | accuracy {:.4f}'
+             .format(len(flat_pipeline.classes_), getsize(join(stg.MODELS_DIR, FLAT_MODEL_NAME)) / 1e6,
+                     flat_load_time, flat_accuracy))
+logging.info('Model by club - {} sub-models of {:.0f} classes on average (max {}) | size {:.1f} Mo in total, '
+             '{:.1f} Mo by sub-model on average | load time of index and one sub-model {:.2f}s on average, '
+             '{:.2f}s for all sub-models | accuracy {:.4f}'
+             .format(len(team_pipeline.estimators_), nb_classes.mean(), nb_classes.max(),
+                     (getsize(join(stg.MODELS_DIR, TEAM_MODEL_NAME)) + submodels_sizes.sum()) / 1e6,
+                     submodels_sizes.mean() / 1e6, index_load_time + submodels_load_times.mean(),
+                     index_load_time + submodels_load_times.sum(), team_accuracy))
+
+logging.info('End of script {}'.format(basename(__file__)))
@@ -0,0 +1,112 @@
+from os.path import basename, getsize, isfile, join, splitext
+from sklearn.externals.joblib import load
+from time import time
+
+import logging
+import os
+import pandas as pd
+
+from code_.domain.compiled_pipeline import CompiledPipeline, compile_pipeline, get_compiled_pipeline_path
+from code_.domain.games_info import SeasonFirstHalfAggregator
+from code_.infrastructure.event_store import EventStore
+from code_.infrastructure.submission_modules import copy_submission_modules
+
+import settings as stg
+
+if __name__ == '__main__':
+    stg.enable_logging(log_filename='{}.log'.format(splitext(basename(__file__))[0]),
+                       logging_level=logging.INFO)
+
+
+# Rows of training sets used to check that compiled pipelines predict as original ones
+VERIFICATION_NB_ROWS = 5000
+NB_SINGLE_ROW_PREDICTIONS = 100
+
+
+def time_function(function, **kwargs):
+    start = time()
+    output = function(**kwargs)
+    return time() - start, output
+
+
+def time_single_row_predictions(model, X):
+    start = time()
+    for row in range(NB_SINGLE_ROW_PREDICTIONS):
+        model.predict(X.iloc[[row % len(X)]])
+    return (time() - start) / NB_SINGLE_ROW_PREDICTIONS
+
+
+def get_projected_features(df, features, cat_proj_name):
+    X = df[features].copy()
+    for lag in stg.NEXT_EVENT_LAGS:
+        X = load(join(stg.MODELS_DIR, cat_proj_name.format(lag=lag))).transform(X)
+    return X
+
+
+logging.info('Start of script {}'.format(basename(__file__)))
+# Files written below are loaded in submission by copies of code_ modules
+copy_submission_modules()
+
+logging.info('Load verification data ..')
+event_store = EventStore() if stg.BOOL_USE_EVENT_STORE else None
+df_players = SeasonFirstHalfAggregator(saved_filename=stg.FILENAME_STATS_AGGREGATED, event_store=event_store)\
+    .build_players_stats_dataset(sliding_interval_min=5,
+                                 list_events_number=stg.EVENTS_COMPUTE_NUMBER,
+                                 list_events_with_success_rate=stg.EVENTS_COMPUTE_SUCCESS_RATE,
+                                 columns=stg.PLAYER_FEATURES)\
+    .sample(n=VERIFICATION_NB_ROWS, random_state=42)
+df_next_events = SeasonFirstHalfAggregator(saved_filename=stg.FILENAME_NEXT_EVENT, event_store=event_store)\
+    .build_next_event_dataset(columns_to_lag=stg.NEXT_EVENT_COLS_TO_LAG, lags_to_add=stg.NEXT_EVENT_LAGS)\
+    .sample(n=VERIFICATION_NB_ROWS, random_state=42)
+
+X_player = df_players[stg.PLAYER_FEATURES]\
+    .fillna(load(join(stg.SUBMISSION_DIR, stg.PLAYER_FEATURES_MEDIAN_FILENAME)))
+verification_data = {
+    stg.PLAYER_MODEL_NAME: X_player,
+    stg.PLAYER_MODEL_LIGHT_NAME: X_player,
+    stg.NEXT_TEAM_MODEL_NAME: get_projected_features(df=df_next_events, features=stg.NEXT_TEAM_FEATURES,
+                                                     cat_proj_name=stg.NEXT_TEAM_CAT_PROJ_NAME),
+    stg.X_PROJ_MODEL_NAME: get_projected_features(df=df_next_events, features=stg.X_PROJ_FEATURES,
+                                                  cat_proj_name=stg.X_PROJ_CAT_PROJ_NAME),
+    stg.Y_PROJ_MODEL_NAME: get_projected_features(df=df_next_events, features=stg.Y_PROJ_FEATURES,
+                                                  cat_proj_name=stg.Y_PROJ_CAT_PROJ_NAME)
+}
+logging.info('.. Done')
+
+benchmark = list()
+for model_name, X in verification_data.items():
+    logging.info('{} ..'.format(model_name))
+    joblib_path = join(stg.SUBMISSION_DIR, model_name)
+    compiled_path = get_compiled_pipeline_path(joblib_path)
+    joblib_time, pipeline = time_function(load, filename=joblib_path)
+
+    compile_time, compiled_pipeline = time_function(compile_pipeline, pipeline=pipeline, nb_features=X.shape[1])
+    try:
+        compiled_pipeline.verify(pipeline=pipeline, X=X)
+    except ValueError as error:
+        # Pipeline keeps being loaded from joblib file in submission
+        logging.warning('.. {} - compiled pipeline not saved: {}'.format(model_name, error))
+        if isfile(compiled_path):
+            os.remove(compiled_path)
+        continue
+    logging.info('.. Compiled in {:.1f}s, predictions equal on {} rows'.format(compile_time, len(X)))
+
+    compiled_pipeline.dump(file_path=compiled_path)
+    compiled_load_time, compiled_pipeline = time_function(CompiledPipeline.load, file_path=compiled_path)
+
+    for model_format, model, file_size, load_time in [
+            ('joblib pipeline', pipeline, getsize(joblib_path), joblib_time),
+            ('compiled pipeline', compiled_pipeline, getsize(compiled_path), compiled_load_time)]:
+        batch_time, _ = time_function(model.predict, X=X)
+        benchmark.append({'model': model_name, 'format': model_format, 'size': file_size, 'load_time': load_time,
+                          'single_row_time': time_single_row_predictions(model=model, X=X),
+                          'batch_time': batch_time})
+    logging.info('.. Done')
+
+for _, row in pd.DataFrame(benchmark).iterrows():
+    logging.info('{} - {} - size {:.1f} Mo | load time {:.3f}s | single row prediction {:.2f}ms | '
+                 '{} rows prediction {:.3f}s'.format(row['model'], row['format'], row['size'] / 1e6,
+                                                     row['load_time'], 1e3 * row['single_row_time'],
+                                                     VERIFICATION_NB_ROWS, row['batch_time']))
+
+logging.info('End of script {}'.format(basename(__file__)))
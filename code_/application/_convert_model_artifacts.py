@@ -0,0 +1,42 @@
+from os.path import basename, join, splitext
+from sklearn.externals.joblib import load
+
+import logging
+import pandas as pd
+
+from code_.domain.artifact_measurement import measure_artifact
+from code_.infrastructure.model_artifacts import dump_mapped_artifact, get_mapped_artifact_path
+from code_.infrastructure.submission_modules import copy_submission_modules
+
+import settings as stg
+
+if __name__ == '__main__':
+    stg.enable_logging(log_filename='{}.log'.format(splitext(basename(__file__))[0]),
+                       logging_level=logging.INFO)
+
+
+MODELS_TO_CONVERT = [stg.PLAYER_MODEL_NAME, stg.PLAYER_MODEL_LIGHT_NAME, stg.NEXT_TEAM_MODEL_NAME,
+                     stg.X_PROJ_MODEL_NAME, stg.Y_PROJ_MODEL_NAME]
+
+
+logging.info('Start of script {}'.format(basename(__file__)))
+# Files written below are loaded in submission by copies of code_ modules
+copy_submission_modules()
+
+benchmark = list()
+for model_name in MODELS_TO_CONVERT:
+    joblib_path = join(stg.SUBMISSION_DIR, model_name)
+    mapped_path = get_mapped_artifact_path(joblib_path)
+    dump_mapped_artifact(model=load(joblib_path), file_path=mapped_path)
+    logging.info('.. {} converted to {}'.format(model_name, basename(mapped_path)))
+
+    # Every file is loaded from disk in a new process, as submission does
+    for model_format, file_path in [('joblib', joblib_path), ('mapped', mapped_path)]:
+        benchmark.append(dict(measure_artifact(file_path=file_path, model_format=model_format),
+                              model=model_name, format=model_format))
+
+for _, row in pd.DataFrame(benchmark).iterrows():
+    logging.info('{} - {} - size {:.1f} Mo | load time {:.3f}s | peak RSS {:.0f} Mo'
+                 .format(row['model'], row['format'], row['size_mo'], row['load_time'], row['peak_rss_mo']))
+
+logging.info('End of script {}'.format(basename(__file__)))
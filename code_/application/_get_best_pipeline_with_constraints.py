@@ -1,18 +1,25 @@
-from os.path import basename, splitext, join, getsize
+from os.path import basename, splitext, join
 from sklearn.model_selection import train_test_split
 from copy import copy
+from functools import partial
 from sklearn.decomposition import FastICA
 from sklearn.ensemble import ExtraTreesClassifier
-from sklearn.externals.joblib import dump, load
+from sklearn.linear_model import LogisticRegression
 from sklearn.pipeline import make_pipeline, make_union
-from time import time
-from sklearn.preprocessing import FunctionTransformer
+from sklearn.preprocessing import FunctionTransformer, MinMaxScaler
+from sklearn.tree import DecisionTreeClassifier
+from tpot.builtins import StackingEstimator
+from xgboost import XGBRegressor
 
 import logging
-import pandas as pd
 
+from code_.domain.cached_pipeline import make_cached_pipeline
+from code_.domain.constrained_selector import ConstrainedModelSelector
+from code_.domain.data_processing import CategoricalProjectorOnTeamChange, CategoricalProjectorOnAvgDistance as CatProjAvg
 from code_.domain.games_info import SeasonFirstHalfAggregator
-from code_.domain.performance_analyzer import PerformanceAnalyzer
+from code_.domain.predictors import get_derived_forest_pipelines
+from code_.infrastructure.event_store import EventStore
+from code_.infrastructure.transformer_cache import TransformerCache
 
 import settings as stg
 
@@ -20,64 +27,166 @@ if __name__ == '__main__':
     stg.enable_logging(log_filename='{}.log'.format(splitext(basename(__file__))[0]),
                        logging_level=logging.INFO)
 
-logging.info('Load data ..')
-sfha = SeasonFirstHalfAggregator(saved_filename=stg.FILENAME_STATS_AGGREGATED)
-df = sfha.build_players_stats_dataset(sliding_interval_min=5,
-                                      list_events_number=stg.EVENTS_COMPUTE_NUMBER,
-                                      list_events_with_success_rate=stg.EVENTS_COMPUTE_SUCCESS_RATE)
-train, test = train_test_split(df, test_size=0.3, random_state=42)
+
+# Candidates fitted in other processes share transformers fitted on disk
+TRANSFORMER_CACHE = TransformerCache()
+
+
+def make_player_pipeline(n_estimators, max_depth, random_state=None):
+    """Player pipeline of 0_main_train_all.py, FastICA being fitted once for all candidates."""
+    return make_cached_pipeline(
+        make_union(
+            FastICA(tol=0.85, random_state=random_state),
+            FunctionTransformer(copy)
+        ),
+        ExtraTreesClassifier(n_estimators=n_estimators, max_depth=max_depth,
+                             bootstrap=False, criterion="gini", max_features=0.1,
+                             min_samples_leaf=1, min_samples_split=2, random_state=random_state),
+        cache=TRANSFORMER_CACHE
+    )
+
+
+def make_next_team_pipeline(n_estimators, max_depth=None, random_state=None):
+    """Next team pipeline of 0_main_train_all.py."""
+    return make_pipeline(
+        StackingEstimator(estimator=DecisionTreeClassifier(criterion="entropy", max_depth=4, min_samples_leaf=10, min_samples_split=5)),
+        StackingEstimator(estimator=LogisticRegression(C=1.0, dual=False, penalty="l2")),
+        StackingEstimator(estimator=DecisionTreeClassifier(criterion="entropy", max_depth=4, min_samples_leaf=17, min_samples_split=5)),
+        ExtraTreesClassifier(bootstrap=True, criterion="entropy", max_features=0.7500000000000001, min_samples_leaf=12, min_samples_split=12, n_estimators=n_estimators,
+                             max_depth=max_depth, random_state=random_state)
+    )
+
+
+def get_player_candidates():
+    """Player pipelines with different numbers of trees and depths."""
+    return {'ntree{}_depth{}'.format(nb, depth): make_player_pipeline(n_estimators=nb, max_depth=depth)
+            for nb in range(60, 151, 15) for depth in range(18, 25, 2)}
+
+
+def get_next_team_candidates():
+    """Next team pipelines with different numbers of trees."""
+    return {'ntree{}'.format(nb): make_next_team_pipeline(n_estimators=nb) for nb in range(50, 151, 25)}
+
+
+def get_sweep_candidates(make_forest_pipeline):
+    """Largest pipeline of sweep by seed, smaller and shallower pipelines being derived from it."""
+    return {'seed{}'.format(seed): make_forest_pipeline(n_estimators=max(stg.SELECTOR_SWEEP_NB_TREES),
+                                                        max_depth=max(stg.SELECTOR_SWEEP_MAX_DEPTHS),
+                                                        random_state=seed)
+            for seed in stg.SELECTOR_SWEEP_SEEDS}
+
+
+def get_coords_candidates(first_step):
+    """Coordinates pipelines of 0_main_train_all.py, with different numbers of trees and depths."""
+    return {'ntree{}_depth{}'.format(nb, depth): make_pipeline(
+        first_step(),
+        XGBRegressor(learning_rate=0.1, max_depth=depth, min_child_weight=18, n_estimators=nb, nthread=1, subsample=0.9000000000000001)
+    ) for nb in range(50, 151, 25) for depth in [6, 9]}
+
+
+def get_player_data(event_store):
+    df = SeasonFirstHalfAggregator(saved_filename=stg.FILENAME_STATS_AGGREGATED, event_store=event_store)\
+        .build_players_stats_dataset(sliding_interval_min=5,
+                                     list_events_number=stg.EVENTS_COMPUTE_NUMBER,
+                                     list_events_with_success_rate=stg.EVENTS_COMPUTE_SUCCESS_RATE,
+                                     columns=stg.PLAYER_FEATURES + [stg.PLAYER_TARGET])
+    train, test = train_test_split(df, test_size=0.3, random_state=42)
+    X_train, y_train = train[stg.PLAYER_FEATURES], train[stg.PLAYER_TARGET]
+    X_test, y_test = test[stg.PLAYER_FEATURES], test[stg.PLAYER_TARGET]
+    X_test.fillna(X_train.median(), inplace=True)
+    X_train.fillna(X_train.median(), inplace=True)
+    return X_train, y_train, X_test, y_test
+
+
+def get_next_event_data(event_store, features, target, get_cat_proj):
+    df = SeasonFirstHalfAggregator(saved_filename=stg.FILENAME_NEXT_EVENT, event_store=event_store)\
+        .build_next_event_dataset(columns_to_lag=stg.NEXT_EVENT_COLS_TO_LAG, lags_to_add=stg.NEXT_EVENT_LAGS)
+    train, test = train_test_split(df.dropna(), test_size=0.3, random_state=42)
+    X_train, y_train = train[features], train[target]
+    X_test, y_test = test[features], test[target]
+    for lag in stg.NEXT_EVENT_LAGS:
+        cat_proj = get_cat_proj(lag)
+        cat_proj.fit_transform(X_train, y_train)
+        cat_proj.transform(X_test)
+    return X_train, y_train, X_test, y_test
+
+
+PROBLEMS = {
+    'player': {'get_candidates': get_player_candidates, 'scoring': 'accuracy',
+               'make_forest_pipeline': make_player_pipeline, 'get_data': get_player_data},
+    'next_team': {'get_candidates': get_next_team_candidates, 'scoring': 'accuracy',
+                  'make_forest_pipeline': make_next_team_pipeline,
+                  'get_data': lambda event_store: get_next_event_data(
+                      event_store=event_store, features=stg.NEXT_TEAM_FEATURES, target=stg.NEXT_TEAM_TARGET,
+                      get_cat_proj=lambda lag: CategoricalProjectorOnTeamChange(
+                          cat_column_name='{}_lag{}'.format(stg.EVENT_TYPE_COL, lag),
+                          columns_to_build_change_var=[stg.NEXT_TEAM_TARGET,
+                                                       '{}_lag{}'.format(stg.NEXT_TEAM_TARGET, lag)]))},
+    'x_coords': {'get_candidates': lambda: get_coords_candidates(first_step=MinMaxScaler),
+                 'scoring': 'neg_mean_squared_error',
+                 'get_data': lambda event_store: get_next_event_data(
+                     event_store=event_store, features=stg.X_PROJ_FEATURES, target=stg.X_PROJ_TARGET,
+                     get_cat_proj=lambda lag: CatProjAvg(
+                         cat_column_name='{}_lag{}'.format(stg.EVENT_TYPE_COL, lag),
+                         columns_to_build_avg_distance=[stg.X_PROJ_TARGET,
+                                                        '{}_lag{}'.format(stg.X_PROJ_TARGET, lag)]))},
+    'y_coords': {'get_candidates': lambda: get_coords_candidates(
+                     first_step=lambda: make_union(FunctionTransformer(copy), FunctionTransformer(copy))),
+                 'scoring': 'neg_mean_squared_error',
+                 'get_data': lambda event_store: get_next_event_data(
+                     event_store=event_store, features=stg.Y_PROJ_FEATURES, target=stg.Y_PROJ_TARGET,
+                     get_cat_proj=lambda lag: CatProjAvg(
+                         cat_column_name='{}_lag{}'.format(stg.EVENT_TYPE_COL, lag),
+                         columns_to_build_avg_distance=[stg.Y_PROJ_TARGET,
+                                                        '{}_lag{}'.format(stg.Y_PROJ_TARGET, lag)]))}
+}
+
+
+logging.info('Start of script {}'.format(basename(__file__)))
+problem = PROBLEMS[stg.SELECTOR_PROBLEM]
+
+logging.info('Load data - {} ..'.format(stg.SELECTOR_PROBLEM))
+X_train, y_train, X_test, y_test = problem['get_data'](
+    event_store=EventStore() if stg.BOOL_USE_EVENT_STORE else None)
+logging.info('.. Done')
+
+log_path = join(stg.OUTPUTS_DIR, stg.SELECTOR_LOG_FILENAME.format(problem=stg.SELECTOR_PROBLEM))
+is_sweep = stg.BOOL_SELECTOR_FOREST_SWEEP and 'make_forest_pipeline' in problem
+if is_sweep:
+    logging.info('Sweep - fit {} forests once, derive {} trees x {} depths from each and measure costs ..'
+                 .format(len(stg.SELECTOR_SWEEP_SEEDS), len(stg.SELECTOR_SWEEP_NB_TREES),
+                         len(stg.SELECTOR_SWEEP_MAX_DEPTHS)))
+    selector = ConstrainedModelSelector(candidates=get_sweep_candidates(problem['make_forest_pipeline']),
+                                        log_path=log_path, formats=stg.SELECTOR_SWEEP_FORMATS,
+                                        scoring=problem['scoring'],
+                                        derive_function=partial(get_derived_forest_pipelines,
+                                                                nb_trees_list=stg.SELECTOR_SWEEP_NB_TREES,
+                                                                max_depths=stg.SELECTOR_SWEEP_MAX_DEPTHS),
+                                        nb_latency_rows=stg.SELECTOR_SWEEP_NB_LATENCY_ROWS)
+else:
+    candidates = problem['get_candidates']()
+    logging.info('Fit {} pipelines, save them in {} formats and measure costs ..'
+                 .format(len(candidates), len(stg.SELECTOR_FORMATS)))
+    selector = ConstrainedModelSelector(candidates=candidates, log_path=log_path, scoring=problem['scoring'])
+selector.fit(X_train=X_train, y_train=y_train, X_test=X_test, y_test=y_test)
 logging.info('.. Done')
 
-df_nb_trees_characteristics = pd.DataFrame(columns=['ntree', 'file_size_mo', 'load_time', 'accuracy_test_set', 'compression'])
-for nb in range(60, 151, 5):
-    for depth in range(18, 25, 1):
-        logging.info('Pipeline - ntree {}, depth {} ..'.format(nb, depth))
-
-        X_train, y_train = train[stg.PLAYER_FEATURES], train[stg.PLAYER_TARGET]
-        X_test, y_test = test[stg.PLAYER_FEATURES], test[stg.PLAYER_TARGET]
-
-        logging.debug('.. Impute missing values with median ..')
-        X_test.fillna(X_train.median(), inplace=True)
-        X_train.fillna(X_train.median(), inplace=True)
-        logging.debug('.. .. Done')
-
-        player_pipeline = make_pipeline(
-            make_union(
-                FastICA(tol=0.85),
-                FunctionTransformer(copy)
-            ),
-            ExtraTreesClassifier(n_estimators=nb, max_depth=depth,
-                                 bootstrap=False, criterion="gini", max_features=0.1,
-                                 min_samples_leaf=1, min_samples_split=2)
-        )
-
-        player_pipeline.fit(X_train, y_train)
-        logging.debug('.. Fit ok')
-
-        pred_pipeline = player_pipeline.predict(X_test)
-        pa_pipeline = PerformanceAnalyzer(y_true=y_test, y_pred=pred_pipeline)
-        acc_pipeline = pa_pipeline.compute_classification_accuracy()
-
-        for compression in range(9, 10):
-            dump(player_pipeline, join(stg.MODELS_DIR, 'tmp_player_pipeline.joblib'),
-                 compress=('lz4', compression))
-            logging.debug('.. Dump ok')
-
-            load_start = time()
-            _ = load(join(stg.MODELS_DIR, 'tmp_player_pipeline.joblib'))
-            load_time = time() - load_start
-
-            df_nb = pd.DataFrame({'ntree': nb, 'max_depth': depth,
-                                  'file_size_mo': getsize(join(stg.MODELS_DIR, 'tmp_player_pipeline.joblib')) / 1e6,
-                                  'load_time': load_time,
-                                  'accuracy_test_set': acc_pipeline,
-                                  'compression': compression},
-                                 index=[0])
-
-            df_nb_trees_characteristics = pd.concat(objs=[df_nb_trees_characteristics, df_nb],
-                                                    axis=0, ignore_index=True, sort=False)
-            df_nb_trees_characteristics.to_csv(join(stg.OUTPUTS_DIR, '2019-04-08_tests2_constraints_more_depth.csv'),
-                                               index=False)
-        logging.info('.. Done')
+if is_sweep:
+    logging.info('Derived pipelines, averaged on seeds:')
+    df_derived = selector.results_.assign(derived=selector.results_['candidate'].str.split('_', n=1).str[1])\
+        .groupby('derived')[['score', 'size_mo', 'load_time']].mean()
+    for derived, row in df_derived.iterrows():
+        logging.info('.. {} - score {:.4f} | size {:.1f} Mo | load time {:.2f}s'
+                     .format(derived, row['score'], row['size_mo'], row['load_time']))
+
+logging.info('Pareto front of score versus costs:')
+for _, row in selector.results_[selector.results_['is_pareto']].sort_values(by='score', ascending=False).iterrows():
+    logging.info('.. {} - {} - score {:.4f} | size {:.1f} Mo | load time {:.2f}s | p99 latency {:.1f}ms | '
+                 'peak RSS {:.0f} Mo{}'.format(row['candidate'], row['format'], row['score'], row['size_mo'],
+                                               row['load_time'], row['p99_latency_ms'], row['peak_rss_mo'],
+                                               '' if row['within_budget'] else ' | over budgets'))
+if selector.best_ is not None:
+    logging.info('Best pipeline within budgets: {} - {}, saved in {}'
+                 .format(selector.best_['candidate'], selector.best_['format'], selector.best_['file_path']))
 
 logging.info('End of script {}'.format(basename(__file__)))
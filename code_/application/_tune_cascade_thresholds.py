@@ -0,0 +1,192 @@
+from copy import copy
+from os.path import basename, join, splitext
+from sklearn.decomposition import FastICA
+from sklearn.ensemble import ExtraTreesClassifier
+from sklearn.externals.joblib import dump
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import train_test_split
+from sklearn.pipeline import make_pipeline, make_union
+from sklearn.preprocessing import FunctionTransformer, StandardScaler
+from sklearn.tree import DecisionTreeClassifier
+from time import time
+from tpot.builtins import StackingEstimator
+
+import logging
+import numpy as np
+import pandas as pd
+
+from code_.domain.data_processing import CategoricalProjectorOnTeamChange
+from code_.domain.games_info import SeasonFirstHalfAggregator
+from code_.domain.performance_analyzer import PerformanceAnalyzer
+from code_.domain.cascade_model import get_prediction_confidence
+from code_.domain.predictors import get_truncated_forest_pipeline
+from code_.infrastructure.event_store import EventStore
+
+import settings as stg
+
+if __name__ == '__main__':
+    stg.enable_logging(log_filename='{}.log'.format(splitext(basename(__file__))[0]),
+                       logging_level=logging.INFO)
+
+
+NB_THRESHOLDS = 50
+
+
+def time_single_row_predictions(model, X, method='predict'):
+    """Average time in seconds to predict a single row."""
+    start = time()
+    for row in range(stg.CASCADE_NB_LATENCY_ROWS):
+        getattr(model, method)(X.iloc[[row % len(X)]])
+    return (time() - start) / stg.CASCADE_NB_LATENCY_ROWS
+
+
+def make_player_pipeline(max_depth=18):
+    """Player pipeline of 0_main_train_all.py, max_depth 17 for light pipeline."""
+    return make_pipeline(
+        make_union(
+            FastICA(tol=0.85),
+            FunctionTransformer(copy)
+        ),
+        ExtraTreesClassifier(n_estimators=75, max_depth=max_depth, bootstrap=False,
+                             criterion="gini", max_features=0.1,
+                             min_samples_leaf=1, min_samples_split=2)
+    )
+
+
+def make_next_team_pipeline():
+    """Next team pipeline of 0_main_train_all.py."""
+    return make_pipeline(
+        StackingEstimator(estimator=DecisionTreeClassifier(criterion="entropy", max_depth=4, min_samples_leaf=10, min_samples_split=5)),
+        StackingEstimator(estimator=LogisticRegression(C=1.0, dual=False, penalty="l2")),
+        StackingEstimator(estimator=DecisionTreeClassifier(criterion="entropy", max_depth=4, min_samples_leaf=17, min_samples_split=5)),
+        ExtraTreesClassifier(bootstrap=True, criterion="entropy", max_features=0.7500000000000001, min_samples_leaf=12, min_samples_split=12, n_estimators=100)
+    )
+
+
+def make_linear_pipeline():
+    """Linear first stage, cheaper than any forest."""
+    return make_pipeline(StandardScaler(), LogisticRegression())
+
+
+def tune_cascade(model_name, full_pipeline, first_stages, X_test, y_test):
+    """Evaluate every first stage, confidence and threshold on hold-out set.
+
+    Accuracy is the one of cascade on X_test, latency is average latency of a single row:
+    latency of first stage, plus latency of full model for rows first stage is not confident on.
+
+    Returns
+    -------
+    best: pandas.Series
+        Most accurate cascade within CASCADE_TARGET_LATENCY_MS, fastest one if none is
+    df_results: pandas.DataFrame
+
+    """
+    full_pred = full_pipeline.predict(X_test)
+    full_latency = time_single_row_predictions(model=full_pipeline, X=X_test)
+    full_accuracy = PerformanceAnalyzer(y_true=y_test, y_pred=full_pred).compute_classification_accuracy()
+    logging.info('.. {} - full model: accuracy {:.4f} | latency {:.2f}ms'
+                 .format(model_name, full_accuracy, 1e3 * full_latency))
+
+    results = list()
+    for first_stage_name, first_stage in first_stages.items():
+        proba = first_stage.predict_proba(X_test)
+        first_stage_pred = np.asarray(first_stage.classes_).take(np.argmax(proba, axis=1), axis=0)
+        first_stage_latency = time_single_row_predictions(model=first_stage, X=X_test, method='predict_proba')
+
+        for confidence in stg.CASCADE_CONFIDENCES:
+            confidences = get_prediction_confidence(proba=proba, confidence=confidence)
+            for threshold in np.unique(np.percentile(confidences, np.linspace(0, 100, NB_THRESHOLDS + 1))):
+                is_confident = confidences >= threshold
+                accuracy = PerformanceAnalyzer(y_true=y_test,
+                                               y_pred=np.where(is_confident, first_stage_pred, full_pred))\
+                    .compute_classification_accuracy()
+                results.append({'first_stage': first_stage_name, 'confidence': confidence, 'threshold': threshold,
+                                'first_stage_ratio': is_confident.mean(), 'accuracy': accuracy,
+                                'accuracy_loss': full_accuracy - accuracy,
+                                'latency_ms': 1e3 * (first_stage_latency + (1 - is_confident.mean()) * full_latency)})
+
+    df_results = pd.DataFrame(results)
+    df_results.to_csv(join(stg.OUTPUTS_DIR, stg.CASCADE_TUNING_FILENAME.format(model=model_name)), index=False)
+
+    df_within_target = df_results[df_results['latency_ms'] <= stg.CASCADE_TARGET_LATENCY_MS[model_name]]
+    if df_within_target.empty:
+        logging.warning('.. {} - no cascade within {}ms, fastest one is kept'
+                        .format(model_name, stg.CASCADE_TARGET_LATENCY_MS[model_name]))
+        return df_results.sort_values(by='latency_ms').iloc[0], df_results
+    return df_within_target.sort_values(by=['accuracy', 'latency_ms'], ascending=[False, True]).iloc[0], df_results
+
+
+def save_first_stage(model_name, first_stage):
+    """Save first stage its threshold is tuned on in submission folder, and return its filename.
+
+    First stage is the one fitted on training set: confidences of another fit, e.g. on
+    whole dataset, would not be distributed as the ones threshold is tuned on.
+
+    """
+    first_stage_filename = stg.CASCADE_FIRST_STAGE_NAME.format(model=model_name)
+    dump(first_stage, join(stg.SUBMISSION_DIR, first_stage_filename), compress=('lz4', 3))
+    return first_stage_filename
+
+
+logging.info('Start of script {}'.format(basename(__file__)))
+event_store = EventStore() if stg.BOOL_USE_EVENT_STORE else None
+
+logging.info('Player model - hold-out split of 1_player_prediction.py ..')
+df_players = SeasonFirstHalfAggregator(saved_filename=stg.FILENAME_STATS_AGGREGATED, event_store=event_store)\
+    .build_players_stats_dataset(sliding_interval_min=5,
+                                 list_events_number=stg.EVENTS_COMPUTE_NUMBER,
+                                 list_events_with_success_rate=stg.EVENTS_COMPUTE_SUCCESS_RATE,
+                                 columns=stg.PLAYER_FEATURES + [stg.PLAYER_TARGET])
+train, test = train_test_split(df_players, test_size=0.3, random_state=42)
+X_train, y_train = train[stg.PLAYER_FEATURES], train[stg.PLAYER_TARGET]
+X_test, y_test = test[stg.PLAYER_FEATURES], test[stg.PLAYER_TARGET]
+X_test.fillna(X_train.median(), inplace=True)
+X_train.fillna(X_train.median(), inplace=True)
+
+player_pipeline = make_player_pipeline().fit(X_train, y_train)
+player_first_stages = {'trees_{}'.format(nb_trees): get_truncated_forest_pipeline(pipeline=player_pipeline,
+                                                                                  nb_trees=nb_trees)
+                       for nb_trees in stg.CASCADE_FIRST_STAGE_NB_TREES}
+player_first_stages['light'] = make_player_pipeline(max_depth=17).fit(X_train, y_train)
+player_best, _ = tune_cascade(model_name='player_model', full_pipeline=player_pipeline,
+                              first_stages=player_first_stages, X_test=X_test, y_test=y_test)
+logging.info('.. Done')
+
+logging.info('Next team model - hold-out split of 2_next_team_prediction.py ..')
+df_next_events = SeasonFirstHalfAggregator(saved_filename=stg.FILENAME_NEXT_EVENT, event_store=event_store)\
+    .build_next_event_dataset(columns_to_lag=stg.NEXT_EVENT_COLS_TO_LAG, lags_to_add=stg.NEXT_EVENT_LAGS)
+train, test = train_test_split(df_next_events.dropna(), test_size=0.3, random_state=42)
+X_train_team, y_train_team = train[stg.NEXT_TEAM_FEATURES], train[stg.NEXT_TEAM_TARGET]
+X_test_team, y_test_team = test[stg.NEXT_TEAM_FEATURES], test[stg.NEXT_TEAM_TARGET]
+for lag in stg.NEXT_EVENT_LAGS:
+    cat_proj = CategoricalProjectorOnTeamChange(cat_column_name='{}_lag{}'.format(stg.EVENT_TYPE_COL, lag),
+                                                columns_to_build_change_var=[stg.NEXT_TEAM_TARGET, '{}_lag{}'.format(stg.NEXT_TEAM_TARGET, lag)])
+    cat_proj.fit_transform(X_train_team, y_train_team)
+    cat_proj.transform(X_test_team)
+
+next_team_pipeline = make_next_team_pipeline().fit(X_train_team, y_train_team)
+next_team_first_stages = {'trees_{}'.format(nb_trees): get_truncated_forest_pipeline(pipeline=next_team_pipeline,
+                                                                                     nb_trees=nb_trees)
+                          for nb_trees in stg.CASCADE_FIRST_STAGE_NB_TREES}
+next_team_first_stages['linear'] = make_linear_pipeline().fit(X_train_team, y_train_team)
+next_team_best, _ = tune_cascade(model_name='next_team_model', full_pipeline=next_team_pipeline,
+                                 first_stages=next_team_first_stages, X_test=X_test_team, y_test=y_test_team)
+logging.info('.. Done')
+
+logging.info('Save cascades for submission ..')
+cascade_config = dict()
+for model_name, best, first_stages in [('player_model', player_best, player_first_stages),
+                                       ('next_team_model', next_team_best, next_team_first_stages)]:
+    logging.info('.. {} - first stage {} answering if {} >= {:.4f}: {:.1%} of rows | accuracy {:.4f} '
+                 '(loss {:.4f}) | latency {:.2f}ms'.format(model_name, best['first_stage'], best['confidence'],
+                                                           best['threshold'], best['first_stage_ratio'],
+                                                           best['accuracy'], best['accuracy_loss'],
+                                                           best['latency_ms']))
+    cascade_config[model_name] = {'first_stage': save_first_stage(model_name=model_name,
+                                                                  first_stage=first_stages[best['first_stage']]),
+                                  'threshold': float(best['threshold']),
+                                  'confidence': best['confidence']}
+dump(cascade_config, join(stg.SUBMISSION_DIR, stg.CASCADE_CONFIG_FILENAME))
+logging.info('.. Done')
+
+logging.info('End of script {}'.format(basename(__file__)))
@@ -0,0 +1,117 @@
+from os.path import getsize, join
+from sklearn.externals.joblib import dump, load
+from time import sleep, time
+
+import gc
+import json
+import numpy as np
+import os
+import psutil
+import subprocess
+import sys
+import tempfile
+import threading
+
+from code_.domain.compiled_pipeline import CompiledPipeline
+from code_.infrastructure.model_artifacts import load_mapped_artifact
+
+import settings as stg
+
+
+RSS_SAMPLING_PERIOD = 0.001
+
+LOAD_FUNCTIONS = {'joblib': load,
+                  'mapped': load_mapped_artifact,
+                  'compiled': lambda file_path: CompiledPipeline.load(file_path=file_path)}
+
+
+def measure_artifact(file_path, model_format, X=None, nb_latency_rows=0):
+    """Measure costs of loading a model artifact and predicting with it, in a new process.
+
+    Every artifact is measured in its own process, as submission would load it: memory
+    of the measuring process does not count, nor artifacts loaded before. Pages of file
+    are dropped from OS cache first, so that every format is loaded from disk.
+
+    Parameters
+    ----------
+    file_path: string
+    model_format: string
+        Format of file, see LOAD_FUNCTIONS, e.g. 'joblib' or 'joblib_lz4_9'
+    X: pandas.DataFrame, default None
+        Rows single row latencies are measured on, no latency measured if None
+    nb_latency_rows: integer, default 0
+        Number of single row predictions latency percentile is computed on
+
+    Returns
+    -------
+    costs: dict
+        - size_mo: size of file
+        - load_time: time to load it, in seconds
+        - p99_latency_ms: 99th percentile of time to predict a single row, NaN without X
+        - peak_rss_mo: peak increase of resident memory while loading and predicting
+
+    """
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        rows_path = ''
+        if X is not None and nb_latency_rows:
+            rows_path = join(temporary_dir, 'rows.joblib')
+            dump(X.iloc[:nb_latency_rows], rows_path)
+
+        output = subprocess.check_output([sys.executable, '-m', 'code_.domain.artifact_measurement',
+                                          file_path, model_format, rows_path, str(nb_latency_rows)],
+                                         cwd=stg.REPO_DIR)
+    return json.loads(output.decode('utf-8').strip().split('\n')[-1])
+
+
+def _measure_in_current_process(file_path, model_format, X, nb_latency_rows):
+    _drop_from_os_cache(file_path=file_path)
+    process = psutil.Process()
+    gc.collect()
+    initial_rss = process.memory_info().rss
+    peak_rss = [initial_rss]
+    is_sampling = threading.Event()
+    is_sampling.set()
+
+    def sample_rss():
+        while is_sampling.is_set():
+            peak_rss[0] = max(peak_rss[0], process.memory_info().rss)
+            sleep(RSS_SAMPLING_PERIOD)
+
+    sampler = threading.Thread(target=sample_rss)
+    sampler.start()
+    start = time()
+    model = LOAD_FUNCTIONS[model_format.split('_')[0]](file_path)
+    load_time = time() - start
+
+    latencies = list()
+    for row in range(nb_latency_rows if X is not None else 0):
+        start = time()
+        model.predict(X.iloc[[row % len(X)]])
+        latencies.append(time() - start)
+    is_sampling.clear()
+    sampler.join()
+    peak_rss[0] = max(peak_rss[0], process.memory_info().rss)
+
+    return {'size_mo': getsize(file_path) / 1e6, 'load_time': load_time,
+            'p99_latency_ms': 1e3 * np.percentile(latencies, 99) if latencies else np.nan,
+            'peak_rss_mo': (peak_rss[0] - initial_rss) / 1e6}
+
+
+def _drop_from_os_cache(file_path):
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    file_descriptor = os.open(file_path, os.O_RDONLY)
+    try:
+        # Only written pages can be dropped
+        os.fsync(file_descriptor)
+        os.posix_fadvise(file_descriptor, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(file_descriptor)
+
+
+if __name__ == '__main__':
+    file_path, model_format, rows_path, nb_latency_rows = sys.argv[1:]
+    costs = _measure_in_current_process(file_path=file_path, model_format=model_format,
+                                        X=load(rows_path) if rows_path else None,
+                                        nb_latency_rows=int(nb_latency_rows))
+    print(json.dumps(costs))
@@ -0,0 +1,82 @@
+from sklearn.pipeline import Pipeline, make_pipeline
+
+from code_.infrastructure.transformer_cache import TransformerCache
+
+
+class CachedPipeline(Pipeline):
+    """Pipeline fitting its transformers through a TransformerCache, only final estimator being always fitted.
+
+    Fitting pipelines sharing their first steps on the same data, e.g. forests of different
+    sizes after FastICA, or RandomizedSearchCV on final estimator parameters, fits these
+    steps once. Clones of a CachedPipeline share its cache.
+
+    Submission cannot load this class: save pipeline returned by get_pipeline() instead.
+
+    Attributes
+    ----------
+    steps: list
+        (name, transformer) tuples, as in sklearn Pipeline
+    cache: TransformerCache
+        New cache with default settings if None
+
+    """
+
+    def __init__(self, steps, cache=None):
+        """Initialize class."""
+        self.cache = cache
+        super(CachedPipeline, self).__init__(steps=steps)
+
+    def fit(self, X, y=None, **fit_params):
+        """Fit transformers through cache, then final estimator on transformed data."""
+        Xt = self.fit_transformers(X, y)
+        if self._final_estimator not in (None, 'passthrough'):
+            final_name = self.steps[-1][0]
+            final_fit_params = {key.split('__', 1)[1]: value for key, value in fit_params.items()
+                                if key.startswith('{}__'.format(final_name))}
+            self._final_estimator.fit(Xt, y, **final_fit_params)
+        return self
+
+    def fit_transformers(self, X, y=None):
+        """Fit transformers through cache, without final estimator.
+
+        Fitting a pipeline once before fitting its clones in other processes puts its
+        transformers in cache, instead of every process fitting them at the same time.
+
+        Returns
+        -------
+        Xt: numpy.ndarray
+            X transformed by all steps but final estimator
+
+        """
+        cache = TransformerCache() if self.cache is None else self.cache
+        Xt = X
+        for step, (name, transformer) in enumerate(self.steps[:-1]):
+            if transformer is None or transformer == 'passthrough':
+                continue
+            fitted_transformer, Xt = cache.fit_transform(transformer=transformer, X=Xt, y=y)
+            self.steps[step] = (name, fitted_transformer)
+        return Xt
+
+    def fit_transform(self, X, y=None, **fit_params):
+        """Fit pipeline, then transform X with it."""
+        return self.fit(X, y, **fit_params).transform(X)
+
+    def get_pipeline(self):
+        """Get sklearn Pipeline with the same fitted steps, to be saved for submission."""
+        return Pipeline(steps=list(self.steps))
+
+
+def make_cached_pipeline(*steps, **kwargs):
+    """Construct a CachedPipeline from steps, named as by sklearn make_pipeline.
+
+    Parameters
+    ----------
+    steps: list of estimators
+    cache: TransformerCache, default None
+
+    Returns
+    -------
+    pipeline: CachedPipeline
+
+    """
+    return CachedPipeline(steps=make_pipeline(*steps).steps, cache=kwargs.pop('cache', None))
@@ -0,0 +1,95 @@
+import numpy as np
+
+
+class CascadeModel():
+    """Classifier answering with a cheap first stage when it is confident, with full model otherwise.
+
+    First stage is e.g. first trees of full forest, or light model. Its confidence on
+    every row is compared with a threshold tuned on a hold-out set (see
+    code_/application/_tune_cascade_thresholds.py): confident rows are answered by first
+    stage, other rows only are predicted by full model.
+
+    Attributes
+    ----------
+    first_stage: fitted classifier
+        Has predict_proba() and classes_
+    second_stage: fitted classifier
+    threshold: float
+        Minimal confidence for first stage to answer
+    confidence: string, ['probability', 'margin']
+        Probability of predicted class, or margin between it and second most probable class
+    nb_predictions: integer
+        Number of rows predicted so far
+    nb_first_stage_predictions: integer
+        Number of rows answered by first stage so far
+
+    """
+
+    def __init__(self, first_stage, second_stage, threshold, confidence='probability'):
+        """Initialize class.
+
+        Parameters
+        ----------
+        first_stage: fitted classifier
+        second_stage: fitted classifier
+        threshold: float
+        confidence: string, ['probability', 'margin'], default 'probability'
+
+        """
+        self.first_stage, self.second_stage = first_stage, second_stage
+        self.threshold, self.confidence = threshold, confidence
+        self.nb_predictions, self.nb_first_stage_predictions = 0, 0
+
+    @property
+    def classes_(self):
+        """Classes of full model."""
+        return self.second_stage.classes_
+
+    def predict(self, X):
+        """Predict with first stage, and with full model where first stage is not confident.
+
+        Parameters
+        ----------
+        X: pandas.DataFrame
+
+        Returns
+        -------
+        y_pred: numpy.ndarray
+
+        """
+        proba = self.first_stage.predict_proba(X)
+        y_pred = np.asarray(self.first_stage.classes_).take(np.argmax(proba, axis=1), axis=0)
+
+        uncertain_rows = np.flatnonzero(get_prediction_confidence(proba=proba, confidence=self.confidence)
+                                        < self.threshold)
+        if len(uncertain_rows):
+            y_pred = y_pred.astype(np.result_type(y_pred, self.classes_))
+            y_pred[uncertain_rows] = self.second_stage.predict(X.iloc[uncertain_rows])
+
+        self.nb_predictions += len(y_pred)
+        self.nb_first_stage_predictions += len(y_pred) - len(uncertain_rows)
+        return y_pred
+
+
+def get_prediction_confidence(proba, confidence='probability'):
+    """Confidence of classifier in its predictions.
+
+    Parameters
+    ----------
+    proba: numpy.ndarray
+        Output of predict_proba()
+    confidence: string, ['probability', 'margin'], default 'probability'
+        Probability of predicted class, or margin between it and second most probable class
+
+    Returns
+    -------
+    confidences: numpy.ndarray
+
+    """
+    if proba.shape[1] < 2:
+        return np.ones(len(proba))
+
+    two_highest_proba = np.partition(proba, kth=-2, axis=1)[:, -2:]
+    if confidence == 'margin':
+        return two_highest_proba[:, 1] - two_highest_proba[:, 0]
+    return two_highest_proba[:, 1]
@@ -0,0 +1,540 @@
+from os.path import splitext
+from scipy.special import expit
+from sklearn.base import is_classifier
+from sklearn.decomposition import FastICA
+from sklearn.ensemble import ExtraTreesClassifier, ExtraTreesRegressor, RandomForestClassifier, RandomForestRegressor
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import FeatureUnion, Pipeline
+from sklearn.preprocessing import MinMaxScaler, StandardScaler
+from sklearn.tree import DecisionTreeClassifier, DecisionTreeRegressor
+
+import json
+import numpy as np
+
+from code_.domain.pipeline_inspection import get_xgboost_feature_index, is_columns_selection, is_copy, \
+    read_xgboost_nodes
+from code_.infrastructure.model_artifacts import dump_mapped_artifact, load_mapped_artifact
+
+import settings as stg
+
+
+class CompiledPipeline():
+    """Fitted pipeline compiled to flat numpy arrays, predicting without sklearn nor xgboost.
+
+    Compilation turns a pipeline as saved by 0_main_train_all.py into a specification
+    made of dicts, numpy arrays and scalars only:
+    - FastICA, MinMaxScaler and StandardScaler are affine transforms
+    - FunctionTransformer(copy), np.take of columns and unions of them are columns selections
+    - StackingEstimator(estimator) adds predictions of estimator before features, as tpot does
+    - Trees of ExtraTrees, RandomForest, DecisionTree and XGBRegressor are concatenated in
+      node feature, threshold, children and leaf value arrays, all trees being walked at
+      once level by level, for all rows
+    - LogisticRegression is a matrix product followed by its link function
+    Columns selections and per feature scalings directly before trees are folded into
+    splits: features are renumbered and thresholds moved to the largest input value
+    taking the same branch, so that trees read pipeline input as is.
+
+    Every operation is computed in the same order and precision as sklearn and xgboost
+    do, so that predictions are equal to those of original pipeline, see verify().
+
+    Attributes
+    ----------
+    spec: dict
+        Steps applied to features and final estimator
+
+    """
+
+    def __init__(self, spec):
+        """Initialize class.
+
+        Parameters
+        ----------
+        spec: dict
+            Output of compile_pipeline() or of CompiledPipeline.load()
+
+        """
+        self.spec = spec
+
+    @property
+    def classes_(self):
+        """Classes of final estimator, for classifiers only."""
+        return self.spec['estimator']['classes']
+
+    def predict(self, X):
+        """Predict as original pipeline.
+
+        Parameters
+        ----------
+        X: pandas.DataFrame or numpy.ndarray
+
+        Returns
+        -------
+        y_pred: numpy.ndarray
+
+        """
+        return _predict(estimator=self.spec['estimator'], X=self.transform(X))
+
+    def predict_proba(self, X):
+        """Predict probabilities of classes as original pipeline, for classifiers only.
+
+        Parameters
+        ----------
+        X: pandas.DataFrame or numpy.ndarray
+
+        Returns
+        -------
+        proba: numpy.ndarray
+
+        """
+        return _predict_proba(estimator=self.spec['estimator'], X=self.transform(X))
+
+    def transform(self, X):
+        """Apply all steps but final estimator.
+
+        Parameters
+        ----------
+        X: pandas.DataFrame or numpy.ndarray
+
+        Returns
+        -------
+        X_transformed: numpy.ndarray
+
+        """
+        return _transform(steps=self.spec['steps'], X=np.asarray(X, dtype=np.float64))
+
+    def verify(self, pipeline, X):
+        """Check that predictions are equal to those of original pipeline.
+
+        Parameters
+        ----------
+        pipeline: sklearn.pipeline.Pipeline
+            Pipeline compiled
+        X: pandas.DataFrame
+            Rows to predict, e.g. a sample of training set
+
+        Returns
+        -------
+        self: CompiledPipeline
+
+        Raises
+        ------
+        ValueError
+            If any prediction, or probability for classifiers, differs
+
+        """
+        outputs = [('predictions', lambda model: model.predict(X))]
+        if self.spec['estimator'].get('task') == 'classifier' or self.spec['estimator']['kind'] == 'logistic':
+            outputs.append(('probabilities', lambda model: model.predict_proba(X)))
+
+        for output_name, predict in outputs:
+            expected, compiled = np.asarray(predict(pipeline)), predict(self)
+            if expected.shape != compiled.shape:
+                raise ValueError('Compiled {} have shape {} instead of {}'
+                                 .format(output_name, compiled.shape, expected.shape))
+            nb_different_rows = int(np.sum((expected != compiled).reshape(len(expected), -1).any(axis=1)))
+            if nb_different_rows:
+                raise ValueError('Compiled {} differ on {}/{} rows'.format(output_name, nb_different_rows, len(X)))
+        return self
+
+    def dump(self, file_path):
+        """Save specification as a memory mapped artifact (see model_artifacts).
+
+        Parameters
+        ----------
+        file_path: string
+
+        Returns
+        -------
+        self: CompiledPipeline
+
+        """
+        dump_mapped_artifact(model=self.spec, file_path=file_path)
+        return self
+
+    @classmethod
+    def load(cls, file_path):
+        """Load specification saved by dump(), its arrays being read from disk when used.
+
+        Parameters
+        ----------
+        file_path: string
+
+        Returns
+        -------
+        compiled_pipeline: CompiledPipeline
+
+        """
+        return cls(spec=load_mapped_artifact(file_path=file_path))
+
+
+def compile_pipeline(pipeline, nb_features):
+    """Compile a fitted pipeline.
+
+    Parameters
+    ----------
+    pipeline: sklearn.pipeline.Pipeline or estimator
+        Fitted pipeline, its final estimator among ExtraTrees, RandomForest, DecisionTree,
+        LogisticRegression and XGBRegressor
+    nb_features: integer
+        Number of input columns of pipeline
+
+    Returns
+    -------
+    compiled_pipeline: CompiledPipeline
+
+    Raises
+    ------
+    NotImplementedError
+        If a step can not be compiled
+
+    """
+    transformers, estimator = (pipeline.steps[:-1], pipeline.steps[-1][1]) if isinstance(pipeline, Pipeline) \
+        else ([], pipeline)
+
+    steps = list()
+    for _, transformer in transformers:
+        transformer_steps, nb_features = _compile_transformer(transformer=transformer, nb_features=nb_features)
+        steps.extend(transformer_steps)
+
+    compiled_estimator = _compile_estimator(estimator=estimator)
+    if compiled_estimator['kind'] == 'trees':
+        compiled_estimator = _fold_steps_into_trees(steps=steps, trees=compiled_estimator)
+
+    return CompiledPipeline(spec={'steps': steps, 'estimator': compiled_estimator})
+
+
+def get_compiled_pipeline_path(file_path):
+    """Path of compiled version of a joblib model file."""
+    return '{}{}'.format(splitext(file_path)[0], stg.COMPILED_PIPELINE_EXTENSION)
+
+
+# Compilation
+def _compile_transformer(transformer, nb_features):
+    """Compile a transformer into steps, returning them with their number of output columns."""
+    if transformer is None or transformer == 'passthrough' or is_copy(transformer):
+        return [], nb_features
+
+    if is_columns_selection(transformer):
+        index = np.asarray(transformer.kw_args['indices'], dtype=np.int64)
+        return [{'kind': 'columns', 'index': index}], len(index)
+
+    if isinstance(transformer, Pipeline):
+        steps = list()
+        for _, sub_transformer in transformer.steps:
+            sub_steps, nb_features = _compile_transformer(transformer=sub_transformer, nb_features=nb_features)
+            steps.extend(sub_steps)
+        return steps, nb_features
+
+    if isinstance(transformer, FeatureUnion):
+        if transformer.transformer_weights:
+            raise NotImplementedError('FeatureUnion with transformer_weights can not be compiled')
+        branches = [_compile_transformer(transformer=sub_transformer, nb_features=nb_features)
+                    for _, sub_transformer in transformer.transformer_list
+                    if sub_transformer not in (None, 'drop')]
+        nb_output_features = sum(nb_branch_features for _, nb_branch_features in branches)
+
+        # Union of columns selections, e.g. of copies, is a single selection
+        if all(len(branch_steps) <= 1 and all(step['kind'] == 'columns' for step in branch_steps)
+               for branch_steps, _ in branches):
+            index = np.concatenate([branch_steps[0]['index'] if branch_steps else np.arange(nb_features)
+                                    for branch_steps, _ in branches])
+            return [{'kind': 'columns', 'index': index}], nb_output_features
+
+        return [{'kind': 'union', 'branches': [branch_steps for branch_steps, _ in branches]}], nb_output_features
+
+    if isinstance(transformer, FastICA):
+        whiten = getattr(transformer, '_whiten', transformer.whiten)
+        return [_affine_step(center=transformer.mean_ if whiten else None,
+                             components=transformer.components_)], transformer.components_.shape[0]
+
+    if isinstance(transformer, MinMaxScaler):
+        return [_affine_step(scale=transformer.scale_, offset=transformer.min_)], nb_features
+
+    if isinstance(transformer, StandardScaler):
+        return [_affine_step(center=transformer.mean_ if transformer.with_mean else None,
+                             scale=transformer.scale_ if transformer.with_std else None,
+                             divide=True)], nb_features
+
+    if type(transformer).__name__ == 'StackingEstimator':
+        estimator = _compile_estimator(estimator=transformer.estimator)
+        nb_stacked_features = 1 + (len(estimator['classes']) if _has_probabilities(estimator) else 0)
+        return [{'kind': 'stack', 'estimator': estimator}], nb_stacked_features + nb_features
+
+    raise NotImplementedError('{} can not be compiled'.format(type(transformer).__name__))
+
+
+def _affine_step(center=None, components=None, scale=None, offset=None, divide=False):
+    """Step computing ((X - center) . components^T) * scale + offset, or / scale if divide."""
+    return {'kind': 'affine', 'center': center, 'components': components,
+            'scale': scale, 'divide': divide, 'offset': offset}
+
+
+def _compile_estimator(estimator):
+    if isinstance(estimator, LogisticRegression):
+        multi_class = getattr(estimator, 'multi_class', 'auto')
+        is_multinomial = multi_class == 'multinomial' \
+            or (multi_class == 'auto' and len(estimator.classes_) > 2 and estimator.solver != 'liblinear')
+        return {'kind': 'logistic', 'coef': estimator.coef_, 'intercept': estimator.intercept_,
+                'classes': estimator.classes_, 'multinomial': is_multinomial}
+
+    if isinstance(estimator, (RandomForestClassifier, ExtraTreesClassifier, RandomForestRegressor,
+                              ExtraTreesRegressor)):
+        return _compile_sklearn_trees(trees=[tree.tree_ for tree in estimator.estimators_],
+                                      classes=estimator.classes_ if is_classifier(estimator) else None)
+
+    if isinstance(estimator, (DecisionTreeClassifier, DecisionTreeRegressor)):
+        return _compile_sklearn_trees(trees=[estimator.tree_],
+                                      classes=estimator.classes_ if is_classifier(estimator) else None)
+
+    if hasattr(estimator, 'get_booster') and not is_classifier(estimator):
+        return _compile_xgboost_trees(regressor=estimator)
+
+    raise NotImplementedError('{} can not be compiled'.format(type(estimator).__name__))
+
+
+def _has_probabilities(estimator):
+    return estimator['kind'] == 'logistic' or estimator.get('task') == 'classifier'
+
+
+def _compile_sklearn_trees(trees, classes=None):
+    """Concatenate sklearn trees, leaves pointing to themselves."""
+    if any(tree.n_outputs != 1 for tree in trees):
+        raise NotImplementedError('Trees with several outputs can not be compiled')
+
+    arrays = {'feature': [], 'threshold': [], 'left': [], 'right': [], 'leaf_index': [], 'values': []}
+    roots, node_offset, leaf_offset = list(), 0, 0
+    for tree in trees:
+        nodes = np.arange(tree.node_count)
+        is_leaf = tree.children_left == -1
+        leaf_values = tree.value[is_leaf, 0, :]
+        if classes is not None:
+            leaf_values = leaf_values[:, :len(classes)]
+            # Normalized as DecisionTreeClassifier.predict_proba does
+            normalizer = leaf_values.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            leaf_values = leaf_values / normalizer
+        else:
+            leaf_values = leaf_values[:, 0]
+
+        roots.append(node_offset)
+        arrays['feature'].append(np.where(is_leaf, 0, tree.feature))
+        arrays['threshold'].append(np.where(is_leaf, np.inf, tree.threshold))
+        arrays['left'].append(node_offset + np.where(is_leaf, nodes, tree.children_left))
+        arrays['right'].append(node_offset + np.where(is_leaf, nodes, tree.children_right))
+        arrays['leaf_index'].append(np.where(is_leaf, leaf_offset + np.cumsum(is_leaf) - 1, -1))
+        arrays['values'].append(leaf_values)
+        node_offset += tree.node_count
+        leaf_offset += len(leaf_values)
+
+    compiled_trees = _concatenate_trees(arrays=arrays, roots=roots, depth=max(tree.max_depth for tree in trees))
+    # sklearn trees compare features cast to float32 with float64 thresholds: x <= threshold
+    compiled_trees.update({'task': 'classifier' if classes is not None else 'regressor', 'classes': classes,
+                           'input_dtype': np.float32, 'strict': False, 'default_left': None})
+    return compiled_trees
+
+
+def _compile_xgboost_trees(regressor):
+    """Concatenate trees of an XGBRegressor read from their JSON dump."""
+    if regressor.objective not in ('reg:linear', 'reg:squarederror'):
+        raise NotImplementedError('XGBRegressor with objective {} can not be compiled'.format(regressor.objective))
+
+    booster = regressor.get_booster()
+    tree_dumps = booster.get_dump(dump_format='json')
+    ntree_limit = getattr(regressor, 'best_ntree_limit', 0)
+    if ntree_limit:
+        tree_dumps = tree_dumps[:ntree_limit]
+
+    base_score = regressor.base_score
+    if base_score is None:
+        base_score = json.loads(booster.save_config())['learner']['learner_model_param']['base_score']
+    feature_names = booster.feature_names
+
+    arrays = {'feature': [], 'threshold': [], 'left': [], 'right': [], 'default_left': [],
+              'leaf_index': [], 'values': []}
+    roots, node_offset, leaf_offset, depth = list(), 0, 0, 0
+    for tree_dump in tree_dumps:
+        nodes = read_xgboost_nodes(tree=json.loads(tree_dump))
+        position = {node['nodeid']: index for index, node in enumerate(nodes)}
+        is_leaf = np.array(['leaf' in node for node in nodes])
+        node_positions = np.arange(len(nodes))
+
+        roots.append(node_offset + position[0])
+        arrays['feature'].append(np.array([0 if 'leaf' in node
+                                           else get_xgboost_feature_index(node['split'], feature_names)
+                                           for node in nodes]))
+        arrays['threshold'].append(np.array([np.inf if 'leaf' in node else node['split_condition']
+                                             for node in nodes], dtype=np.float32))
+        arrays['left'].append(node_offset + np.array([position[node['yes']] if 'yes' in node else index
+                                                      for index, node in enumerate(nodes)]))
+        arrays['right'].append(node_offset + np.array([position[node['no']] if 'no' in node else index
+                                                       for index, node in enumerate(nodes)]))
+        arrays['default_left'].append(np.array([node.get('missing') == node.get('yes') for node in nodes]))
+        arrays['leaf_index'].append(np.where(is_leaf, leaf_offset + np.cumsum(is_leaf) - 1, -1))
+        arrays['values'].append(np.array([node['leaf'] for node in nodes if 'leaf' in node], dtype=np.float32))
+        node_offset += len(nodes)
+        leaf_offset += int(is_leaf.sum())
+        depth = max(depth, max(node['depth'] for node in nodes))
+
+    compiled_trees = _concatenate_trees(arrays=arrays, roots=roots, depth=depth)
+    # xgboost compares features cast to float32 with float32 thresholds: x < threshold, missing to default child
+    compiled_trees.update({'task': 'gbtree', 'base_score': np.float32(base_score),
+                           'input_dtype': np.float32, 'strict': True})
+    return compiled_trees
+
+
+def _concatenate_trees(arrays, roots, depth):
+    compiled_trees = {'kind': 'trees', 'roots': np.array(roots, dtype=np.int32), 'depth': depth}
+    for name, dtype in [('feature', np.int32), ('threshold', None), ('left', np.int32), ('right', np.int32),
+                        ('default_left', np.bool_), ('leaf_index', np.int32), ('values', None)]:
+        if name in arrays:
+            compiled_trees[name] = np.ascontiguousarray(np.concatenate(arrays[name]), dtype=dtype)
+    return compiled_trees
+
+
+def _fold_steps_into_trees(steps, trees):
+    """Remove last steps that are columns selections or per feature scalings, rewriting splits of trees."""
+    while steps and (steps[-1]['kind'] == 'columns' or _is_increasing_scaling(steps[-1])):
+        step = steps.pop()
+        trees = dict(trees)
+        if step['kind'] == 'columns':
+            trees['feature'] = np.ascontiguousarray(step['index'][trees['feature']], dtype=np.int32)
+        else:
+            trees['threshold'] = _get_folded_thresholds(scaling=step, trees=trees)
+            trees.update({'input_dtype': np.float64, 'strict': False})
+    return trees
+
+
+def _is_increasing_scaling(step):
+    return step['kind'] == 'affine' and step['components'] is None \
+        and (step['scale'] is None or bool(np.all(step['scale'] > 0)))
+
+
+def _get_folded_thresholds(scaling, trees):
+    """Largest input value of every split taking left branch once scaled, found by bisection.
+
+    Scaling and cast to input dtype of trees being non decreasing, x goes left after
+    scaling if and only if x <= folded threshold. Bisection is done on integers ordered
+    as float64 values, so that folded thresholds are exact.
+    """
+    is_split = trees['left'] != np.arange(len(trees['left']))
+    features, thresholds = trees['feature'][is_split], trees['threshold'][is_split]
+
+    def goes_left(keys):
+        x = _ordered_keys_to_floats(keys)
+        with np.errstate(over='ignore', invalid='ignore'):
+            scaled = _apply_affine(step=scaling, X=x, features=features).astype(trees['input_dtype'])
+            return scaled < thresholds if trees['strict'] else scaled <= thresholds
+
+    # Invariant: low goes left, high does not
+    low = np.full(len(features), _floats_to_ordered_keys(np.array([-np.inf]))[0])
+    high = np.full(len(features), _floats_to_ordered_keys(np.array([np.inf]))[0])
+    while True:
+        middle = (low >> 1) + (high >> 1) + (low & high & 1)
+        if np.array_equal(middle, low):
+            break
+        is_left = goes_left(middle)
+        low, high = np.where(is_left, middle, low), np.where(is_left, high, middle)
+
+    folded_thresholds = trees['threshold'].astype(np.float64)
+    folded_thresholds[is_split] = _ordered_keys_to_floats(low)
+    return folded_thresholds
+
+
+def _floats_to_ordered_keys(x):
+    bits = np.ascontiguousarray(x, dtype=np.float64).view(np.int64)
+    return bits ^ ((bits >> 63) & np.int64(0x7FFFFFFFFFFFFFFF))
+
+
+def _ordered_keys_to_floats(keys):
+    return (keys ^ ((keys >> 63) & np.int64(0x7FFFFFFFFFFFFFFF))).view(np.float64)
+
+
+# Evaluation
+def _transform(steps, X):
+    for step in steps:
+        if step['kind'] == 'affine':
+            X = _apply_affine(step=step, X=X)
+        elif step['kind'] == 'columns':
+            X = X[:, step['index']]
+        elif step['kind'] == 'union':
+            X = np.hstack([_transform(steps=branch_steps, X=X) for branch_steps in step['branches']])
+        elif step['kind'] == 'stack':
+            # As tpot StackingEstimator: prediction, probabilities for classifiers, then features
+            stacked = [np.reshape(_predict(estimator=step['estimator'], X=X), (-1, 1))]
+            if _has_probabilities(step['estimator']):
+                stacked.append(_predict_proba(estimator=step['estimator'], X=X))
+            X = np.hstack(stacked + [X])
+    return X
+
+
+def _apply_affine(step, X, features=None):
+    """Apply affine step to X, or to values of given features only if features is not None."""
+    def select(array):
+        return array if features is None else array[features]
+
+    if step['center'] is not None:
+        X = X - select(step['center'])
+    if step['components'] is not None:
+        X = np.dot(X, step['components'].T)
+    if step['scale'] is not None:
+        X = X / select(step['scale']) if step['divide'] else X * select(step['scale'])
+    if step['offset'] is not None:
+        X = X + select(step['offset'])
+    return X
+
+
+def _predict(estimator, X):
+    if estimator['kind'] == 'logistic':
+        scores = _get_logistic_scores(estimator=estimator, X=X)
+        indices = (scores > 0).astype(np.int64) if scores.ndim == 1 else scores.argmax(axis=1)
+        return estimator['classes'][indices]
+
+    if estimator['task'] == 'classifier':
+        return estimator['classes'].take(np.argmax(_predict_proba(estimator=estimator, X=X), axis=1), axis=0)
+
+    leaf_values = _get_leaf_values(trees=estimator, X=X)
+    if estimator['task'] == 'gbtree':
+        return estimator['base_score'] + leaf_values
+    return leaf_values / len(estimator['roots'])
+
+
+def _predict_proba(estimator, X):
+    if estimator['kind'] == 'logistic':
+        scores = _get_logistic_scores(estimator=estimator, X=X)
+        if estimator['multinomial']:
+            scores = scores if scores.ndim == 2 else np.c_[-scores, scores]
+            # As sklearn.utils.extmath.softmax
+            scores = np.exp(scores - np.max(scores, axis=1).reshape((-1, 1)))
+            return scores / np.sum(scores, axis=1).reshape((-1, 1))
+        proba = expit(scores)
+        if proba.ndim == 1:
+            return np.vstack([1 - proba, proba]).T
+        return proba / proba.sum(axis=1).reshape((proba.shape[0], -1))
+
+    if estimator['task'] != 'classifier':
+        raise AttributeError('Compiled regressor has no predict_proba')
+    return _get_leaf_values(trees=estimator, X=X) / len(estimator['roots'])
+
+
+def _get_logistic_scores(estimator, X):
+    scores = np.dot(X, estimator['coef'].T) + estimator['intercept']
+    return scores.ravel() if scores.shape[1] == 1 else scores
+
+
+def _get_leaf_values(trees, X):
+    """Walk all trees at once level by level, and sum their leaf values in trees order."""
+    X = X.astype(trees['input_dtype'])
+    rows = np.arange(len(X))[:, np.newaxis]
+    nodes = np.repeat(trees['roots'][np.newaxis, :], len(X), axis=0)
+    for _ in range(trees['depth']):
+        values, thresholds = X[rows, trees['feature'][nodes]], trees['threshold'][nodes]
+        goes_left = values < thresholds if trees['strict'] else values <= thresholds
+        if trees['default_left'] is not None:
+            goes_left = np.where(np.isnan(values), trees['default_left'][nodes], goes_left)
+        nodes = np.where(goes_left, trees['left'][nodes], trees['right'][nodes])
+
+    leaves = trees['leaf_index'][nodes]
+    leaf_values = np.zeros((len(X),) + trees['values'].shape[1:], dtype=trees['values'].dtype)
+    for tree in range(leaves.shape[1]):
+        leaf_values += trees['values'][leaves[:, tree]]
+    return leaf_values
@@ -0,0 +1,261 @@
+from datetime import datetime
+from os.path import isfile, join
+from sklearn.base import clone
+from sklearn.externals.joblib import Parallel, delayed, dump, load
+from sklearn.metrics import get_scorer
+from time import time
+
+import logging
+import numpy as np
+import os
+import pandas as pd
+
+from code_.domain.artifact_measurement import measure_artifact
+from code_.domain.cached_pipeline import CachedPipeline
+from code_.domain.compiled_pipeline import compile_pipeline
+from code_.infrastructure.model_artifacts import dump_mapped_artifact
+
+import settings as stg
+
+
+# Costs of an artifact, in columns of results and keys of budgets
+COST_COLUMNS = ['size_mo', 'load_time', 'p99_latency_ms', 'peak_rss_mo']
+LOG_COLUMNS = ['run', 'candidate', 'format', 'score', 'fit_time'] + COST_COLUMNS + ['within_budget', 'error']
+
+
+class ConstrainedModelSelector():
+    """Select most accurate pipeline whose artifact fits budgets of submission.
+
+    Every candidate pipeline is fitted once and saved in every serialization format:
+    joblib with a compression, memory mapped artifact (see model_artifacts) or compiled
+    pipeline (see compiled_pipeline). Candidates are fitted and scored in parallel
+    processes, then saved and measured one after the other, every artifact in a new
+    process (see artifact_measurement), so that costs are not disturbed by other
+    candidates:
+    - size_mo: size of file
+    - load_time: time to load it, in seconds
+    - p99_latency_ms: 99th percentile of time to predict a single row
+    - peak_rss_mo: peak increase of resident memory while loading and predicting
+    Every measured artifact is appended to a log and removed as soon as it is measured,
+    unless it is the best one so far.
+
+    With a derive function, e.g. get_derived_forest_pipelines() of predictors, every
+    candidate is fitted once and pipelines derived from it without fitting again, such
+    as smaller or shallower forests, are evaluated instead.
+
+    Attributes
+    ----------
+    candidates: dict
+        Unfitted pipelines by name
+    formats: list
+        Tuples (format, compress), format in ['joblib', 'mapped', 'compiled'], compress
+        being compression of joblib files
+    budgets: dict
+        Maximal value by cost, see COST_COLUMNS, no budget for missing costs
+    scoring: string
+        sklearn scorer, higher is better, e.g. 'accuracy' or 'neg_mean_squared_error'
+    log_path: string
+        CSV file results are appended to
+    directory: string
+        Folder artifacts are saved in, only best one is kept
+    derive_function: function
+        Returns fitted pipelines by name from a fitted candidate, None to evaluate candidates themselves
+    nb_latency_rows: integer
+        Number of single row predictions latency percentile is computed on
+    n_jobs: integer
+    results_: pandas.DataFrame
+        Score and costs by candidate and format, with columns within_budget and is_pareto
+    best_: pandas.Series
+        Row of results_ with highest score within budgets, None if no artifact fits budgets
+
+    """
+
+    def __init__(self, candidates, log_path, formats=stg.SELECTOR_FORMATS, budgets=stg.SELECTOR_BUDGETS,
+                 scoring='accuracy', directory=stg.MODELS_DIR, derive_function=None,
+                 nb_latency_rows=stg.SELECTOR_NB_LATENCY_ROWS, n_jobs=stg.N_JOBS):
+        """Initialize class.
+
+        Parameters
+        ----------
+        candidates: dict
+        log_path: string
+        formats: list, default SELECTOR_FORMATS in settings
+        budgets: dict, default SELECTOR_BUDGETS in settings
+        scoring: string, default 'accuracy'
+        directory: string, default MODELS_DIR in settings
+        derive_function: function, default None
+            Must be picklable, e.g. functools.partial of a module function
+        nb_latency_rows: integer, default SELECTOR_NB_LATENCY_ROWS in settings
+        n_jobs: integer, default N_JOBS in settings
+
+        """
+        self.candidates = candidates
+        self.log_path = log_path
+        self.formats, self.budgets = formats, budgets
+        self.scoring = scoring
+        self.directory = directory
+        self.derive_function = derive_function
+        self.nb_latency_rows = nb_latency_rows
+        self.n_jobs = n_jobs
+
+    def fit(self, X_train, y_train, X_test, y_test):
+        """Fit candidates on training set, score them on test set and measure costs of their artifacts.
+
+        Parameters
+        ----------
+        X_train: pandas.DataFrame
+        y_train: pandas.Series
+        X_test: pandas.DataFrame
+            Also used to measure single row latencies
+        y_test: pandas.Series
+
+        Returns
+        -------
+        self: ConstrainedModelSelector
+
+        """
+        run = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        # Transformers shared by candidates are fitted once here, processes reading them from cache
+        for estimator in self.candidates.values():
+            if isinstance(estimator, CachedPipeline):
+                clone(estimator).fit_transformers(X_train, y_train)
+        fitted_candidates = Parallel(n_jobs=self.n_jobs)(
+            delayed(_fit_and_score)(name=name, estimator=clone(estimator), X_train=X_train, y_train=y_train,
+                                    X_test=X_test, y_test=y_test, scoring=self.scoring, directory=self.directory,
+                                    derive_function=self.derive_function)
+            for name, estimator in self.candidates.items())
+
+        results, best = list(), None
+        for fitted_candidate in fitted_candidates:
+            for fitted_name, fitted_estimator in self._get_fitted_estimators(fitted_candidate).items():
+                for artifact in _save(name=fitted_name, estimator=fitted_estimator,
+                                      fit_time=fitted_candidate['fit_time'],
+                                      score=fitted_candidate['scores'][fitted_name], X_test=X_test,
+                                      formats=self.formats, directory=self.directory):
+                    best = self._measure(artifact=artifact, best=best, X_test=X_test)
+                    artifact['run'] = run
+                    self._append_to_log(artifact)
+                    results.append(artifact)
+            os.remove(fitted_candidate['path'])
+
+        self.results_ = pd.DataFrame(results, columns=LOG_COLUMNS + ['file_path'])\
+            .dropna(subset=['score', 'size_mo'])
+        self.results_['is_pareto'] = get_pareto_front(self.results_, score_column='score',
+                                                      cost_columns=COST_COLUMNS)
+        self.best_ = self._get_best(best=best)
+        return self
+
+    def _get_fitted_estimators(self, fitted_candidate):
+        estimator = load(fitted_candidate['path'])
+        if self.derive_function is None:
+            return {fitted_candidate['name']: estimator}
+        return {'{}_{}'.format(fitted_candidate['name'], derived_name): derived_estimator
+                for derived_name, derived_estimator in self.derive_function(estimator).items()}
+
+    def _measure(self, artifact, best, X_test):
+        # Highest score within budgets, smallest file among equal scores, is the only artifact kept
+        file_path = artifact.pop('path')
+        if artifact['error'] is not None:
+            if isfile(file_path):
+                os.remove(file_path)
+            logging.warning('.. {} - {} not measured: {}'.format(artifact['candidate'], artifact['format'],
+                                                                 artifact['error']))
+            return best
+
+        artifact.update(measure_artifact(file_path=file_path, model_format=artifact['format'], X=X_test,
+                                         nb_latency_rows=self.nb_latency_rows), file_path=file_path)
+        artifact['within_budget'] = all(artifact[cost] <= budget for cost, budget in self.budgets.items())
+        if artifact['within_budget'] and (best is None or (artifact['score'], -artifact['size_mo'])
+                                          > (best['score'], -best['size_mo'])):
+            if best is not None:
+                os.remove(best['file_path'])
+            return artifact
+        os.remove(file_path)
+        return best
+
+    def _append_to_log(self, artifact):
+        pd.DataFrame([artifact], columns=LOG_COLUMNS)\
+            .to_csv(self.log_path, mode='a', header=not isfile(self.log_path), index=False)
+
+    def _get_best(self, best):
+        if best is None:
+            logging.warning('.. No artifact within budgets {}'.format(self.budgets))
+            return None
+        return self.results_[self.results_['file_path'] == best['file_path']].iloc[0]
+
+
+def get_pareto_front(df, score_column, cost_columns):
+    """Flag rows no other row beats on score and on every cost at once.
+
+    Parameters
+    ----------
+    df: pandas.DataFrame
+    score_column: string
+        Higher is better
+    cost_columns: list
+        Lower is better
+
+    Returns
+    -------
+    is_pareto: numpy.ndarray
+        Boolean by row
+
+    """
+    # Negated score, so that lower is better on all columns
+    values = np.column_stack([-df[score_column].values.astype(float)] +
+                             [df[column].values.astype(float) for column in cost_columns])
+    is_pareto = np.ones(len(values), dtype=bool)
+    for row, row_values in enumerate(values):
+        is_dominated = np.all(values <= row_values, axis=1) & np.any(values < row_values, axis=1)
+        is_pareto[row] = not is_dominated.any()
+    return is_pareto
+
+
+def get_format_label(model_format, compress):
+    """Name of a serialization format, e.g. 'joblib_lz4_9'."""
+    if model_format != 'joblib':
+        return model_format
+    compress = compress if isinstance(compress, (list, tuple)) else [compress]
+    return '_'.join([model_format] + [str(parameter) for parameter in compress])
+
+
+def _fit_and_score(name, estimator, X_train, y_train, X_test, y_test, scoring, directory, derive_function):
+    # Fitted candidate is sent back through a file, as derived pipelines are saved and measured one at a time
+    start = time()
+    estimator.fit(X_train, y_train)
+    fit_time = time() - start
+    fitted_estimators = {name: estimator} if derive_function is None else \
+        {'{}_{}'.format(name, derived_name): derived_estimator
+         for derived_name, derived_estimator in derive_function(estimator).items()}
+    scores = {fitted_name: get_scorer(scoring)(fitted_estimator, X_test, y_test)
+              for fitted_name, fitted_estimator in fitted_estimators.items()}
+
+    fitted_path = join(directory, 'selection_{}_fitted.joblib'.format(name))
+    dump(estimator, fitted_path)
+    return {'name': name, 'fit_time': fit_time, 'scores': scores, 'path': fitted_path}
+
+
+def _save(name, estimator, fit_time, score, X_test, formats, directory):
+    # Artifacts are sklearn pipelines, as loaded by submission
+    if isinstance(estimator, CachedPipeline):
+        estimator = estimator.get_pipeline()
+
+    artifacts = list()
+    for model_format, compress in formats:
+        label = get_format_label(model_format=model_format, compress=compress)
+        file_path = join(directory, 'selection_{}_{}.{}'.format(name, label, model_format))
+        error = None
+        try:
+            if model_format == 'joblib':
+                dump(estimator, file_path, compress=compress)
+            elif model_format == 'mapped':
+                dump_mapped_artifact(model=estimator, file_path=file_path)
+            else:
+                compiled_pipeline = compile_pipeline(pipeline=estimator, nb_features=X_test.shape[1])
+                compiled_pipeline.verify(pipeline=estimator, X=X_test)
+                compiled_pipeline.dump(file_path=file_path)
+        except (NotImplementedError, ValueError) as exception:
+            error = str(exception)
+        artifacts.append({'candidate': name, 'format': label, 'score': score, 'fit_time': fit_time,
+                          'path': file_path, 'error': error})
+    return artifacts
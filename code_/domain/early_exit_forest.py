@@ -0,0 +1,126 @@
+from sklearn.ensemble.forest import ForestClassifier
+from sklearn.pipeline import Pipeline
+from sklearn.utils import check_array
+
+import numpy as np
+
+import settings as stg
+
+
+# Margins are compared with numbers of remaining trees up to rounding errors of sums of probabilities
+VOTE_MARGIN_TOLERANCE = 1e-9
+
+
+class EarlyExitForest():
+    """Forest classifier stopping to evaluate trees for a row as soon as its prediction is known.
+
+    A forest predicts the class with highest sum of probabilities of its trees, every tree
+    adding at most 1 to a class. Trees are evaluated by batches: once margin between
+    first and second classes of a row is larger than number of trees not evaluated yet,
+    remaining trees cannot change its prediction and are skipped for this row. Predictions
+    are those of the full forest.
+
+    Attributes
+    ----------
+    model: sklearn.pipeline.Pipeline or fitted forest
+        Final step is a forest classifier, e.g. ExtraTreesClassifier, see is_early_exit_compatible()
+    forest: fitted forest classifier
+    batch_size: integer
+        Number of trees evaluated between two checks of margins
+    nb_predictions: integer
+        Number of rows predicted so far
+    nb_evaluated_trees: integer
+        Number of trees evaluated so far, summed over rows
+
+    """
+
+    def __init__(self, model, batch_size=stg.EARLY_EXIT_BATCH_SIZE):
+        """Initialize class.
+
+        Parameters
+        ----------
+        model: sklearn.pipeline.Pipeline or fitted forest
+        batch_size: integer, default EARLY_EXIT_BATCH_SIZE in settings
+
+        """
+        self.model = model
+        self.forest = model.steps[-1][1] if isinstance(model, Pipeline) else model
+        self.batch_size = batch_size
+        self.nb_predictions, self.nb_evaluated_trees = 0, 0
+
+    @property
+    def classes_(self):
+        """Classes of forest."""
+        return self.forest.classes_
+
+    @property
+    def mean_nb_evaluated_trees(self):
+        """Average number of trees evaluated by row so far."""
+        return self.nb_evaluated_trees / max(self.nb_predictions, 1)
+
+    def predict(self, X):
+        """Predict class of every row, evaluating trees until prediction cannot change anymore.
+
+        Parameters
+        ----------
+        X: pandas.DataFrame or numpy.ndarray
+
+        Returns
+        -------
+        y_pred: numpy.ndarray
+
+        """
+        if isinstance(self.model, Pipeline):
+            for _, transformer in self.model.steps[:-1]:
+                if transformer is not None and transformer != 'passthrough':
+                    X = transformer.transform(X)
+        # Trees read float32 inputs, as forest converts them before predicting
+        X = check_array(X, dtype=np.float32, accept_sparse='csr')
+
+        trees = self.forest.estimators_
+        votes = np.zeros((X.shape[0], len(self.classes_)))
+        nb_evaluated_trees = np.full(X.shape[0], len(trees))
+        undecided_rows = np.arange(X.shape[0])
+        for start in range(0, len(trees), self.batch_size):
+            stop = min(start + self.batch_size, len(trees))
+            X_undecided = X[undecided_rows]
+            for tree in trees[start:stop]:
+                votes[undecided_rows] += tree.predict_proba(X_undecided, check_input=False)
+
+            is_decided = _get_vote_margins(votes[undecided_rows]) > len(trees) - stop + VOTE_MARGIN_TOLERANCE
+            nb_evaluated_trees[undecided_rows[is_decided]] = stop
+            undecided_rows = undecided_rows[~is_decided]
+            if not len(undecided_rows):
+                break
+
+        self.nb_predictions += X.shape[0]
+        self.nb_evaluated_trees += nb_evaluated_trees.sum()
+        # Averaged as forest does, so that ties of rows voted by all trees are broken the same way
+        return self.classes_.take(np.argmax(votes / len(trees), axis=1), axis=0)
+
+
+def is_early_exit_compatible(model):
+    """Check if model, or final step of pipeline, is a fitted forest classifier of sklearn with a single output.
+
+    Forests of sklearn, e.g. RandomForestClassifier or ExtraTreesClassifier, average
+    probabilities of their trees, which is what votes of EarlyExitForest rely on.
+
+    Parameters
+    ----------
+    model: object
+
+    Returns
+    -------
+    is_compatible: boolean
+
+    """
+    forest = model.steps[-1][1] if isinstance(model, Pipeline) else model
+    return (isinstance(forest, ForestClassifier) and isinstance(getattr(forest, 'estimators_', None), list)
+            and getattr(forest, 'n_outputs_', None) == 1)
+
+
+def _get_vote_margins(votes):
+    if votes.shape[1] < 2:
+        return np.full(len(votes), np.inf)
+    two_highest_votes = np.partition(votes, kth=-2, axis=1)[:, -2:]
+    return two_highest_votes[:, 1] - two_highest_votes[:, 0]
@@ -1,10 +1,14 @@
-from os.path import basename, join, splitext
+from collections import OrderedDict
+from os.path import basename, isfile, join, splitext
 import logging
-import os
+import numpy as np
 import pandas as pd
 
+from code_.domain.window_stats import GameWindowStats
+from code_.infrastructure.dataset_cache import DatasetCache, hash_games_files
 from code_.infrastructure.game import Game
-from code_.infrastructure.players import Players
+from code_.infrastructure.games_ingestion import GamesIngestor
+from code_.infrastructure.players import Players, get_player_registry
 import settings as stg
 
 if __name__ == '__main__':
@@ -18,17 +22,28 @@ class SeasonFirstHalfAggregator():
     Attributes
     ----------
     saved_filename: string, default FILENAME_STATS_AGGREGATED in settings
+        Name of CSV export in OUTPUTS_DIR, and of dataset cache folder in DATASETS_CACHE_DIR
+    event_store: code_.infrastructure.event_store.EventStore, default None
+        Store to read cleaned games from, games are parsed from GAMES_DIR if None
+    ingestor: code_.infrastructure.games_ingestion.GamesIngestor
+        Runs processing of every game in parallel processes
 
     """
 
-    def __init__(self, saved_filename):
+    def __init__(self, saved_filename, event_store=None, n_jobs=stg.INGESTION_N_JOBS):
         """Class init."""
         self.saved_filename = saved_filename
+        self.event_store = event_store
+        self.ingestor = GamesIngestor(n_jobs=n_jobs)
 
     def build_players_stats_dataset(self, sliding_interval_min,
-                                    list_events_number, list_events_with_success_rate,):
+                                    list_events_number, list_events_with_success_rate,
+                                    window_length_min=stg.STATS_WINDOW_LENGTH_MIN, columns=None):
         """Aggregate stats info for all games in first half of season.
 
+        Stats are cached by game and only computed for games new or modified since last
+        run, or for all games if parameters or eligible players changed.
+
         Parameters
         ----------
         liding_interval_min: int
@@ -37,6 +52,10 @@ class SeasonFirstHalfAggregator():
             Events type_id for which number aggregation are computed
         list_events_with_success_rate: list
             Events type_id for which number and success rate are computed
+        window_length_min: int, default STATS_WINDOW_LENGTH_MIN in settings
+            Length of time window in every game
+        columns: list, default None
+            Columns to read from cache, all columns if None
 
         Returns
         -------
@@ -44,40 +63,49 @@ class SeasonFirstHalfAggregator():
             Aggregation of stats for all games
 
         """
-        try:
-            return pd.read_csv(join(stg.OUTPUTS_DIR, self.saved_filename))
-        except FileNotFoundError:
-            logging.debug('Start to aggregate game stats..')
-            number_games_processed = 0
-
-            df_stats = pd.DataFrame()
-
-            for file_ in os.listdir(stg.GAMES_DIR):
-                stats_game = StatsGameAnalyzer(filename=file_)\
-                    .build_game_dataset_eligible_players(sliding_interval_min=sliding_interval_min,
-                                                         list_events_number=list_events_number,
-                                                         list_events_with_success_rate=list_events_with_success_rate)
-
-                df_stats = pd.concat([df_stats, stats_game], axis=0,
-                                     ignore_index=True, sort=False)
-                number_games_processed += 1
-                logging.debug('.. {}/{} - successfully loaded file {}'
-                              .format(number_games_processed, len(os.listdir(stg.GAMES_DIR)), file_))
-
-            df_stats.fillna({col: 0 for col in df_stats.columns if col.endswith('_nb')})\
-                    .to_csv(join(stg.OUTPUTS_DIR, self.saved_filename))
-            logging.info('Successfully saved aggregated stats.')
-            return df_stats
-
-    def build_next_event_dataset(self, columns_to_lag, lags_to_add):
+        # Built before workers start, so that they all inherit or read it
+        eligible_players = get_player_registry()
+        dataset_cache = self._get_dataset_cache(dataset_settings={'sliding_interval_min': sliding_interval_min,
+                                                                  'window_length_min': window_length_min,
+                                                                  'list_events_number': list_events_number,
+                                                                  'list_events_with_success_rate': list_events_with_success_rate,
+                                                                  'eligible_players': eligible_players.tolist()})
+        content_hashes = self._get_games_hashes()
+        games_files = list(content_hashes)
+        stale_files = dataset_cache.get_stale_files(filenames=games_files, content_hashes=content_hashes)
+
+        if stale_files:
+            logging.debug('Start to aggregate game stats for {}/{} games..'.format(len(stale_files), len(games_files)))
+            dataset_cache.write(partitions=self.ingestor.map(build_game_stats_eligible_players, stale_files,
+                                                             event_store=self.event_store,
+                                                             sliding_interval_min=sliding_interval_min,
+                                                             list_events_number=list_events_number,
+                                                             list_events_with_success_rate=list_events_with_success_rate,
+                                                             window_length_min=window_length_min),
+                                content_hashes=content_hashes)
+        else:
+            dataset_cache.prune(filenames=games_files)
+
+        valid_files = self._get_valid_files(games_files=games_files, stale_files=stale_files)
+        fill_values = {col: 0 for col in dataset_cache.get_columns(filenames=valid_files) if col.endswith('_nb')}
+        self._export_dataset(dataset_cache=dataset_cache, filenames=valid_files, is_updated=bool(stale_files),
+                             fill_values=fill_values)
+        return dataset_cache.read(filenames=valid_files, columns=columns).fillna(fill_values)
+
+    def build_next_event_dataset(self, columns_to_lag, lags_to_add, columns=None):
         """Aggregate team with previous events for all games in first half of season.
 
+        Datasets are cached by game and only computed for games new or modified since last
+        run, or for all games if parameters changed.
+
         Parameters
         ----------
         columns_to_lag: list
             Columns to keep from self.game to use in ML
         lags_to_add: list
             Lags to perform
+        columns: list, default None
+            Columns to read from cache, all columns if None
 
         Returns
         -------
@@ -85,28 +113,74 @@ class SeasonFirstHalfAggregator():
             Aggregation teams with previous events
 
         """
-        try:
-            return pd.read_csv(join(stg.OUTPUTS_DIR, self.saved_filename), index_col=0)
-        except FileNotFoundError:
-            logging.debug('Start to aggregate next event dataset..')
-            number_games_processed = 0
-
-            df_next_team = pd.DataFrame()
-
-            for file_ in os.listdir(stg.GAMES_DIR):
-                game_next_team = NextEventInGame(filename=file_)\
-                    .build_next_event_dataset(columns_to_lag=columns_to_lag,
-                                              lags_to_add=lags_to_add)
-
-                df_next_team = pd.concat([df_next_team, game_next_team], axis=0,
-                                         ignore_index=True, sort=False)
-                number_games_processed += 1
-                logging.debug('.. {}/{} - successfully loaded file {}'
-                              .format(number_games_processed, len(os.listdir(stg.GAMES_DIR)), file_))
-
-            df_next_team.to_csv(join(stg.OUTPUTS_DIR, self.saved_filename))
-            logging.info('Successfully saved aggregated next team dataset.')
-            return df_next_team
+        dataset_cache = self._get_dataset_cache(dataset_settings={'columns_to_lag': columns_to_lag,
+                                                                  'lags_to_add': lags_to_add})
+        content_hashes = self._get_games_hashes()
+        games_files = list(content_hashes)
+        stale_files = dataset_cache.get_stale_files(filenames=games_files, content_hashes=content_hashes)
+
+        if stale_files:
+            logging.debug('Start to aggregate next event dataset for {}/{} games..'
+                          .format(len(stale_files), len(games_files)))
+            dataset_cache.write(partitions=self._build_next_event_partitions(games_files=stale_files,
+                                                                             columns_to_lag=columns_to_lag,
+                                                                             lags_to_add=lags_to_add),
+                                content_hashes=content_hashes)
+        else:
+            dataset_cache.prune(filenames=games_files)
+
+        valid_files = self._get_valid_files(games_files=games_files, stale_files=stale_files)
+        self._export_dataset(dataset_cache=dataset_cache, filenames=valid_files, is_updated=bool(stale_files))
+        return dataset_cache.read(filenames=valid_files, columns=columns)
+
+    def _build_next_event_partitions(self, games_files, columns_to_lag, lags_to_add):
+        games_events = self._get_games_events(games_files=games_files)
+        season_events = pd.concat(list(games_events.values()), axis=0, ignore_index=True, sort=False)
+
+        df_next_team = NextEventInGame(game=season_events)\
+            .build_next_event_dataset(columns_to_lag=columns_to_lag,
+                                      lags_to_add=lags_to_add)
+
+        # Dataset index is position in season events, games being one after the other
+        games_ends = np.cumsum([df_game.shape[0] for df_game in games_events.values()])
+        games_positions = np.searchsorted(games_ends, df_next_team.index.values, side='right')
+        return OrderedDict((filename, df_next_team[games_positions == position])
+                           for position, filename in enumerate(games_events))
+
+    def _get_games_events(self, games_files):
+        if self.event_store is not None:
+            return OrderedDict((filename, self.event_store.read_game(filename=filename)) for filename in games_files)
+        return self.ingestor.map(load_clean_game_data, games_files)
+
+    def _get_valid_files(self, games_files, stale_files):
+        failed_files = self.ingestor.errors if stale_files else dict()
+        return [filename for filename in games_files if filename not in failed_files]
+
+    def _get_dataset_cache(self, dataset_settings):
+        # Settings read while cleaning games and computing features, as stale as parameters if edited
+        features_settings = {'gk_events': stg.GK_EVENTS, 'shots_events': stg.SHOTS_EVENTS, 'zones': stg.ZONES,
+                             'periods_start_min': stg.PERIODS_START_MIN, 'period_length_min': stg.PERIOD_LENGTH_MIN,
+                             'events_dtypes': stg.EVENTS_DTYPES, 'events_fill_values': stg.EVENTS_FILL_VALUES}
+        return DatasetCache(cache_dir=join(stg.DATASETS_CACHE_DIR, splitext(self.saved_filename)[0]),
+                            dataset_settings=dict(dataset_settings, **features_settings))
+
+    def _export_dataset(self, dataset_cache, filenames, is_updated, fill_values=None):
+        export_path = join(stg.OUTPUTS_DIR, self.saved_filename)
+        if is_updated or not isfile(export_path):
+            dataset_cache.to_csv(filenames=filenames, file_path=export_path, fill_values=fill_values)
+            logging.info('Successfully saved aggregated dataset {}.'.format(self.saved_filename))
+
+    def _get_games_hashes(self):
+        """Hash of content of every game file of GAMES_DIR, hashed before datasets are built from it."""
+        content_hashes = hash_games_files()
+        if self.event_store is None:
+            return content_hashes
+
+        # Store is updated first, so that partitions are built from current content of games files
+        stored_hashes = self.event_store.update(content_hashes=content_hashes).content_hashes
+        # Games failing to be cleaned are not in store
+        return OrderedDict((filename, content_hash) for filename, content_hash in content_hashes.items()
+                           if stored_hashes.get(filename) == content_hash)
 
 
 class NextEventInGame():
@@ -115,7 +189,8 @@ class NextEventInGame():
     Attributes
     ----------
     game: pandas.DataFrame
-        Output of code_.infrastructure.game.Game.clean_game_data() filtered on game events
+        Output of code_.infrastructure.game.Game.clean_game_data() filtered on game events,
+        for one game or several concatenated games
 
     """
 
@@ -127,15 +202,20 @@ class NextEventInGame():
         except TypeError as error:
             raise NameError('Error in NextEventInGame initialization - {}'.format(error))
 
-    def build_next_event_dataset(self, columns_to_lag, lags_to_add):
+    def build_next_event_dataset(self, columns_to_lag, lags_to_add, columns=None):
         """Build dataset with previous events.
 
+        Lags are read by position within every game and period, events of a period being
+        consecutive. Events without all their lags in same game and period are dropped.
+
         Attributes
         ----------
         columns_to_lag: list
             Columns to keep from self.game to use in ML
         lags_to_add: list
             Lags to perform
+        columns: list, default None
+            Columns to read from cache, all columns if None
 
         Returns
         -------
@@ -145,42 +225,41 @@ class NextEventInGame():
         """
         try:
             assert(stg.PERIOD_COL in columns_to_lag)
-
-            dataset = self._get_targets()
-
-            for lag in lags_to_add:
-                lag_df = self._lag_dataset(lag=lag)
-                columns_name_lagged = ['{}_lag{}'.format(col, lag) for col in columns_to_lag]
-                dataset = dataset.merge(right=lag_df[columns_name_lagged], how='left',
-                                        right_index=True, left_index=True)\
-                                 .query('{period} == {period}_lag{lag}'.format(period=stg.PERIOD_COL, lag=lag))\
-                                 .drop(labels='{}_lag{}'.format(stg.PERIOD_COL, lag), axis=1)
-            return dataset
         except AssertionError:
             raise KeyError('{} not in columns_to_lag list'.format(stg.PERIOD_COL))
 
+        position_in_period = self.game.groupby(by=[stg.GAME_ID_COL, stg.PERIOD_COL], sort=False, observed=True)\
+                                      .cumcount()\
+                                      .values
+        rows = np.flatnonzero(position_in_period >= max(lags_to_add, default=0))
+
+        df_targets = self._get_targets().iloc[rows]
+        lagged_columns = OrderedDict(('{}_lag{}'.format(col, lag), self.game[col].values[rows - lag])
+                                     for lag in lags_to_add
+                                     for col in columns_to_lag if col != stg.PERIOD_COL)
+
+        df_lags = pd.DataFrame(lagged_columns, index=df_targets.index, columns=list(lagged_columns))
+
+        dataset = pd.concat([df_targets, df_lags], axis=1)
+        return dataset
+
     def _get_targets(self):
         df_target = self.game[[stg.GAME_ID_COL, stg.PERIOD_COL, stg.TEAM_COL,
                                stg.X_PROJECTED_COL, stg.Y_PROJECTED_COL]]
         return df_target
 
-    def _lag_dataset(self, lag):
-        df_lagged = self.game.shift(lag)\
-                             .rename(columns={col: '{}_lag{}'.format(col, lag)
-                                              for col in self.game.columns})
-        return df_lagged
-
-    def _filter_game_events(self, **kwargs):
-        return Game(**kwargs)\
-            .clean_game_data()\
+    def _filter_game_events(self, game=None, event_store=None, **kwargs):
+        if game is None:
+            game = load_clean_game_data(event_store=event_store, **kwargs)
+        return game\
             .reset_index(drop=True)\
             .query('{} not in {}'.format(stg.EVENT_TYPE_COL,
                                          [stg.EVENTS_MAP['START_PERIOD'], stg.EVENTS_MAP['END_PERIOD']]))
 
     def _project_coordinates_along_team1_axis(self, df):
-        df_projections = df.assign(**{stg.X_PROJECTED_COL: lambda x: x[stg.TEAM_COL].apply(int) * x[stg.X_COL].apply(float) + (1 - x[stg.TEAM_COL].apply(int)) * (100 - x[stg.X_COL].apply(float)),
-                                      stg.Y_PROJECTED_COL: lambda x: x[stg.TEAM_COL].apply(int) * x[stg.Y_COL].apply(float) + (1 - x[stg.TEAM_COL].apply(int)) * (100 - x[stg.Y_COL].apply(float))
-                                      })
+        is_team1 = df[stg.TEAM_COL] == 1
+        df_projections = df.assign(**{stg.X_PROJECTED_COL: df[stg.X_COL].where(is_team1, 100 - df[stg.X_COL]),
+                                      stg.Y_PROJECTED_COL: df[stg.Y_COL].where(is_team1, 100 - df[stg.Y_COL])})
 
         return df_projections
 
@@ -192,24 +271,25 @@ class StatsGameAnalyzer():
     ----------
     game: pandas.DataFrame
         Output of code_.infrastructure.game.Game.clean_game_data()
-    eligible_players: list
-        Output of code_.infrastructure.players.Players.get_eligible_players_list()
+    eligible_players: code_.infrastructure.players.PlayerRegistry
+        Eligible players, shared by all instances of process
 
     """
 
     def __init__(self, **kwargs):
         """Initialize class."""
         try:
-            self.game = self._fillna_game_data_and_convert_types(**kwargs)
+            self.game = self._get_game_events_with_player(**kwargs)
         except TypeError as error:
             raise NameError('Error in StatsGameAnalyzer initialization - {}'.format(error))
 
-        self.eligible_players = Players().get_eligible_players_list()
+        self.eligible_players = get_player_registry()
 
     def build_game_dataset_eligible_players(self, sliding_interval_min,
                                             list_events_number,
-                                            list_events_with_success_rate):
-        """Compute stats for every period with 15 min intervals for major players.
+                                            list_events_with_success_rate,
+                                            window_length_min=stg.STATS_WINDOW_LENGTH_MIN):
+        """Compute stats on sliding windows of every period for major players.
 
         Parameters
         ----------
@@ -219,6 +299,8 @@ class StatsGameAnalyzer():
             Event types ID for which number of events are computed
         list_events_with_success_rate: list
             Event types ID for which number of events and success rate are computed
+        window_length_min: integer, default STATS_WINDOW_LENGTH_MIN in settings
+            Length of sliding window
 
         Returns
         -------
@@ -226,26 +308,12 @@ class StatsGameAnalyzer():
             Columns: game, player_id, binarized team_id, time_interval, stats
 
         """
-        df_game_stats = pd.DataFrame()
-
-        for start in range(0, 31, sliding_interval_min):
-            df = self._get_info_on_15_minutes(period='1', start_in_min=start,
-                                              list_events_number=list_events_number,
-                                              list_events_with_success_rate=list_events_with_success_rate)\
-                     .query('{} in {}'.format(stg.PLAYER_COL, self.eligible_players))
-            df_game_stats = pd.concat([df_game_stats, df], axis=0,
-                                      ignore_index=True, sort=False)
-
-        for start in range(45, 76, sliding_interval_min):
-            df = self._get_info_on_15_minutes(period='2', start_in_min=start,
-                                              list_events_number=list_events_number,
-                                              list_events_with_success_rate=list_events_with_success_rate)\
-                     .query('{} in {}'.format(stg.PLAYER_COL, self.eligible_players))
-            df_game_stats = pd.concat([df_game_stats, df], axis=0,
-                                      ignore_index=True, sort=False)
-
-        df_game_stats.fillna({col: 0 for col in df_game_stats.columns if col.endswith('_nb')},
-                             inplace=True)
+        window_stats = GameWindowStats(game=self.game,
+                                       list_events_number=list_events_number,
+                                       list_events_with_success_rate=list_events_with_success_rate)
+        df_game_stats = window_stats.get_sliding_windows_stats(window_length_min=window_length_min,
+                                                               sliding_interval_min=sliding_interval_min,
+                                                               players=self.eligible_players)
 
         return df_game_stats
 
@@ -263,7 +331,7 @@ class StatsGameAnalyzer():
             Dataframe to make predictions on
 
         """
-        df_players = df_15_min.query('{} == "1"'.format(stg.PLAYER_COL))\
+        df_players = df_15_min.query('{} == {}'.format(stg.PLAYER_COL, stg.PLAYER_TO_PREDICT_ID))\
                               .filter(items=[stg.PLAYER_COL, stg.TEAM_COL])\
                               .drop_duplicates()
 
@@ -286,54 +354,20 @@ class StatsGameAnalyzer():
                         inplace=True)
         return df_stats
 
-    def _get_info_on_15_minutes(self, period, start_in_min, **kwargs):
-        df_15_min = self.game.query('{start}*60 <= {col} <= ({start}+15)*60'.format(start=start_in_min,
-                                                                                    col=stg.GAME_TIME_COL))\
-                             .query('{} == "{}"'.format(stg.PERIOD_COL, period))
-
-        try:
-            df_players = df_15_min.filter(items=[stg.GAME_ID_COL, stg.PLAYER_COL, stg.TEAM_COL])\
-                                  .drop_duplicates()\
-                                  .assign(time_period='{}-{}'.format(start_in_min, start_in_min + 15))
-            assert(df_players.shape[0] == len(df_players[stg.PLAYER_COL].unique()))
-        except AssertionError:
-            raise AssertionError('Some players belong to both teams.')
-
-        df_player_stats = self._get_agg_stats(df_with_events=df_15_min, agg_column=stg.PLAYER_COL, **kwargs)
-        df_player_stats.columns = ['p_{}'.format(col) if col != stg.PLAYER_COL else col
-                                   for col in df_player_stats.columns]
-
-        df_team_stats = self._get_agg_stats(df_with_events=df_15_min, agg_column=stg.TEAM_COL, **kwargs)
-        df_team_stats.columns = ['t_{}'.format(col) if col != stg.TEAM_COL else col
-                                 for col in df_team_stats.columns]
-
-        df_player_info = self._build_dataset_from_bool_columns(df_with_events=df_15_min)
-        df_player_position = self._get_player_position(df_with_events=df_15_min)
-
-        df_all_stats = df_players.merge(right=df_player_info, on=stg.PLAYER_COL, how='left')\
-                                 .merge(right=df_player_position, on=stg.PLAYER_COL, how='left')\
-                                 .merge(right=df_player_stats, on=stg.PLAYER_COL, how='left')\
-                                 .merge(right=df_team_stats, on=stg.TEAM_COL, how='left')
-        return df_all_stats
-
     def _get_player_position(self, df_with_events):
-        QUALIFIER_COLNAME = '{}_{}'.format(stg.QUALIFIER_COL, stg.QUALIFIER_MAP['ZONE'])
-
-        player_pct_positions = df_with_events.query('{} != "no_position"'.format(QUALIFIER_COLNAME))\
-                                             .groupby(by=[stg.PLAYER_COL, QUALIFIER_COLNAME])\
-                                             .agg({QUALIFIER_COLNAME: 'count'}) \
-                                             .groupby(level=0).apply(lambda x: 100 * x / float(x.sum())) \
-                                             .rename(columns={QUALIFIER_COLNAME: 'nb'}) \
-                                             .reset_index() \
-                                             .pivot(index=stg.PLAYER_COL, columns=QUALIFIER_COLNAME, values='nb')\
-                                             .fillna(0)\
-                                             .reset_index()
+        df_positions = df_with_events[df_with_events[stg.ZONE_COL] != stg.NO_POSITION]
+
+        nb_by_position = df_positions.groupby(by=[df_positions[stg.PLAYER_COL],
+                                                  df_positions[stg.ZONE_COL].astype(str)])\
+                                     .size()\
+                                     .unstack(fill_value=0)
+        player_pct_positions = (100 * nb_by_position).div(nb_by_position.sum(axis=1), axis=0)\
+                                                     .rename_axis(None, axis=1)\
+                                                     .reset_index()
 
         return player_pct_positions
 
     def _build_dataset_from_bool_columns(self, df_with_events):
-        players = pd.DataFrame({stg.PLAYER_COL: list()})
-
         nb_keypass = self._count_number_by_player_and_col(df=df_with_events, column=stg.KEYPASS_COL)
         nb_assist = self._count_number_by_player_and_col(df=df_with_events, column=stg.ASSIST_COL)
         nb_gk_events = self._compute_nb_gk_events(df=df_with_events)
@@ -345,44 +379,31 @@ class StatsGameAnalyzer():
                                                       previous_event_id=stg.EVENTS_MAP['CORNER_AWARDED'],
                                                       colname=stg.CORNER_COL)
 
-        df_out = players.merge(right=nb_keypass, on=stg.PLAYER_COL, how='outer')\
-                        .merge(right=nb_assist, on=stg.PLAYER_COL, how='outer')\
-                        .merge(right=nb_gk_events, on=stg.PLAYER_COL, how='outer')\
-                        .merge(right=nb_shots, on=stg.PLAYER_COL, how='outer')\
-                        .merge(right=nb_free_kick_pass, on=stg.PLAYER_COL, how='outer')\
-                        .merge(right=nb_corner, on=stg.PLAYER_COL, how='outer')
+        df_out = pd.concat([nb_keypass, nb_assist, nb_gk_events, nb_shots, nb_free_kick_pass, nb_corner],
+                           axis=1, sort=False)\
+                   .reset_index()
 
         return df_out
 
     def _compute_nb_gk_events(self, df):
-        df_gk_events = df.assign(**{stg.GK_EVENTS_COL: lambda x: x[stg.EVENT_TYPE_COL].apply(lambda x: 1 if x in stg.GK_EVENTS else 0)
-                                    })
+        df_gk_events = df.assign(**{stg.GK_EVENTS_COL: df[stg.EVENT_TYPE_COL].isin(stg.GK_EVENTS)})
 
         df_gk_by_player = self._count_number_by_player_and_col(df=df_gk_events,
                                                                column=stg.GK_EVENTS_COL)
         return df_gk_by_player
 
     def _compute_nb_shots(self, df):
-        df_shots = df.assign(**{stg.SHOTS_COL: lambda x: x[stg.EVENT_TYPE_COL].apply(lambda x: 1 if x in stg.SHOTS_EVENTS else 0)})
+        df_shots = df.assign(**{stg.SHOTS_COL: df[stg.EVENT_TYPE_COL].isin(stg.SHOTS_EVENTS)})
 
         df_shots_by_player = self._count_number_by_player_and_col(df=df_shots,
                                                                   column=stg.SHOTS_COL)
         return df_shots_by_player
 
     def _compute_nb_pass_after_event(self, df, previous_event_id, colname):
-        PREVIOUS_EVENT = '{}_previous_event'.format(stg.EVENT_TYPE_COL)
+        bool_event = df[stg.EVENT_TYPE_COL] == stg.EVENTS_MAP['PASS']
+        bool_prev_event = df[stg.EVENT_TYPE_COL].shift(1) == previous_event_id
 
-        df_previous_event = df.shift(1)[[stg.EVENT_TYPE_COL]]\
-                              .rename(columns={stg.EVENT_TYPE_COL: PREVIOUS_EVENT})
-
-        with_prev_event = df.merge(right=df_previous_event, right_index=True,
-                                   left_index=True, how='inner')
-
-        with_prev_event['bool_event'] = with_prev_event[stg.EVENT_TYPE_COL] == stg.EVENTS_MAP['PASS']
-        with_prev_event['bool_prev_event'] = with_prev_event[PREVIOUS_EVENT] == previous_event_id
-        with_prev_event[colname] = with_prev_event['bool_event'] & with_prev_event['bool_prev_event']
-
-        df_nb = self._count_number_by_player_and_col(df=with_prev_event,
+        df_nb = self._count_number_by_player_and_col(df=df.assign(**{colname: bool_event & bool_prev_event}),
                                                      column=colname)
         return df_nb
 
@@ -429,7 +450,7 @@ class StatsGameAnalyzer():
                                                 list_event_type_id=list_event_type_id)
 
         df_success = df.query('{} in {}'.format(stg.EVENT_TYPE_COL, list_event_type_id))\
-                       .query('{} == "1"'.format(stg.OUTCOME_COL))\
+                       .query('{} == 1'.format(stg.OUTCOME_COL))\
                        .groupby(by=[agg_column, stg.EVENT_TYPE_COL])\
                        .agg({stg.EVENT_TYPE_COL: 'count'})\
                        .rename(columns={stg.EVENT_TYPE_COL: 'success'})\
@@ -447,15 +468,66 @@ class StatsGameAnalyzer():
 
         return df_stats
 
-    def _fillna_game_data_and_convert_types(self, **kwargs):
-        game_data = Game(**kwargs).clean_game_data()\
-                                  .fillna(value={stg.KEYPASS_COL: '0',
-                                                 stg.ASSIST_COL: '0',
-                                                 '{}_{}'.format(stg.QUALIFIER_COL, stg.QUALIFIER_MAP['ZONE']): 'no_position'})\
-                                  .assign(**{stg.KEYPASS_COL: lambda x: x[stg.KEYPASS_COL].apply(int),
-                                             stg.ASSIST_COL: lambda x: x[stg.ASSIST_COL].apply(int)})
+    def _get_game_events_with_player(self, game=None, event_store=None, **kwargs):
+        game_data = load_clean_game_data(event_store=event_store, **kwargs) if game is None else game
+
+        return game_data[game_data[stg.PLAYER_COL] != stg.MISSING_PLAYER_ID].dropna().reset_index(drop=True)
 
-        return game_data.dropna().reset_index(drop=True)
+
+def load_clean_game_data(event_store=None, **kwargs):
+    """Get cleaned game events from event store if provided, from XML file otherwise.
+
+    Parameters
+    ----------
+    event_store: code_.infrastructure.event_store.EventStore, default None
+    kwargs: arguments to init code_.infrastructure.game.Game
+
+    Returns
+    -------
+    clean_data: pandas.DataFrame
+        Output of code_.infrastructure.game.Game.clean_game_data()
+
+    """
+    if event_store is not None:
+        return event_store.read_game(**kwargs)
+    return Game(**kwargs).clean_game_data()
+
+
+def build_game_stats_eligible_players(filename, event_store=None, **kwargs):
+    """Compute stats of eligible players on sliding windows of a game.
+
+    Parameters
+    ----------
+    filename: string
+    event_store: code_.infrastructure.event_store.EventStore, default None
+    kwargs: arguments of StatsGameAnalyzer.build_game_dataset_eligible_players()
+
+    Returns
+    -------
+    df_game_stats: pandas.DataFrame
+
+    """
+    return StatsGameAnalyzer(filename=filename, event_store=event_store)\
+        .build_game_dataset_eligible_players(**kwargs)
+
+
+def get_club_ids(game_ids, team_ids):
+    """Get OPTA IDs of clubs from games IDs and binarized teams IDs.
+
+    Parameters
+    ----------
+    game_ids: array-like
+        Values of GAME_ID_COL, as '<home club ID>-<away club ID>'
+    team_ids: array-like
+        Values of TEAM_COL, 1 for home team and 0 for away team
+
+    Returns
+    -------
+    club_ids: numpy.ndarray
+
+    """
+    home_away_ids = np.array([str(game_id).split('-', 1) for game_id in game_ids]).reshape(-1, 2)
+    return np.where(np.asarray(team_ids).astype(int) == 1, home_away_ids[:, 0], home_away_ids[:, 1])
 
 
 if __name__ == '__main__':
@@ -463,5 +535,5 @@ if __name__ == '__main__':
     pl = Players()
     toto = ga._build_dataset_from_bool_columns(df_with_events=ga.game)
     df = ga.build_game_dataset_eligible_players(sliding_interval_min=5,
-                                                list_events_number=['4', '17'],
-                                                list_events_with_success_rate=['1'])
+                                                list_events_number=[4, 17],
+                                                list_events_with_success_rate=[1])
@@ -0,0 +1,46 @@
+from copy import copy, deepcopy
+from sklearn.preprocessing import FunctionTransformer
+
+import numpy as np
+
+
+def is_copy(transformer):
+    """Whether transformer returns its input as is, e.g. FunctionTransformer(copy) of TPOT pipelines."""
+    return isinstance(transformer, FunctionTransformer) and transformer.func in (None, copy, deepcopy) \
+        and not transformer.kw_args
+
+
+def is_columns_selection(transformer):
+    """Whether transformer selects columns, as FunctionTransformer(np.take, indices, axis=1) of pipeline_optimizer."""
+    return isinstance(transformer, FunctionTransformer) and transformer.func is np.take \
+        and transformer.kw_args is not None and set(transformer.kw_args) == {'indices', 'axis'} \
+        and transformer.kw_args['axis'] == 1
+
+
+def read_xgboost_nodes(tree):
+    """Flatten nodes of a tree of xgboost JSON dump, with their depth.
+
+    Parameters
+    ----------
+    tree: dict
+        Root node of a tree, as loaded from Booster.get_dump(dump_format='json')
+
+    Returns
+    -------
+    nodes: list
+        Nodes as dicts, with their children and a 'depth' key
+
+    """
+    nodes, to_read = list(), [(tree, 0)]
+    while to_read:
+        node, depth = to_read.pop()
+        nodes.append(dict(node, depth=depth))
+        to_read.extend((child, depth + 1) for child in node.get('children', []))
+    return nodes
+
+
+def get_xgboost_feature_index(split, feature_names):
+    """Index of feature of a split of xgboost dump, named as in feature_names or 'f<index>'."""
+    if feature_names is not None and split in feature_names:
+        return feature_names.index(split)
+    return int(split.lstrip('f'))
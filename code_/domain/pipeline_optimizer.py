@@ -0,0 +1,258 @@
+from copy import copy
+from sklearn.base import is_classifier
+from sklearn.pipeline import FeatureUnion, Pipeline
+from sklearn.preprocessing import FunctionTransformer
+from sklearn.tree._tree import TREE_LEAF
+
+import json
+import numpy as np
+
+from code_.domain.pipeline_inspection import get_xgboost_feature_index, is_columns_selection, is_copy, \
+    read_xgboost_nodes
+
+
+def optimize_pipeline(pipeline, X):
+    """Rewrite a fitted pipeline into an equivalent one without no-op steps nor duplicate or unused copied columns.
+
+    Pipelines exported by TPOT copy their input several times, e.g. make_union of two
+    FunctionTransformer(copy) before XGBRegressor of Y coordinates, or of FastICA and of a
+    copy before ExtraTreesClassifier of players. Rewrites are:
+    - Steps copying their input as is are removed
+    - Branches of a FeatureUnion directly before final estimator which only copy or select
+      columns are replaced by a single selection of input columns final estimator reads,
+      each column being kept once. If nothing else is left in the union, it is removed and
+      final estimator reads input columns directly
+    Features of final estimator are renumbered accordingly: trees of sklearn are rebuilt
+    with new features, trees of xgboost are kept if their features are left unchanged.
+    Other transformers, e.g. FastICA, are kept as is, so that their outputs are equal.
+
+    Parameters
+    ----------
+    pipeline: sklearn.pipeline.Pipeline
+        Fitted, left unchanged
+    X: pandas.DataFrame
+        Rows predictions of both pipelines are compared on, e.g. a sample of training set
+
+    Returns
+    -------
+    optimized_pipeline: sklearn.pipeline.Pipeline
+        Shares unchanged steps with pipeline
+    rewrites: list
+        Description of every rewrite, empty if pipeline is left unchanged
+
+    Raises
+    ------
+    ValueError
+        If any prediction, or probability for classifiers, differs
+
+    """
+    if not isinstance(pipeline, Pipeline):
+        return pipeline, list()
+
+    steps, rewrites = list(), list()
+    for name, transformer in pipeline.steps[:-1]:
+        if transformer is None or transformer == 'passthrough' or is_copy(transformer):
+            rewrites.append('{} removed: copies its input'.format(name))
+        else:
+            steps.append((name, transformer))
+    final_name, final_estimator = pipeline.steps[-1]
+
+    if steps:
+        Xt = X[:1]
+        for _, transformer in steps[:-1]:
+            Xt = transformer.transform(Xt)
+        last_steps, final_estimator, last_rewrites = _optimize_last_step(
+            name=steps[-1][0], transformer=steps[-1][1], estimator=final_estimator, nb_features=Xt.shape[1],
+            branch_widths=[branch.transform(Xt).shape[1] for _, branch in _get_branches(*steps[-1])])
+        steps, rewrites = steps[:-1] + last_steps, rewrites + last_rewrites
+
+    if not rewrites:
+        return pipeline, rewrites
+    optimized_pipeline = Pipeline(steps=steps + [(final_name, final_estimator)])
+    verify_equal_predictions(pipeline=pipeline, optimized_pipeline=optimized_pipeline, X=X)
+    return optimized_pipeline, rewrites
+
+
+def verify_equal_predictions(pipeline, optimized_pipeline, X):
+    """Check that predictions, and probabilities for classifiers, of both pipelines are equal.
+
+    Raises
+    ------
+    ValueError
+        If any prediction differs
+
+    """
+    outputs = [('predictions', lambda model: model.predict(X))]
+    if is_classifier(pipeline):
+        outputs.append(('probabilities', lambda model: model.predict_proba(X)))
+
+    for output_name, predict in outputs:
+        expected, optimized = np.asarray(predict(pipeline)), np.asarray(predict(optimized_pipeline))
+        if expected.shape != optimized.shape:
+            raise ValueError('Optimized {} have shape {} instead of {}'
+                             .format(output_name, optimized.shape, expected.shape))
+        nb_different_rows = int(np.sum((expected != optimized).reshape(len(expected), -1).any(axis=1)))
+        if nb_different_rows:
+            raise ValueError('Optimized {} differ on {} rows out of {}'
+                             .format(output_name, nb_different_rows, len(expected)))
+
+
+def get_columns_selection(index):
+    """Transformer keeping columns of index, in this order, loaded without code_."""
+    return FunctionTransformer(func=np.take, kw_args={'indices': [int(column) for column in index], 'axis': 1},
+                               validate=True)
+
+
+def get_used_features(estimator):
+    """Indexes of features read by splits of trees of estimator, None if unknown."""
+    if hasattr(estimator, 'tree_') or hasattr(estimator, 'estimators_'):
+        trees = [estimator.tree_] if hasattr(estimator, 'tree_') \
+            else [tree_estimator.tree_ for tree_estimator in np.ravel(estimator.estimators_)]
+        return np.unique(np.concatenate([tree.feature[tree.children_left != TREE_LEAF] for tree in trees]))
+
+    if hasattr(estimator, 'get_booster'):
+        booster = estimator.get_booster()
+        return np.unique([get_xgboost_feature_index(node['split'], booster.feature_names)
+                          for tree_dump in booster.get_dump(dump_format='json')
+                          for node in read_xgboost_nodes(tree=json.loads(tree_dump)) if 'split' in node]
+                         ).astype(int)
+    return None
+
+
+# Last transformer
+def _optimize_last_step(name, transformer, estimator, nb_features, branch_widths):
+    """Steps replacing last transformer and final estimator reading their outputs, with rewrites done."""
+    used_features = get_used_features(estimator)
+    if used_features is None or (isinstance(transformer, FeatureUnion) and transformer.transformer_weights):
+        return [(name, transformer)], estimator, list()
+
+    # Source of every output column: column of input if copied, else own column of a branch
+    branches = _get_branches(name=name, transformer=transformer)
+    sources, kept_branches, selection_position = list(), list(), None
+    for (branch_name, branch), width in zip(branches, branch_widths):
+        index = _get_selected_columns(transformer=branch, nb_features=nb_features)
+        if index is None:
+            sources.extend((branch_name, column) for column in range(width))
+            kept_branches.append((branch_name, branch, width))
+        else:
+            sources.extend(('input', column) for column in index)
+            selection_position = len(kept_branches) if selection_position is None else selection_position
+    if selection_position is None:
+        return [(name, transformer)], estimator, list()
+
+    # Copied columns are selected once, in place of first branch copying them
+    selected_columns = sorted({sources[feature][1] for feature in used_features if sources[feature][0] == 'input'})
+    is_selection_removed = not kept_branches
+    if selected_columns and not is_selection_removed:
+        kept_branches.insert(selection_position, ('columnsselection', get_columns_selection(selected_columns),
+                                                  len(selected_columns)))
+
+    new_positions, nb_new_features = dict(), 0
+    for branch_name, _, width in kept_branches:
+        columns = selected_columns if branch_name == 'columnsselection' else range(width)
+        source = 'input' if branch_name == 'columnsselection' else branch_name
+        new_positions.update({(source, column): nb_new_features + position for position, column in enumerate(columns)})
+        nb_new_features += width
+    if is_selection_removed:
+        new_positions, nb_new_features = {('input', column): column for column in selected_columns}, nb_features
+
+    mapping = np.full(len(sources), -1)
+    mapping[used_features] = [new_positions[sources[feature]] for feature in used_features]
+    if nb_new_features == len(sources) and np.array_equal(mapping[used_features], used_features):
+        return [(name, transformer)], estimator, list()
+
+    remapped_estimator = _remap_features(estimator=estimator, mapping=mapping, nb_features=nb_new_features)
+    if remapped_estimator is None:
+        return [(name, transformer)], estimator, list()
+
+    rewrites = ['{} outputs {} columns instead of {}, copied columns: {} kept out of {}'
+                .format(name, nb_new_features, len(sources), len(selected_columns),
+                        sum(1 for source in sources if source[0] == 'input'))]
+    if not kept_branches:
+        return list(), remapped_estimator, rewrites
+    if len(kept_branches) == 1:
+        return [(name, kept_branches[0][1])], remapped_estimator, rewrites
+    return [(name, FeatureUnion(transformer_list=[(branch_name, branch) for branch_name, branch, _ in kept_branches],
+                                n_jobs=transformer.n_jobs))], remapped_estimator, rewrites
+
+
+def _get_branches(name, transformer):
+    if isinstance(transformer, FeatureUnion):
+        return [(branch_name, branch) for branch_name, branch in transformer.transformer_list
+                if branch not in (None, 'drop')]
+    return [(name, transformer)]
+
+
+def _get_selected_columns(transformer, nb_features):
+    """Input column of every output column of a transformer only copying or selecting columns, else None."""
+    if transformer is None or transformer == 'passthrough' or is_copy(transformer):
+        return list(range(nb_features))
+    if is_columns_selection(transformer):
+        return list(transformer.kw_args['indices'])
+    if isinstance(transformer, Pipeline):
+        index = list(range(nb_features))
+        for _, sub_transformer in transformer.steps:
+            sub_index = _get_selected_columns(transformer=sub_transformer, nb_features=len(index))
+            if sub_index is None:
+                return None
+            index = [index[column] for column in sub_index]
+        return index
+    if isinstance(transformer, FeatureUnion) and not transformer.transformer_weights:
+        index = list()
+        for _, sub_transformer in _get_branches(name=None, transformer=transformer):
+            sub_index = _get_selected_columns(transformer=sub_transformer, nb_features=nb_features)
+            if sub_index is None:
+                return None
+            index.extend(sub_index)
+        return index
+    return None
+
+
+# Final estimator
+def _remap_features(estimator, mapping, nb_features):
+    """Copy of estimator reading feature mapping[f] instead of feature f, None if it can not be rewritten."""
+    if hasattr(estimator, 'tree_'):
+        remapped_estimator = copy(estimator)
+        remapped_estimator.tree_ = _remap_tree_features(tree=estimator.tree_, mapping=mapping,
+                                                        nb_features=nb_features)
+        _set_nb_features(estimator=remapped_estimator, nb_features=nb_features)
+        return remapped_estimator
+
+    if hasattr(estimator, 'estimators_') and all(hasattr(tree_estimator, 'tree_')
+                                                 for tree_estimator in estimator.estimators_):
+        remapped_estimator = copy(estimator)
+        remapped_estimator.estimators_ = [_remap_features(estimator=tree_estimator, mapping=mapping,
+                                                          nb_features=nb_features)
+                                          for tree_estimator in estimator.estimators_]
+        _set_nb_features(estimator=remapped_estimator, nb_features=nb_features)
+        return remapped_estimator
+
+    # Trees of xgboost can not be rewritten: only unused features after used ones can be removed
+    if hasattr(estimator, 'get_booster'):
+        used_features = np.flatnonzero(mapping >= 0)
+        if not np.array_equal(mapping[used_features], used_features):
+            return None
+        remapped_estimator = copy(estimator)
+        remapped_estimator._Booster = estimator.get_booster().copy()
+        # Names are set from first data predicted, features missing from it being never read
+        remapped_estimator._Booster.feature_names, remapped_estimator._Booster.feature_types = None, None
+        return remapped_estimator
+    return None
+
+
+def _remap_tree_features(tree, mapping, nb_features):
+    tree_class, tree_args, state = tree.__reduce__()
+    nodes = state['nodes'].copy()
+    is_split = nodes['left_child'] != TREE_LEAF
+    nodes['feature'][is_split] = mapping[nodes['feature'][is_split]]
+
+    remapped_tree = tree_class(nb_features, *tree_args[1:])
+    remapped_tree.__setstate__(dict(state, nodes=nodes))
+    return remapped_tree
+
+
+def _set_nb_features(estimator, nb_features):
+    # Checked against data to predict, attribute name depending on sklearn version
+    for attribute in ['n_features_', 'n_features_in_']:
+        if attribute in vars(estimator):
+            setattr(estimator, attribute, nb_features)
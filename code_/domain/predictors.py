@@ -1,13 +1,216 @@
+from copy import copy
 from os.path import join
+from sklearn.base import BaseEstimator, ClassifierMixin, clone
 from sklearn.externals import joblib
+from sklearn.decomposition import FastICA
 from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor, ExtraTreesClassifier
 from xgboost.sklearn import XGBClassifier, XGBRegressor
 from sklearn.neighbors import KNeighborsClassifier
-from sklearn.model_selection import RandomizedSearchCV
+from sklearn.pipeline import Pipeline, make_union
+from sklearn.preprocessing import FunctionTransformer
+from sklearn.tree._tree import TREE_LEAF, TREE_UNDEFINED
+
+import numpy as np
+
+from code_.domain.cached_pipeline import CachedPipeline, make_cached_pipeline
+from code_.domain.resumable_search import ResumableRandomizedSearchCV, SuccessiveHalvingSearchCV
+from code_.domain.team_routing import predict_by_team
+from code_.infrastructure.transformer_cache import TransformerCache
 
 import settings as stg
 
 
+class TeamConditionedClassifier(BaseEstimator, ClassifierMixin):
+    """Classifier routing every row on its team to a sub-model fitted on this team only.
+
+    A player only plays for his club: every sub-model only has to choose among players
+    seen with its club in training set (about 25 classes) instead of all players of the
+    league, so that its leaves are much smaller than those of a single model.
+
+    Attributes
+    ----------
+    estimator: sklearn estimator
+        Cloned and fitted on rows of every team
+    team_column: string, default CLUB_COL in settings
+        Column of X rows are routed on, other columns are features of sub-models
+    estimators_: dict
+        Fitted sub-model by team
+    classes_: numpy.ndarray
+    default_class_: object
+        Most frequent class of training set, predicted for teams unseen at fit
+
+    """
+
+    def __init__(self, estimator=ExtraTreesClassifier(), team_column=stg.CLUB_COL):
+        """Init class."""
+        self.estimator = estimator
+        self.team_column = team_column
+
+    def fit(self, X, y):
+        """Fit a sub-model by team."""
+        X_features, y = X.drop(labels=self.team_column, axis=1), np.asarray(y)
+        self.estimators_ = {team: clone(self.estimator).fit(X_features.iloc[rows], y[rows])
+                            for team, rows in X.groupby(self.team_column).indices.items()}
+
+        self.classes_, counts = np.unique(y, return_counts=True)
+        self.default_class_ = self.classes_[np.argmax(counts)]
+        return self
+
+    def predict(self, X):
+        """Predict every row with sub-model of its team."""
+        return predict_by_team(X=X, team_column=self.team_column, get_team_model=self.estimators_.get,
+                               default_class=self.default_class_)
+
+    def save(self, index_filename=stg.PLAYER_TEAM_MODEL_NAME, submodel_filename=stg.PLAYER_TEAM_SUBMODEL_NAME,
+             directory=stg.MODELS_DIR, compress=0):
+        """Save a file by sub-model, and an index file with names of files by team.
+
+        Index file is a dict, as read by submission, so that a sub-model can be loaded
+        only when a row of its team is predicted.
+
+        Parameters
+        ----------
+        index_filename: string, default PLAYER_TEAM_MODEL_NAME in settings
+        submodel_filename: string, default PLAYER_TEAM_SUBMODEL_NAME in settings
+            Formatted with team
+        directory: string, default MODELS_DIR in settings
+        compress: integer or tuple, default 0
+            Compression of joblib files
+
+        Returns
+        -------
+        filenames: list
+            All files written, index file first
+
+        """
+        index = {'team_column': self.team_column, 'default_class': self.default_class_,
+                 'classes': self.classes_, 'models': dict()}
+        for team, estimator in self.estimators_.items():
+            index['models'][team] = submodel_filename.format(team=team)
+            joblib.dump(estimator, join(directory, index['models'][team]), compress=compress)
+        joblib.dump(index, join(directory, index_filename), compress=compress)
+
+        return [index_filename] + sorted(index['models'].values())
+
+    @classmethod
+    def load(cls, index_filename=stg.PLAYER_TEAM_MODEL_NAME, directory=stg.MODELS_DIR):
+        """Load classifier saved by save(), with all its sub-models."""
+        index = joblib.load(join(directory, index_filename))
+        classifier = cls(estimator=None, team_column=index['team_column'])
+        classifier.estimators_ = {team: joblib.load(join(directory, filename))
+                                  for team, filename in index['models'].items()}
+        classifier.classes_, classifier.default_class_ = index['classes'], index['default_class']
+        return classifier
+
+
+def get_truncated_forest_pipeline(pipeline, nb_trees):
+    """Get pipeline whose final forest only keeps its first trees, without fitting again.
+
+    Parameters
+    ----------
+    pipeline: sklearn.pipeline.Pipeline or fitted forest
+    nb_trees: integer
+
+    Returns
+    -------
+    truncated_pipeline: sklearn.pipeline.Pipeline or fitted forest
+        Shares transformers and trees with pipeline
+
+    """
+    forest = pipeline.steps[-1][1] if isinstance(pipeline, Pipeline) else pipeline
+    truncated_forest = copy(forest)
+    truncated_forest.estimators_ = forest.estimators_[:nb_trees]
+    truncated_forest.n_estimators = len(truncated_forest.estimators_)
+
+    if not isinstance(pipeline, Pipeline):
+        return truncated_forest
+    return Pipeline(steps=pipeline.steps[:-1] + [(pipeline.steps[-1][0], truncated_forest)])
+
+
+def get_pruned_forest_pipeline(pipeline, max_depth):
+    """Get pipeline whose final forest has its trees cut at max_depth, without fitting again.
+
+    Nodes at max_depth become leaves, predicting distribution of training samples reaching
+    them. Nodes below are removed from trees, so that pruned pipeline is smaller when saved.
+
+    Parameters
+    ----------
+    pipeline: sklearn.pipeline.Pipeline or fitted forest
+    max_depth: integer
+
+    Returns
+    -------
+    pruned_pipeline: sklearn.pipeline.Pipeline or fitted forest
+        Shares transformers with pipeline
+
+    """
+    forest = pipeline.steps[-1][1] if isinstance(pipeline, Pipeline) else pipeline
+    pruned_forest = copy(forest)
+    pruned_forest.estimators_ = list()
+    for estimator in forest.estimators_:
+        pruned_estimator = copy(estimator)
+        pruned_estimator.tree_ = _prune_tree(tree=estimator.tree_, max_depth=max_depth)
+        pruned_estimator.max_depth = max_depth
+        pruned_forest.estimators_.append(pruned_estimator)
+    pruned_forest.max_depth = max_depth
+
+    if not isinstance(pipeline, Pipeline):
+        return pruned_forest
+    return Pipeline(steps=pipeline.steps[:-1] + [(pipeline.steps[-1][0], pruned_forest)])
+
+
+def get_derived_forest_pipelines(pipeline, nb_trees_list, max_depths):
+    """Get smaller and shallower pipelines from a fitted one, by pruning and truncating its forest.
+
+    Parameters
+    ----------
+    pipeline: sklearn.pipeline.Pipeline or fitted forest
+    nb_trees_list: list
+    max_depths: list
+
+    Returns
+    -------
+    pipelines: dict
+        Derived pipelines by name, e.g. 'ntree60_depth18'
+
+    """
+    pipelines = dict()
+    for max_depth in max_depths:
+        pruned_pipeline = get_pruned_forest_pipeline(pipeline=pipeline, max_depth=max_depth)
+        for nb_trees in nb_trees_list:
+            pipelines['ntree{}_depth{}'.format(nb_trees, max_depth)] = \
+                get_truncated_forest_pipeline(pipeline=pruned_pipeline, nb_trees=nb_trees)
+    return pipelines
+
+
+def _prune_tree(tree, max_depth):
+    # Nodes of sklearn trees are numbered from root, children after their parent
+    left_children, right_children = tree.children_left, tree.children_right
+    depths = np.full(tree.node_count, max_depth + 1)
+    nodes, depth = np.array([0]), 0
+    while len(nodes) and depth <= max_depth:
+        depths[nodes] = depth
+        nodes = np.concatenate([left_children[nodes], right_children[nodes]])
+        nodes, depth = nodes[nodes != TREE_LEAF], depth + 1
+
+    kept_nodes = np.flatnonzero(depths <= max_depth)
+    new_indexes = np.full(tree.node_count, TREE_LEAF)
+    new_indexes[kept_nodes] = np.arange(len(kept_nodes))
+
+    tree_class, tree_args, state = tree.__reduce__()
+    nodes = state['nodes'][kept_nodes]
+    is_leaf = (nodes['left_child'] == TREE_LEAF) | (depths[kept_nodes] == max_depth)
+    nodes['left_child'] = np.where(is_leaf, TREE_LEAF, new_indexes[nodes['left_child']])
+    nodes['right_child'] = np.where(is_leaf, TREE_LEAF, new_indexes[nodes['right_child']])
+    nodes['feature'][is_leaf] = TREE_UNDEFINED
+    nodes['threshold'][is_leaf] = TREE_UNDEFINED
+
+    pruned_tree = tree_class(*tree_args)
+    pruned_tree.__setstate__(dict(state, max_depth=min(tree.max_depth, max_depth), node_count=len(kept_nodes),
+                                  nodes=nodes, values=state['values'][kept_nodes]))
+    return pruned_tree
+
+
 class Modeler():
     """Predictor for players and for next event.
 
@@ -16,45 +219,60 @@ class Modeler():
 
     Attributes
     ----------
+    model_type: string
     model: sklearn model
     target: string
     features: list
 
     """
 
-    MODEL_DICT = {'knn': KNeighborsClassifier(),
-                  'et_classif': ExtraTreesClassifier(),
-                  'rf_classif': RandomForestClassifier(),
-                  'rf_reg': RandomForestRegressor(),
-                  'xgb_classif': XGBClassifier(),
-                  'xgb_reg': XGBRegressor()}
+    # Functions making a new model, models being only created when used
+    MODEL_DICT = {'knn': KNeighborsClassifier,
+                  'et_classif': ExtraTreesClassifier,
+                  'rf_classif': RandomForestClassifier,
+                  'rf_reg': RandomForestRegressor,
+                  'xgb_classif': XGBClassifier,
+                  'xgb_reg': XGBRegressor,
+                  'team_et_classif': lambda: TeamConditionedClassifier(estimator=ExtraTreesClassifier()),
+                  'ica_et_classif': lambda: make_cached_pipeline(make_union(FastICA(tol=0.85),
+                                                                            FunctionTransformer(copy)),
+                                                                 ExtraTreesClassifier(), cache=TransformerCache())}
 
     def __init__(self, model_type, hyperparameters, target, features):
         """Init class.
 
-        model_type: string, ['knn', et_classif, 'rf_classif', 'rf_reg', 'xgb_classif', 'xgb_reg']
+        model_type: string, ['knn', et_classif, 'rf_classif', 'rf_reg', 'xgb_classif', 'xgb_reg', 'team_et_classif',
+                             'ica_et_classif']
+            Hyperparameters of sub-models of 'team_et_classif' are prefixed by 'estimator__'
+            'ica_et_classif' is player pipeline of 0_main_train_all.py, FastICA being fitted once
+            through TransformerCache for all hyperparameters of its forest, prefixed by
+            'extratreesclassifier__'
         hyperparameters: dict
         target: string
         features: list
 
         """
-        self.model = self.MODEL_DICT[model_type].set_params(**hyperparameters)
+        self.model_type = model_type
+        self.model = self.MODEL_DICT[model_type]().set_params(**hyperparameters)
         self.target = target
         self.features = features
 
     def perform_random_search_cv(self, training_data, param_distributions, score, n_jobs):
         """Perform Random search on hyperparameters.
 
+        Scores of every fold are saved in an EvaluationStore: an interrupted search resumes
+        where it stopped, and candidates already evaluated on same data are not fitted again.
+
         Parameters
         ----------
         param_distributions: dict
-        score: string, ['accuracy', 'l2']
+        score: string, ['accuracy', 'neg_mean_squared_error']
 
         """
-        random_search = RandomizedSearchCV(estimator=self.model,
-                                           param_distributions=param_distributions,
-                                           n_iter=30, scoring=score, cv=3,
-                                           n_jobs=n_jobs)
+        random_search = ResumableRandomizedSearchCV(estimator=self.model,
+                                                    param_distributions=param_distributions,
+                                                    scoring=score, cv=3,
+                                                    n_jobs=n_jobs)
 
         random_search.fit(training_data[self.features], training_data[self.target])
 
@@ -63,6 +281,39 @@ class Modeler():
         self.model = best_estimator
         return self
 
+    def perform_successive_halving_cv(self, training_data, groups, param_distributions, score, n_jobs,
+                                      resource=stg.SUCCESSIVE_HALVING_RESOURCE):
+        """Perform successive halving search on hyperparameters, folds being split by game.
+
+        Candidates are evaluated on growing budgets, only best ones going on to larger ones,
+        see SuccessiveHalvingSearchCV. Scores are saved in an EvaluationStore, as by
+        perform_random_search_cv.
+
+        Parameters
+        ----------
+        training_data: pandas.DataFrame
+        groups: pandas.Series
+            Game of every row of training_data, e.g. its GAME_ID_COL
+        param_distributions: dict
+        score: string, ['accuracy', 'neg_mean_squared_error']
+        n_jobs: integer
+        resource: string, ['games', 'rows', 'trees'], default SUCCESSIVE_HALVING_RESOURCE in settings
+            Number of trees is set by PLAYER_MODEL_TREES_PARAMS of settings for model types
+            whose forest is not the model itself, by 'n_estimators' otherwise
+
+        """
+        if resource == 'trees':
+            resource = stg.PLAYER_MODEL_TREES_PARAMS.get(self.model_type, 'n_estimators')
+        search = SuccessiveHalvingSearchCV(estimator=self.model, param_distributions=param_distributions,
+                                           resource=resource, scoring=score, cv=3, n_jobs=n_jobs)
+
+        search.fit(training_data[self.features], training_data[self.target], groups=groups)
+
+        best_estimator = search.best_estimator_
+        print('Best estimator: {}'.format(best_estimator.get_params()))
+        self.model = best_estimator
+        return self
+
     def fit(self, training_data):
         """Override fit method."""
         X_train = training_data[self.features]
@@ -74,13 +325,19 @@ class Modeler():
         return self
 
     def save_model(self, save_modelname):
-        """Save model."""
-        joblib.dump(self.predictor,
+        """Save model, with a file by sub-model for TeamConditionedClassifier."""
+        if isinstance(self.predictor, TeamConditionedClassifier):
+            self.predictor.save(index_filename=save_modelname)
+            return
+        joblib.dump(self.predictor.get_pipeline() if isinstance(self.predictor, CachedPipeline) else self.predictor,
                     join(stg.MODELS_DIR, save_modelname))
         pass
 
     def load_model(self, save_modelname):
         """Load model."""
+        if isinstance(self.model, TeamConditionedClassifier):
+            self.predictor = TeamConditionedClassifier.load(index_filename=save_modelname)
+            return self
         self.predictor = joblib.load(join(stg.MODELS_DIR, save_modelname))
         return self
 
@@ -0,0 +1,287 @@
+from sklearn.base import clone, is_classifier
+from sklearn.externals.joblib import Parallel, delayed
+from sklearn.metrics import get_scorer
+from sklearn.model_selection import GroupKFold, ParameterSampler, check_cv
+from time import time
+
+import logging
+import numpy as np
+import pandas as pd
+
+from code_.infrastructure.evaluation_store import EvaluationStore, get_context, get_estimator_signature
+
+import settings as stg
+
+
+class ResumableRandomizedSearchCV():
+    """Random search on hyperparameters, every fold of every candidate being evaluated once across runs.
+
+    Same search as sklearn RandomizedSearchCV, except that:
+    - candidates are drawn with a fixed random state, so that every run draws them again
+    - score of every fold is saved in an EvaluationStore as soon as it is evaluated: a
+      search killed in the middle resumes where it stopped, and candidates evaluated by
+      previous searches on same data, e.g. with less iterations, are not fitted again
+
+    Attributes
+    ----------
+    estimator: sklearn estimator
+    param_distributions: dict
+    n_iter: integer
+    scoring: string
+        sklearn scorer, e.g. 'accuracy' or 'neg_mean_squared_error'
+    cv: integer
+        Number of folds, stratified for classifiers
+    n_jobs: integer
+    random_state: integer
+    store: EvaluationStore
+        New store with default settings if None
+    cv_results_: pandas.DataFrame
+        Parameters, mean and standard deviation of scores and fit time by candidate
+    best_params_: dict
+    best_score_: float
+    best_estimator_: sklearn estimator
+        Best candidate fitted on whole data
+
+    """
+
+    def __init__(self, estimator, param_distributions, n_iter=stg.RANDOM_SEARCH_NB_ITER, scoring='accuracy', cv=3,
+                 n_jobs=stg.N_JOBS, random_state=stg.RANDOM_SEARCH_RANDOM_STATE, store=None):
+        """Initialize class."""
+        self.estimator = estimator
+        self.param_distributions = param_distributions
+        self.n_iter = n_iter
+        self.scoring = scoring
+        self.cv = cv
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+        self.store = store
+
+    def fit(self, X, y):
+        """Evaluate candidates not in store yet, then fit best one on whole data.
+
+        Parameters
+        ----------
+        X: pandas.DataFrame
+        y: pandas.Series
+
+        Returns
+        -------
+        self: ResumableRandomizedSearchCV
+
+        """
+        store = EvaluationStore() if self.store is None else self.store
+        context = get_context(X=X, y=y, scoring=self.scoring, cv=self.cv)
+        folds = list(check_cv(self.cv, y, classifier=is_classifier(self.estimator)).split(X, y))
+        candidates = list(ParameterSampler(self.param_distributions, n_iter=self.n_iter,
+                                           random_state=self.random_state))
+        signatures = [get_estimator_signature(clone(self.estimator).set_params(**params)) for params in candidates]
+
+        scores, fit_times = np.full((len(candidates), len(folds)), np.nan), \
+            np.full((len(candidates), len(folds)), np.nan)
+        to_evaluate = list()
+        for candidate, signature in enumerate(signatures):
+            for fold in range(len(folds)):
+                entry = store.get(context=context, candidate=signature, fold=fold)
+                if entry is None:
+                    to_evaluate.append((candidate, fold))
+                else:
+                    scores[candidate, fold], fit_times[candidate, fold] = entry['score'], entry['fit_time']
+        logging.info('.. Random search - {}'.format(store.get_report()))
+
+        evaluations = Parallel(n_jobs=self.n_jobs)(
+            delayed(_fit_and_score_fold)(estimator=clone(self.estimator).set_params(**candidates[candidate]),
+                                         X=X, y=y, train=folds[fold][0], test=folds[fold][1], scoring=self.scoring,
+                                         store=store, context=context, candidate=signatures[candidate], fold=fold)
+            for candidate, fold in to_evaluate)
+        for (candidate, fold), (score, fit_time) in zip(to_evaluate, evaluations):
+            scores[candidate, fold], fit_times[candidate, fold] = score, fit_time
+        # Evaluations saved by workers
+        store.reload()
+
+        self.cv_results_ = pd.DataFrame({'params': candidates, 'mean_test_score': scores.mean(axis=1),
+                                         'std_test_score': scores.std(axis=1),
+                                         'mean_fit_time': np.nanmean(fit_times, axis=1)})
+        self.cv_results_['rank_test_score'] = self.cv_results_['mean_test_score']\
+            .rank(ascending=False, method='min').astype(int)
+        best_candidate = int(np.argmax(self.cv_results_['mean_test_score'].values))
+        self.best_params_ = candidates[best_candidate]
+        self.best_score_ = self.cv_results_['mean_test_score'].iloc[best_candidate]
+        self.best_estimator_ = clone(self.estimator).set_params(**self.best_params_).fit(X, y)
+        return self
+
+
+class SuccessiveHalvingSearchCV():
+    """Search on hyperparameters evaluating candidates on growing budgets, only best ones going on to larger ones.
+
+    Candidates are drawn as by ResumableRandomizedSearchCV, then evaluated in rungs: every
+    rung cross-validates remaining candidates with a budget factor times larger than
+    previous rung, and keeps best 1 / factor of them for next rung. Last rung has whole
+    budget. Budget, depending on resource, is a share of:
+    - 'games': games of training folds, all rows of a kept game being kept
+    - 'rows': rows of training folds
+    - name of a parameter, e.g. 'n_estimators': value of this parameter for a candidate
+    Smaller training sets are drawn once by fold, those of a rung being included in those of
+    next one. Folds are split by group, e.g. game, so that windows of a game are never in
+    both training and validation sets. Evaluations of a rung are run in parallel and saved
+    in an EvaluationStore, as by ResumableRandomizedSearchCV.
+
+    Attributes
+    ----------
+    estimator: sklearn estimator
+    param_distributions: dict
+    resource: string
+        'games', 'rows' or name of an integer parameter of estimator
+    n_candidates: integer
+        Candidates of first rung
+    factor: integer
+        Growth of budget and reduction of candidates from a rung to next one
+    scoring: string
+        sklearn scorer, e.g. 'accuracy' or 'neg_mean_squared_error'
+    cv: integer
+        Number of folds, split by group
+    n_jobs: integer
+    random_state: integer
+    store: EvaluationStore
+        New store with default settings if None
+    rungs_: pandas.DataFrame
+        Rung, budget, candidate, parameters and mean score of every evaluated candidate
+    best_params_: dict
+    best_score_: float
+        Mean score of best candidate on last rung
+    best_estimator_: sklearn estimator
+        Best candidate fitted on whole data
+
+    """
+
+    def __init__(self, estimator, param_distributions, resource='games',
+                 n_candidates=stg.SUCCESSIVE_HALVING_NB_CANDIDATES, factor=stg.SUCCESSIVE_HALVING_FACTOR,
+                 scoring='accuracy', cv=3, n_jobs=stg.N_JOBS, random_state=stg.RANDOM_SEARCH_RANDOM_STATE,
+                 store=None):
+        """Initialize class."""
+        self.estimator = estimator
+        self.param_distributions = param_distributions
+        self.resource = resource
+        self.n_candidates = n_candidates
+        self.factor = factor
+        self.scoring = scoring
+        self.cv = cv
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+        self.store = store
+
+    def fit(self, X, y, groups):
+        """Evaluate candidates rung by rung, then fit best one on whole data.
+
+        Parameters
+        ----------
+        X: pandas.DataFrame
+        y: pandas.Series
+        groups: pandas.Series
+            Group of every row, e.g. game
+
+        Returns
+        -------
+        self: SuccessiveHalvingSearchCV
+
+        Raises
+        ------
+        ValueError
+            If resource is neither 'games', 'rows' nor a parameter of estimator
+
+        """
+        if self.resource not in ['games', 'rows'] and self.resource not in self.estimator.get_params():
+            raise ValueError('Resource {} is neither games, rows nor a parameter of {}'
+                             .format(self.resource, type(self.estimator).__name__))
+
+        store = EvaluationStore() if self.store is None else self.store
+        groups = np.asarray(groups)
+        context = get_context(X=X, y=y, scoring=self.scoring, cv='GroupKFold{}'.format(self.cv), groups=groups)
+        folds = list(GroupKFold(n_splits=self.cv).split(X, y, groups))
+        candidates = list(ParameterSampler(self.param_distributions, n_iter=self.n_candidates,
+                                           random_state=self.random_state))
+        # Training rows of first ranks make smaller budgets, each being included in larger ones
+        train_ranks = [self._get_train_ranks(train=train, groups=groups, fold=fold)
+                       for fold, (train, _) in enumerate(folds)]
+
+        nb_rungs = 1 + int(np.floor(np.log(len(candidates)) / np.log(self.factor) + 1e-9))
+        remaining, rungs = list(range(len(candidates))), list()
+        for rung in range(nb_rungs):
+            budget = float(self.factor) ** (rung - nb_rungs + 1)
+            scores = self._evaluate_rung(candidates=[candidates[candidate] for candidate in remaining],
+                                         budget=budget, X=X, y=y, folds=folds, train_ranks=train_ranks,
+                                         store=store, context=context)
+            rungs.extend({'rung': rung, 'budget': budget, 'candidate': candidate, 'params': candidates[candidate],
+                          'mean_test_score': score} for candidate, score in zip(remaining, scores))
+            order = np.argsort(-scores, kind='mergesort')
+            logging.info('.. Rung {} - {} candidates on {:.1%} of {} - best score {:.4f}'
+                         .format(rung, len(remaining), budget, self.resource, scores[order[0]]))
+            if rung < nb_rungs - 1:
+                remaining = [remaining[position] for position in order[:int(np.ceil(len(remaining) / self.factor))]]
+        logging.info('.. Successive halving - {}'.format(store.get_report()))
+
+        self.rungs_ = pd.DataFrame(rungs)
+        self.best_params_ = candidates[remaining[order[0]]]
+        self.best_score_ = scores[order[0]]
+        self.best_estimator_ = self._get_estimator(params=self.best_params_, budget=1.).fit(X, y)
+        return self
+
+    def _evaluate_rung(self, candidates, budget, X, y, folds, train_ranks, store, context):
+        """Mean score over folds of every candidate on budget, evaluating those not in store."""
+        estimators = [self._get_estimator(params=params, budget=budget) for params in candidates]
+        signatures = [get_estimator_signature(estimator) for estimator in estimators]
+        # Budget on parameter is already in signature
+        is_data_budget = self.resource in ['games', 'rows']
+        fold_keys = ['{}_{}{:.6g}'.format(fold, self.resource, budget) if is_data_budget and budget < 1. else fold
+                     for fold in range(len(folds))]
+        trains = [self._get_budget_train(train=train, train_ranks=ranks, budget=budget) if is_data_budget else train
+                  for ranks, (train, _) in zip(train_ranks, folds)]
+
+        scores, to_evaluate = np.full((len(candidates), len(folds)), np.nan), list()
+        for candidate, signature in enumerate(signatures):
+            for fold, fold_key in enumerate(fold_keys):
+                entry = store.get(context=context, candidate=signature, fold=fold_key)
+                if entry is None:
+                    to_evaluate.append((candidate, fold))
+                else:
+                    scores[candidate, fold] = entry['score']
+
+        evaluations = Parallel(n_jobs=self.n_jobs)(
+            delayed(_fit_and_score_fold)(estimator=clone(estimators[candidate]), X=X, y=y, train=trains[fold],
+                                         test=folds[fold][1], scoring=self.scoring, store=store, context=context,
+                                         candidate=signatures[candidate], fold=fold_keys[fold])
+            for candidate, fold in to_evaluate)
+        for (candidate, fold), (score, _) in zip(to_evaluate, evaluations):
+            scores[candidate, fold] = score
+        # Evaluations saved by workers
+        store.reload()
+        return scores.mean(axis=1)
+
+    def _get_estimator(self, params, budget):
+        estimator = clone(self.estimator).set_params(**params)
+        if self.resource not in ['games', 'rows']:
+            value = estimator.get_params()[self.resource]
+            estimator.set_params(**{self.resource: max(1, int(round(value * budget)))})
+        return estimator
+
+    def _get_train_ranks(self, train, groups, fold):
+        """Rank of every training row of fold in drawing order, rows of a game sharing rank for resource games."""
+        random_state = np.random.RandomState(None if self.random_state is None else self.random_state + fold)
+        if self.resource != 'games':
+            return random_state.permutation(len(train))
+        games = random_state.permutation(pd.unique(groups[train]))
+        return pd.Series(np.arange(len(games)), index=games)[groups[train]].values
+
+    @staticmethod
+    def _get_budget_train(train, train_ranks, budget):
+        """Training rows of fold of first ranks, their share of ranks being budget."""
+        nb_ranks = train_ranks.max() + 1
+        return train[train_ranks < max(1, int(np.ceil(budget * nb_ranks)))]
+
+
+def _fit_and_score_fold(estimator, X, y, train, test, scoring, store, context, candidate, fold):
+    start = time()
+    estimator.fit(X.iloc[train], y.iloc[train])
+    score = get_scorer(scoring)(estimator, X.iloc[test], y.iloc[test])
+    fit_time = time() - start
+    store.put(context=context, candidate=candidate, fold=fold, score=score, fit_time=fit_time)
+    return score, fit_time
@@ -0,0 +1,98 @@
+from deap import creator
+from time import time
+from tpot import TPOTClassifier, TPOTRegressor
+
+import logging
+import numpy as np
+
+from code_.infrastructure.evaluation_store import EvaluationStore, get_context
+
+
+class _ResumableTPOTMixin():
+    """TPOT whose evaluated pipelines are saved at every generation and found back by next runs on same data.
+
+    Every pipeline is saved in an EvaluationStore with its internal cross-validation score
+    once its generation is evaluated. A new run on same data, scoring and folds, e.g. after
+    TPOT was killed, does not evaluate these pipelines again, and starts from the best of
+    them instead of a random population.
+
+    """
+
+    def __init__(self, evaluation_store=None, **tpot_params):
+        """Initialize class.
+
+        Parameters
+        ----------
+        evaluation_store: EvaluationStore, default None
+            New store with default settings if None
+        tpot_params:
+            Parameters of TPOT, e.g. PLAYER_TPOT_HYPERPARAMS in settings
+
+        """
+        self.evaluation_store = evaluation_store
+        super(_ResumableTPOTMixin, self).__init__(**tpot_params)
+
+    def fit(self, features, target, sample_weight=None, groups=None):
+        """Fit TPOT, reusing and saving evaluations of pipelines, then log hit rate of store."""
+        self._store = EvaluationStore() if self.evaluation_store is None else self.evaluation_store
+        self._context = get_context(X=features, y=target, scoring=self.scoring, cv=self.cv)
+        self._stored_evaluations = {candidate: entry for (candidate, _), entry
+                                    in self._store.get_context_entries(context=self._context).items()}
+        self._unused_evaluations = set(self._stored_evaluations)
+        logging.info('.. TPOT - {} pipelines already evaluated on same data'.format(len(self._stored_evaluations)))
+
+        super(_ResumableTPOTMixin, self).fit(features, target, sample_weight=sample_weight, groups=groups)
+        logging.info('.. TPOT - {}'.format(self._store.get_report()))
+        return self
+
+    def _fit_init(self):
+        super(_ResumableTPOTMixin, self)._fit_init()
+        self.evaluated_individuals_.update({individual_str: entry['info']
+                                            for individual_str, entry in self._stored_evaluations.items()})
+        if not self._pop:
+            self._pop = self._get_stored_population()
+
+    def _get_stored_population(self):
+        """Best pipelines evaluated by previous runs, completed with random pipelines up to population_size."""
+        ranked_evaluations = sorted([(entry['score'], individual_str)
+                                     for individual_str, entry in self._stored_evaluations.items()
+                                     if np.isfinite(entry['score'])], reverse=True)
+        population = list()
+        for _, individual_str in ranked_evaluations[:self.population_size]:
+            try:
+                population.append(creator.Individual.from_string(individual_str, self._pset))
+            except (KeyError, NameError, SyntaxError, TypeError, ValueError):
+                # Operator not in configuration of this run
+                continue
+        if population:
+            population.extend(self._toolbox.population(n=self.population_size - len(population)))
+        return population
+
+    def _preprocess_individuals(self, individuals):
+        for individual_str in {str(individual) for individual in individuals} & self._unused_evaluations:
+            self._store.nb_hits += 1
+            self._store.saved_time += self._stored_evaluations[individual_str]['fit_time'] or 0.
+            self._unused_evaluations.discard(individual_str)
+        self._generation_start = time()
+
+        preprocessed_individuals = super(_ResumableTPOTMixin, self)._preprocess_individuals(individuals)
+        self._store.nb_misses += len(preprocessed_individuals[1])
+        return preprocessed_individuals
+
+    def _update_evaluated_individuals_(self, result_score_list, eval_individuals_str, operator_counts, stats_dicts):
+        super(_ResumableTPOTMixin, self)._update_evaluated_individuals_(result_score_list, eval_individuals_str,
+                                                                        operator_counts, stats_dicts)
+        # Pipelines of a generation are evaluated together: fit time of each is estimated from total
+        fit_time = (time() - self._generation_start) * self._n_jobs / max(len(eval_individuals_str), 1)
+        for individual_str in eval_individuals_str[:len(result_score_list)]:
+            evaluation = self.evaluated_individuals_[individual_str]
+            self._store.put(context=self._context, candidate=individual_str, fold='all',
+                            score=evaluation['internal_cv_score'], fit_time=fit_time, info=evaluation)
+
+
+class ResumableTPOTClassifier(_ResumableTPOTMixin, TPOTClassifier):
+    """TPOTClassifier resuming from evaluations of previous runs, see _ResumableTPOTMixin."""
+
+
+class ResumableTPOTRegressor(_ResumableTPOTMixin, TPOTRegressor):
+    """TPOTRegressor resuming from evaluations of previous runs, see _ResumableTPOTMixin."""
@@ -0,0 +1,122 @@
+from sklearn.externals.joblib import load
+
+import numpy as np
+import threading
+
+import settings as stg
+
+
+def predict_by_team(X, team_column, get_team_model, default_class):
+    """Predict rows of every team with its model.
+
+    Parameters
+    ----------
+    X: pandas.DataFrame
+        Features and team_column
+    team_column: string
+    get_team_model: function
+        Returns fitted model of a team, None if team has no model
+    default_class: object
+        Prediction for rows of teams without model
+
+    Returns
+    -------
+    y_pred: numpy.ndarray
+
+    """
+    X_features = X.drop(labels=team_column, axis=1)
+    y_pred = np.full(len(X), default_class)
+    for team, rows in X.groupby(team_column).indices.items():
+        team_model = get_team_model(team)
+        if team_model is not None:
+            y_pred[rows] = team_model.predict(X_features.iloc[rows])
+    return y_pred
+
+
+class TeamPlayerModel():
+    """Player model with a sub-model by club, every sub-model being loaded when first used.
+
+    Reads files saved by predictors.TeamConditionedClassifier.save(): an index with names
+    of sub-models files by club, and a small model by club choosing among players of this
+    club only. Predicting a test set only loads sub-model of club of player to predict.
+
+    Attributes
+    ----------
+    team_column: string
+        Column of X rows are routed on, CLUB_COL in settings
+    default_class: integer
+        Prediction for clubs without sub-model
+    models_filenames: dict
+        Name of file of sub-model by club
+    load_function: function
+        Loads a model from its filename
+
+    """
+
+    def __init__(self, index_filename=stg.PLAYER_TEAM_MODEL_NAME, load_function=load):
+        """Initialize class, loading index only.
+
+        Parameters
+        ----------
+        index_filename: string, default PLAYER_TEAM_MODEL_NAME in settings
+        load_function: function, default joblib load
+            e.g. main_psgx.load_model to use compiled or memory mapped versions of sub-models
+
+        """
+        index = load_function(index_filename)
+        self.team_column, self.default_class = index['team_column'], index['default_class']
+        self.models_filenames = index['models']
+        self.load_function = load_function
+
+        self._models = dict()
+        self._lock = threading.Lock()
+
+    def predict(self, X):
+        """Predict every row with sub-model of its club, see predict_by_team().
+
+        Parameters
+        ----------
+        X: pandas.DataFrame
+            Features of sub-models, in order of training set, and team_column
+
+        Returns
+        -------
+        y_pred: numpy.ndarray
+
+        """
+        return predict_by_team(X=X, team_column=self.team_column, get_team_model=self.get_team_model,
+                               default_class=self.default_class)
+
+    def get_team_model(self, team):
+        """Get sub-model of a club, loading it if not loaded yet.
+
+        Parameters
+        ----------
+        team: string
+            OPTA ID of club
+
+        Returns
+        -------
+        model: object
+            None if club has no sub-model
+
+        """
+        if team not in self.models_filenames:
+            return None
+
+        with self._lock:
+            if team not in self._models:
+                self._models[team] = self.load_function(self.models_filenames[team])
+        return self._models[team]
+
+    def load_all(self):
+        """Load sub-models of all clubs, e.g. before forking workers sharing them.
+
+        Returns
+        -------
+        self: TeamPlayerModel
+
+        """
+        for team in self.models_filenames:
+            self.get_team_model(team=team)
+        return self
@@ -0,0 +1,212 @@
+from collections import OrderedDict
+from os.path import basename, splitext
+import logging
+import numpy as np
+import pandas as pd
+
+import settings as stg
+
+if __name__ == '__main__':
+    stg.enable_logging(log_filename='{}.log'.format(splitext(basename(__file__))[0]),
+                       logging_level=logging.DEBUG)
+
+
+class GameWindowStats():
+    """Players and teams stats of a game on sliding time windows.
+
+    Counts needed by all stats (events by type, successful events, keypass, assist, zones...)
+    are accumulated once along events sorted by period and time, separately for every player
+    of the game. Counts within a window are the difference of these prefix sums at window
+    bounds, found with a binary search on time, so that windows length and stride are free.
+    Passes following a foul or a corner depend on previous event in file, they are few and
+    counted directly when both events are within window.
+
+    Attributes
+    ----------
+    game: pandas.DataFrame
+        Events with players, sorted by period and time
+    list_events_number: list
+        Event types ID for which number of events are computed
+    list_events_with_success_rate: list
+        Event types ID for which number of events and success rate are computed
+    zones: list
+        Zones for which percentage of player positions are computed
+    players: pandas.DataFrame
+        Game, player and team of every player in game
+    counts: dict
+        Cumulative counts by player, arrays of shape (nb events + 1, nb players) by count name
+    passes_after_event: dict
+        Player index, time key and previous event time key of passes after foul or corner
+
+    """
+
+    NB_EVENTS = '__nb_events'
+    NB_ZONE_EVENTS = '__nb_zone_events'
+
+    def __init__(self, game, list_events_number, list_events_with_success_rate, zones=stg.ZONES):
+        """Initialize class.
+
+        Parameters
+        ----------
+        game: pandas.DataFrame
+            Cleaned events with a player, see StatsGameAnalyzer.game
+        list_events_number: list
+        list_events_with_success_rate: list
+        zones: list, default ZONES in settings
+
+        """
+        self.list_events_number = list_events_number
+        self.list_events_with_success_rate = list_events_with_success_rate
+        self.zones = zones
+
+        time_keys = self._get_time_keys(periods=game[stg.PERIOD_COL].values,
+                                        times_in_sec=game[stg.GAME_TIME_COL].values)
+        order = np.argsort(time_keys, kind='mergesort')
+        self.game = game.iloc[order].reset_index(drop=True)
+        self._time_keys = time_keys[order]
+
+        player_keys = [stg.GAME_ID_COL, stg.PLAYER_COL, stg.TEAM_COL]
+        self._player_index = self.game.groupby(by=player_keys, sort=False, observed=True).ngroup().values
+        self.players = self.game[player_keys].drop_duplicates().reset_index(drop=True)
+        self._teams, self._player_team_index = np.unique(self.players[stg.TEAM_COL].values, return_inverse=True)
+
+        self.counts = self._accumulate_counts_by_player(events_counts=self._get_events_counts())
+        self.passes_after_event = self._get_passes_after_event(game=game, time_keys=time_keys,
+                                                               player_index=self._player_index[np.argsort(order)])
+
+    def get_sliding_windows_stats(self, window_length_min, sliding_interval_min, players=None):
+        """Compute stats on every window of both halves.
+
+        Windows start every sliding_interval_min from beginning of each half, the last one
+        ending before PERIOD_LENGTH_MIN.
+
+        Parameters
+        ----------
+        window_length_min: integer
+        sliding_interval_min: integer
+        players: code_.infrastructure.players.PlayerRegistry, default None
+            Players to keep, all players if None
+
+        Returns
+        -------
+        df_stats: pandas.DataFrame
+            Columns: game, player_id, team_id, time_period and stats as in PLAYER_FEATURES
+
+        """
+        windows_stats = [self.get_window_stats(period=period, start_in_min=start,
+                                               window_length_min=window_length_min, players=players)
+                         for period, period_start_min in sorted(stg.PERIODS_START_MIN.items())
+                         for start in range(period_start_min,
+                                            period_start_min + stg.PERIOD_LENGTH_MIN - window_length_min + 1,
+                                            sliding_interval_min)]
+
+        return pd.concat(windows_stats, axis=0, ignore_index=True, sort=False)
+
+    def get_window_stats(self, period, start_in_min, window_length_min, players=None):
+        """Compute stats of players having an event in [start, start + length] minutes of period.
+
+        Parameters
+        ----------
+        period: integer
+        start_in_min: integer
+        window_length_min: integer
+        players: code_.infrastructure.players.PlayerRegistry, default None
+            Players to keep, all players if None
+
+        Returns
+        -------
+        df_stats: pandas.DataFrame
+
+        """
+        first_key = self._get_time_keys(period, 60 * start_in_min)
+        last_key = self._get_time_keys(period, 60 * (start_in_min + window_length_min))
+        first = np.searchsorted(self._time_keys, first_key, side='left')
+        stop = np.searchsorted(self._time_keys, last_key, side='right')
+
+        counts = OrderedDict((name, cumulative[stop] - cumulative[first])
+                             for name, cumulative in self.counts.items())
+        for name, (player_index, keys, previous_keys) in self.passes_after_event.items():
+            in_window = (first_key <= keys) & (keys <= last_key) & (first_key <= previous_keys) & (previous_keys <= last_key)
+            counts[name] = np.bincount(player_index[in_window], minlength=self.players.shape[0])
+
+        in_window = counts[self.NB_EVENTS] > 0
+        if self.players.loc[in_window, stg.PLAYER_COL].duplicated().any():
+            raise AssertionError('Some players belong to both teams.')
+        if players is not None:
+            in_window &= players.isin(self.players[stg.PLAYER_COL].values)
+
+        df_stats = self.players[in_window]\
+                       .assign(time_period='{}-{}'.format(start_in_min, start_in_min + window_length_min))\
+                       .reset_index(drop=True)
+        for name, values in self._compute_stats(counts=counts).items():
+            df_stats[name] = values[in_window]
+        return df_stats
+
+    def _compute_stats(self, counts):
+        team_counts = OrderedDict((name, np.array([values[self._player_team_index == team].sum(axis=0)
+                                                   for team in range(len(self._teams))])[self._player_team_index])
+                                  for name, values in counts.items())
+
+        stats = OrderedDict((name, counts[name]) for name in ['nb_{}'.format(stg.ASSIST_COL), 'nb_{}'.format(stg.KEYPASS_COL),
+                                                              'nb_{}'.format(stg.GK_EVENTS_COL), 'nb_{}'.format(stg.SHOTS_COL),
+                                                              'nb_{}'.format(stg.FREE_KICK_COL), 'nb_{}'.format(stg.CORNER_COL)])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for zone in self.zones:
+                # Zones without any event in window are missing values, as for players without zone
+                zone_pct = 100 * counts[zone] / counts[self.NB_ZONE_EVENTS]
+                stats[zone] = np.where(counts[zone].sum() > 0, zone_pct, np.nan)
+
+            for prefix, agg_counts in [('p', counts), ('t', team_counts)]:
+                for event_id in self.list_events_with_success_rate:
+                    stats['{}_{}_nb'.format(prefix, event_id)] = agg_counts['{}_nb'.format(event_id)]
+                    stats['{}_{}_success_rate'.format(prefix, event_id)] = \
+                        agg_counts['{}_success'.format(event_id)] / agg_counts['{}_nb'.format(event_id)]
+                for event_id in self.list_events_number:
+                    stats['{}_{}_nb'.format(prefix, event_id)] = agg_counts['{}_nb'.format(event_id)]
+        return stats
+
+    def _get_events_counts(self):
+        event_type = self.game[stg.EVENT_TYPE_COL].values
+        zone = self.game[stg.ZONE_COL].astype(str).values
+
+        events_counts = OrderedDict([
+            (self.NB_EVENTS, np.ones(event_type.shape[0])),
+            ('nb_{}'.format(stg.KEYPASS_COL), self.game[stg.KEYPASS_COL].values),
+            ('nb_{}'.format(stg.ASSIST_COL), self.game[stg.ASSIST_COL].values),
+            ('nb_{}'.format(stg.GK_EVENTS_COL), np.isin(event_type, stg.GK_EVENTS)),
+            ('nb_{}'.format(stg.SHOTS_COL), np.isin(event_type, stg.SHOTS_EVENTS)),
+            (self.NB_ZONE_EVENTS, zone != stg.NO_POSITION),
+        ])
+        for zone_name in self.zones:
+            events_counts[zone_name] = zone == zone_name
+        for event_id in self.list_events_with_success_rate + self.list_events_number:
+            events_counts['{}_nb'.format(event_id)] = event_type == event_id
+        for event_id in self.list_events_with_success_rate:
+            events_counts['{}_success'.format(event_id)] = (event_type == event_id) & (self.game[stg.OUTCOME_COL].values == 1)
+
+        return events_counts
+
+    def _accumulate_counts_by_player(self, events_counts):
+        nb_events, nb_players = self._player_index.shape[0], self.players.shape[0]
+        counts = OrderedDict()
+
+        for name, values in events_counts.items():
+            by_player = np.zeros((nb_events + 1, nb_players), dtype=np.int32)
+            by_player[np.arange(1, nb_events + 1), self._player_index] = values
+            counts[name] = by_player.cumsum(axis=0, dtype=np.int32)
+        return counts
+
+    def _get_passes_after_event(self, game, time_keys, player_index):
+        event_type = game[stg.EVENT_TYPE_COL].values
+        is_pass = np.concatenate([[False], event_type[1:] == stg.EVENTS_MAP['PASS']])
+        passes_after_event = OrderedDict()
+
+        for name, previous_event_id in [('nb_{}'.format(stg.FREE_KICK_COL), stg.EVENTS_MAP['FOUL']),
+                                        ('nb_{}'.format(stg.CORNER_COL), stg.EVENTS_MAP['CORNER_AWARDED'])]:
+            rows = np.flatnonzero(is_pass & (np.concatenate([[-1], event_type[:-1]]) == previous_event_id))
+            passes_after_event[name] = (player_index[rows], time_keys[rows], time_keys[rows - 1])
+        return passes_after_event
+
+    def _get_time_keys(self, periods, times_in_sec):
+        # Single sorted key on (period, time) for binary search
+        return np.asarray(periods, dtype=np.int64) * 10 ** 6 + np.asarray(times_in_sec, dtype=np.int64)
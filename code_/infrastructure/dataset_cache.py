@@ -0,0 +1,256 @@
+from collections import OrderedDict
+from os.path import isfile, join, splitext
+
+import hashlib
+import json
+import logging
+import numpy as np
+import os
+import pandas as pd
+
+from code_.infrastructure.frame_arrays import array_names, arrays_to_frame, frame_to_arrays
+import settings as stg
+
+
+class DatasetCache():
+    """Dataset saved by game partitions, recomputed only for games or settings that changed.
+
+    Every partition holds rows built from one game file. A manifest records, for every
+    partition, hash of game file content and hash of settings used to build it, so that
+    partitions of new or modified files, or built with other settings, are stale.
+    Partitions are numpy archives read only when and for the columns requested.
+
+    Attributes
+    ----------
+    cache_dir: string
+    settings_hash: string
+        Hash of settings the dataset is built with
+    manifest: dict
+        Content hash, settings hash and columns schema by game filename
+
+    """
+
+    MANIFEST_FILENAME = 'manifest.json'
+
+    def __init__(self, cache_dir, dataset_settings):
+        """Initialize class.
+
+        Parameters
+        ----------
+        cache_dir: string
+            Folder containing manifest and partitions files
+        dataset_settings: dict
+            All parameters dataset depends on, must be serializable in JSON
+
+        """
+        self.cache_dir = cache_dir
+        self.settings_hash = hash_settings(dataset_settings=dataset_settings)
+        self.manifest = self._read_manifest()
+
+    def get_stale_files(self, filenames, games_dir=stg.GAMES_DIR, content_hashes=None):
+        """List games whose partition is missing or out of date.
+
+        Parameters
+        ----------
+        filenames: list
+        games_dir: string, default GAMES_DIR in settings
+        content_hashes: dict, default None
+            Hash of content of games files by filename, files of games_dir being hashed if None
+
+        Returns
+        -------
+        stale_files: list
+
+        """
+        stale_files = list()
+        for filename in filenames:
+            partition = self.manifest.get(filename)
+            content_hash = hash_file(join(games_dir, filename)) if content_hashes is None else content_hashes[filename]
+            if partition is None \
+                    or partition['settings_hash'] != self.settings_hash \
+                    or partition['content_hash'] != content_hash:
+                stale_files.append(filename)
+        return stale_files
+
+    def write(self, partitions, games_dir=stg.GAMES_DIR, content_hashes=None):
+        """Save partitions and record them in manifest, removing partitions of games no longer in games_dir.
+
+        Parameters
+        ----------
+        partitions: dict
+            pandas.DataFrame by game filename
+        games_dir: string, default GAMES_DIR in settings
+        content_hashes: dict, default None
+            Hash of content of games files by filename, files of games_dir being hashed if None
+
+        Returns
+        -------
+        self: DatasetCache
+
+        """
+        content_hashes = hash_games_files(games_dir=games_dir) if content_hashes is None else content_hashes
+        os.makedirs(self.cache_dir, exist_ok=True)
+        for filename, df_partition in partitions.items():
+            arrays, schema = frame_to_arrays(df=df_partition.reset_index(drop=True))
+            np.savez(self._get_partition_path(filename), **arrays)
+            self.manifest[filename] = OrderedDict([('content_hash', content_hashes[filename]),
+                                                   ('settings_hash', self.settings_hash),
+                                                   ('columns', schema)])
+        self._remove_partitions(filenames=[filename for filename in self.manifest if filename not in content_hashes])
+
+        self._write_manifest()
+        logging.debug('Successfully saved {} partitions in {}'.format(len(partitions), self.cache_dir))
+        return self
+
+    def prune(self, filenames):
+        """Remove partitions of games not in filenames, e.g. games removed from GAMES_DIR.
+
+        Parameters
+        ----------
+        filenames: list
+            Games whose partitions are kept
+
+        Returns
+        -------
+        self: DatasetCache
+
+        """
+        removed_files = [filename for filename in self.manifest if filename not in set(filenames)]
+        if removed_files:
+            self._remove_partitions(filenames=removed_files)
+            self._write_manifest()
+        return self
+
+    def get_columns(self, filenames):
+        """List columns of partitions, in order of first appearance.
+
+        Parameters
+        ----------
+        filenames: list
+
+        Returns
+        -------
+        columns: list
+
+        """
+        columns = OrderedDict()
+        for filename in filenames:
+            columns.update((col, None) for col in self.manifest[filename]['columns'])
+        return list(columns)
+
+    def iter_partitions(self, filenames, columns=None):
+        """Read partitions one by one.
+
+        Parameters
+        ----------
+        filenames: list
+        columns: list, default None
+            Columns to read, all columns if None, columns missing from a partition being skipped
+
+        Yields
+        ------
+        filename: string
+        df_partition: pandas.DataFrame
+
+        """
+        for filename in filenames:
+            schema = self.manifest[filename]['columns']
+            columns_schema = OrderedDict((col, schema[col]) for col in (schema if columns is None else columns)
+                                         if col in schema)
+
+            with np.load(self._get_partition_path(filename)) as partition:
+                arrays = {name: partition[name]
+                          for col, col_schema in columns_schema.items()
+                          for name in array_names(column=col, schema=col_schema)}
+            yield filename, arrays_to_frame(arrays=arrays, schema=columns_schema)
+
+    def read(self, filenames, columns=None):
+        """Read partitions of several games into a single DataFrame.
+
+        Only requested columns are read, see iter_partitions() to process partitions one
+        by one instead of holding whole dataset in memory.
+
+        Parameters
+        ----------
+        filenames: list
+        columns: list, default None
+            Columns to read, all columns if None
+
+        Returns
+        -------
+        df: pandas.DataFrame
+            Partitions in filenames order, with new index, missing columns of a partition being NaN
+
+        """
+        columns = self.get_columns(filenames=filenames) if columns is None else columns
+        partitions = [df_partition for _, df_partition in self.iter_partitions(filenames=filenames, columns=columns)]
+        if not partitions:
+            return pd.DataFrame(columns=columns)
+        return pd.concat(partitions, axis=0, ignore_index=True, sort=False).reindex(columns=columns)
+
+    def to_csv(self, filenames, file_path, fill_values=None):
+        """Export partitions of several games in a CSV file, one partition after the other.
+
+        File is the same as read(filenames).to_csv(file_path), without holding whole
+        dataset in memory.
+
+        Parameters
+        ----------
+        filenames: list
+        file_path: string
+        fill_values: dict, default None
+            Value replacing missing values by column, see pandas.DataFrame.fillna()
+
+        """
+        columns = self.get_columns(filenames=filenames)
+        nb_rows = 0
+        with open(file_path, 'w') as file:
+            if not filenames:
+                pd.DataFrame(columns=columns).to_csv(file)
+            for position, (_, df_partition) in enumerate(self.iter_partitions(filenames=filenames)):
+                df_partition = df_partition.reindex(columns=columns).fillna(fill_values or dict())
+                df_partition.index += nb_rows
+                df_partition.to_csv(file, header=position == 0)
+                nb_rows += df_partition.shape[0]
+
+    def _get_partition_path(self, filename):
+        return join(self.cache_dir, '{}.npz'.format(splitext(filename)[0]))
+
+    def _remove_partitions(self, filenames):
+        for filename in filenames:
+            del self.manifest[filename]
+            if isfile(self._get_partition_path(filename)):
+                os.remove(self._get_partition_path(filename))
+        if filenames:
+            logging.debug('Removed {} partitions of games no longer in games folder'.format(len(filenames)))
+
+    def _write_manifest(self):
+        with open(join(self.cache_dir, self.MANIFEST_FILENAME), 'w') as file:
+            json.dump(self.manifest, file)
+
+    def _read_manifest(self):
+        manifest_path = join(self.cache_dir, self.MANIFEST_FILENAME)
+        if not isfile(manifest_path):
+            return OrderedDict()
+
+        with open(manifest_path, 'r') as file:
+            return json.load(file, object_pairs_hook=OrderedDict)
+
+
+def hash_file(file_path):
+    """Compute SHA-1 of file content."""
+    file_hash = hashlib.sha1()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def hash_games_files(games_dir=stg.GAMES_DIR):
+    """Compute SHA-1 of content of every game file of games_dir, by filename in sorted order."""
+    return OrderedDict((filename, hash_file(join(games_dir, filename))) for filename in sorted(os.listdir(games_dir)))
+
+
+def hash_settings(dataset_settings):
+    """Compute SHA-1 of settings, independently of keys order."""
+    return hashlib.sha1(json.dumps(dataset_settings, sort_keys=True, default=str).encode('utf-8')).hexdigest()
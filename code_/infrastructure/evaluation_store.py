@@ -0,0 +1,182 @@
+from os.path import dirname, isfile, join
+from sklearn.base import BaseEstimator
+from sklearn.externals.joblib import hash as joblib_hash
+
+import json
+import logging
+import os
+
+from code_.infrastructure.transformer_cache import TransformerCache
+
+import settings as stg
+
+
+class EvaluationStore():
+    """Scores of candidates of hyperparameters searches, saved as soon as evaluated and reused by next searches.
+
+    An evaluation is found back from:
+    - context: data, scoring and cross-validation of a search, see get_context()
+    - candidate: signature of an unfitted estimator, see get_estimator_signature(), or
+      string of a TPOT pipeline
+    - fold: index of cross-validation fold, 'all' if scores of folds are not available
+    Evaluations are appended to a JSON lines file, one line by evaluation, so that a search
+    killed in the middle keeps what it evaluated, and searches in other processes, e.g.
+    joblib workers, may write to it at the same time. Last evaluation of a key wins.
+
+    Attributes
+    ----------
+    file_path: string
+    nb_hits: integer
+        Evaluations found in store
+    nb_misses: integer
+        Evaluations not found in store, to be computed
+    saved_time: float
+        Time taken by evaluations found in store when computed, in seconds
+
+    """
+
+    def __init__(self, file_path=join(stg.OUTPUTS_DIR, stg.EVALUATION_STORE_FILENAME)):
+        """Initialize class.
+
+        Parameters
+        ----------
+        file_path: string, default EVALUATION_STORE_FILENAME in OUTPUTS_DIR of settings
+
+        """
+        self.file_path = file_path
+        self.nb_hits, self.nb_misses, self.saved_time = 0, 0, 0.
+
+        self._entries = None
+
+    def get(self, context, candidate, fold):
+        """Get evaluation, None if not in store, counting hits and misses.
+
+        Returns
+        -------
+        entry: dict
+            Keys 'score', 'fit_time' in seconds, None if unknown, and 'info'
+
+        """
+        entry = self._get_entries().get((context, candidate, str(fold)))
+        if entry is None:
+            self.nb_misses += 1
+            return None
+        self.nb_hits += 1
+        self.saved_time += entry['fit_time'] or 0.
+        return entry
+
+    def get_context_entries(self, context):
+        """Get all evaluations of a context, by (candidate, fold)."""
+        return {(candidate, fold): entry for (entry_context, candidate, fold), entry in self._get_entries().items()
+                if entry_context == context}
+
+    def put(self, context, candidate, fold, score, fit_time=None, info=None):
+        """Save an evaluation at the end of store file.
+
+        Parameters
+        ----------
+        context: string
+        candidate: string
+        fold: integer or string
+        score: float
+        fit_time: float, default None
+            Time taken to fit and score, in seconds
+        info: dict, default None
+            Serializable to JSON
+
+        Returns
+        -------
+        self: EvaluationStore
+
+        """
+        entry = {'context': context, 'candidate': candidate, 'fold': str(fold), 'score': float(score),
+                 'fit_time': None if fit_time is None else float(fit_time), 'info': info}
+        os.makedirs(dirname(self.file_path), exist_ok=True)
+        # Single write of a whole line, so that lines of concurrent processes are not mixed
+        with open(self.file_path, 'a') as store_file:
+            store_file.write('{}\n'.format(json.dumps(entry)))
+        if self._entries is not None:
+            self._entries[(context, candidate, str(fold))] = entry
+        return self
+
+    def reload(self):
+        """Read store file again, e.g. after evaluations saved by other processes."""
+        self._entries = None
+        return self
+
+    def get_hit_rate(self):
+        """Share of evaluations found in store since creation, 0 if none was looked for."""
+        nb_lookups = self.nb_hits + self.nb_misses
+        return self.nb_hits / nb_lookups if nb_lookups else 0.
+
+    def get_report(self):
+        """Hit rate and compute time saved, to be logged."""
+        return '{} evaluations out of {} found in store ({:.1%}), {:.0f}s of compute saved'\
+            .format(self.nb_hits, self.nb_hits + self.nb_misses, self.get_hit_rate(), self.saved_time)
+
+    def _get_entries(self):
+        if self._entries is not None:
+            return self._entries
+
+        self._entries = dict()
+        if not isfile(self.file_path):
+            return self._entries
+        with open(self.file_path) as store_file:
+            for line in store_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Line cut by a process killed while writing it
+                    logging.debug('Incomplete evaluation skipped in {}'.format(self.file_path))
+                    continue
+                self._entries[(entry['context'], entry['candidate'], entry['fold'])] = entry
+        return self._entries
+
+    def __getstate__(self):
+        # Sent to joblib workers to save evaluations, not to read them
+        state = self.__dict__.copy()
+        state['_entries'] = None
+        return state
+
+
+def get_context(X, y, scoring, cv, groups=None):
+    """Key of data a search is run on, with its scoring and cross-validation.
+
+    Parameters
+    ----------
+    X: pandas.DataFrame
+    y: pandas.Series
+    scoring: string
+    cv: integer or string
+        Number of folds, or description of folds
+    groups: pandas.Series, default None
+        Group of every row folds are split by, e.g. game
+
+    Returns
+    -------
+    context: string
+
+    """
+    return joblib_hash([X, y, scoring, str(cv)] + ([] if groups is None else [groups]))
+
+
+def get_estimator_signature(estimator):
+    """Key of an unfitted estimator, from its class and all its parameters.
+
+    Parameters being estimators, e.g. steps of pipelines, are replaced by their class, their
+    own parameters being already in deep parameters. Transformer caches are left out, as
+    they do not change fitted estimators.
+
+    """
+    params = {name: _get_signature_value(value) for name, value in estimator.get_params(deep=True).items()
+              if not isinstance(value, TransformerCache)}
+    return joblib_hash([type(estimator).__name__, sorted(params.items())])
+
+
+def _get_signature_value(value):
+    # Estimators are also nested in lists of steps of pipelines and unions
+    if isinstance(value, BaseEstimator):
+        return type(value).__name__
+    if isinstance(value, (list, tuple)):
+        return [_get_signature_value(item) for item in value]
+    return value
@@ -0,0 +1,262 @@
+from collections import OrderedDict
+from os.path import isfile, join
+
+import json
+import logging
+import numpy as np
+import os
+import pandas as pd
+
+from code_.infrastructure.dataset_cache import hash_games_files, hash_settings
+from code_.infrastructure.frame_arrays import array_names, arrays_to_frame, frame_to_arrays
+from code_.infrastructure.game import clean_game_file
+from code_.infrastructure.games_ingestion import GamesIngestor
+import settings as stg
+
+if __name__ == '__main__':
+    stg.enable_logging(log_filename='event_store.log')
+
+
+class EventStore():
+    """On-disk columnar store of cleaned events for all games.
+
+    Every column of Game.clean_game_data() is saved as one numpy file, games being
+    concatenated one after the other. An index keeps the schema of columns and the
+    offsets of every game, so that columns are read with memory mapping and only
+    the rows of a requested game are loaded. Index also records hash of content of
+    every game file and hash of cleaning settings, so that update() cleans again only
+    games added or modified since store was written.
+
+    Attributes
+    ----------
+    store_dir: string
+    index: dict
+        Schema of columns, (start, stop) offsets and content hash by game filename,
+        and hash of cleaning settings
+
+    """
+
+    INDEX_FILENAME = 'index.json'
+    ROW_INDEX_COL = '__index__'
+
+    def __init__(self, store_dir=stg.EVENT_STORE_DIR):
+        """Initialize class.
+
+        Parameters
+        ----------
+        store_dir: string
+            Folder containing index and columns files
+
+        """
+        self.store_dir = store_dir
+        self.index = self._read_index()
+        self._mapped_columns = dict()
+
+    def __getstate__(self):
+        # Memory mapped columns are opened again in other processes
+        state = self.__dict__.copy()
+        state['_mapped_columns'] = dict()
+        return state
+
+    @property
+    def filenames(self):
+        """Games filenames in store order."""
+        return sorted(self.index['games'], key=lambda filename: self.index['games'][filename][0])
+
+    def exists(self):
+        """Check a store has already been written in store_dir."""
+        return self.index is not None
+
+    @property
+    def content_hashes(self):
+        """Hash of content of games files cleaned in store, by filename."""
+        return self.index.get('content_hashes', dict()) if self.exists() else dict()
+
+    def update(self, games_dir=stg.GAMES_DIR, n_jobs=stg.INGESTION_N_JOBS, content_hashes=None):
+        """Make store match games files: clean games added or modified since store was written, drop removed ones.
+
+        Games whose content hash is the one recorded in index are read from store instead of
+        being cleaned again. All games are cleaned if store is missing or cleaning settings
+        changed.
+
+        Parameters
+        ----------
+        games_dir: string, default GAMES_DIR in settings
+        n_jobs: integer, default INGESTION_N_JOBS in settings
+            Number of processes cleaning games
+        content_hashes: dict, default None
+            Hash of content of every game file of games_dir, see dataset_cache.hash_games_files(),
+            computed if None
+
+        Returns
+        -------
+        self: EventStore
+
+        """
+        content_hashes = hash_games_files(games_dir=games_dir) if content_hashes is None else content_hashes
+        is_settings_changed = self.exists() and self.index.get('settings_hash') != get_settings_hash()
+        stored_hashes = dict() if is_settings_changed else self.content_hashes
+        changed_files = [filename for filename, content_hash in content_hashes.items()
+                         if stored_hashes.get(filename) != content_hash]
+        removed_files = [filename for filename in stored_hashes if filename not in content_hashes]
+        if self.exists() and not changed_files and not removed_files:
+            return self
+
+        logging.debug('Update event store - {} games added or modified, {} removed..'
+                      .format(len(changed_files), len(removed_files)))
+        clean_games = GamesIngestor(n_jobs=n_jobs).map(clean_game_file, changed_files, games_dir=games_dir)
+        # Games failing to be cleaned are left out, rather than served as previously stored
+        games = [(filename, clean_games[filename] if filename in changed_files else self.read_game(filename=filename))
+                 for filename in content_hashes if filename in clean_games or filename not in changed_files]
+        return self.write(games=games, content_hashes={filename: content_hashes[filename] for filename, _ in games})
+
+    def build(self, games_dir=stg.GAMES_DIR, n_jobs=stg.INGESTION_N_JOBS):
+        """Clean every game of games_dir and write store.
+
+        Parameters
+        ----------
+        games_dir: string
+        n_jobs: integer, default INGESTION_N_JOBS in settings
+            Number of processes cleaning games
+
+        Returns
+        -------
+        self: EventStore
+
+        """
+        logging.debug('Start building event store..')
+        # Hashed before cleaning, so that files modified meanwhile are cleaned again by next update
+        content_hashes = hash_games_files(games_dir=games_dir)
+        clean_games = GamesIngestor(n_jobs=n_jobs).map(clean_game_file, list(content_hashes), games_dir=games_dir)
+
+        return self.write(games=list(clean_games.items()),
+                          content_hashes={filename: content_hashes[filename] for filename in clean_games})
+
+    def write(self, games, content_hashes=None):
+        """Write cleaned games into store, replacing existing content.
+
+        Parameters
+        ----------
+        games: list of tuples (filename, pandas.DataFrame)
+            Output of Game.clean_game_data() by game filename
+        content_hashes: dict, default None
+            Hash of content of every game file, see dataset_cache.hash_file(), games being
+            cleaned again by next update if None
+
+        Returns
+        -------
+        self: EventStore
+
+        """
+        os.makedirs(self.store_dir, exist_ok=True)
+        offsets, start = OrderedDict(), 0
+        for filename, df_game in games:
+            offsets[filename] = (start, start + df_game.shape[0])
+            start += df_game.shape[0]
+
+        df_all = pd.concat([df_game for _, df_game in games], axis=0, sort=False)
+        # Categories differ between games, concatenation falls back to object columns
+        for col in df_all.columns:
+            if any(df_game[col].dtype.name == 'category' for _, df_game in games if col in df_game.columns):
+                df_all[col] = df_all[col].astype('category')
+        df_all[self.ROW_INDEX_COL] = df_all.index.values.astype(np.int64)
+        arrays, schema = frame_to_arrays(df=df_all.reset_index(drop=True))
+
+        # Files are replaced rather than overwritten, columns of previous store being possibly memory mapped
+        for name, values in arrays.items():
+            column_path = join(self.store_dir, '{}.npy'.format(name))
+            with open('{}.tmp'.format(column_path), 'wb') as file:
+                np.save(file, values)
+            os.replace('{}.tmp'.format(column_path), column_path)
+
+        self.index = OrderedDict([('columns', schema), ('games', offsets), ('nb_rows', start),
+                                  ('content_hashes', content_hashes or dict()),
+                                  ('settings_hash', get_settings_hash())])
+        index_path = join(self.store_dir, self.INDEX_FILENAME)
+        with open('{}.tmp'.format(index_path), 'w') as file:
+            json.dump(self.index, file)
+        os.replace('{}.tmp'.format(index_path), index_path)
+        self._mapped_columns = dict()
+
+        logging.info('Successfully saved {} games ({} events) in event store.'.format(len(offsets), start))
+        return self
+
+    def read_game(self, filename, columns=None):
+        """Read cleaned events of a game.
+
+        Parameters
+        ----------
+        filename: string
+        columns: list, default None
+            Columns to read, all columns if None
+
+        Returns
+        -------
+        df_game: pandas.DataFrame
+            Same as Game(filename=filename).clean_game_data()
+
+        """
+        try:
+            start, stop = self.index['games'][filename]
+        except KeyError:
+            raise KeyError('{} not in event store {}'.format(filename, self.store_dir))
+
+        return self._read_rows(rows=slice(start, stop), columns=columns)
+
+    def read(self, columns=None, filenames=None):
+        """Read cleaned events of several games.
+
+        Parameters
+        ----------
+        columns: list, default None
+            Columns to read, all columns if None
+        filenames: list, default None
+            Games to read, all games if None
+
+        Returns
+        -------
+        df_events: pandas.DataFrame
+
+        """
+        if filenames is None:
+            return self._read_rows(rows=slice(0, self.index['nb_rows']), columns=columns)
+
+        rows = np.concatenate([np.arange(*self.index['games'][filename]) for filename in filenames])
+        return self._read_rows(rows=rows, columns=columns)
+
+    def _read_rows(self, rows, columns):
+        columns = [col for col in self.index['columns'] if col != self.ROW_INDEX_COL] \
+            if columns is None else columns
+        arrays = {name: self._get_mapped_array(name=name)[rows]
+                  for col in columns + [self.ROW_INDEX_COL]
+                  for name in array_names(column=col, schema=self.index['columns'][col])}
+
+        df = arrays_to_frame(arrays=arrays, schema=OrderedDict((col, self.index['columns'][col])
+                                                               for col in columns + [self.ROW_INDEX_COL]))
+        return df.set_index(self.ROW_INDEX_COL).rename_axis(None)[columns]
+
+    def _get_mapped_array(self, name):
+        if name not in self._mapped_columns:
+            self._mapped_columns[name] = np.load(join(self.store_dir, '{}.npy'.format(name)),
+                                                 mmap_mode='r')
+        return self._mapped_columns[name]
+
+    def _read_index(self):
+        index_path = join(self.store_dir, self.INDEX_FILENAME)
+        if not isfile(index_path):
+            return None
+
+        with open(index_path, 'r') as file:
+            return json.load(file, object_pairs_hook=OrderedDict)
+
+
+def get_settings_hash():
+    """Hash of settings cleaned games depend on, see Game.clean_game_data()."""
+    return hash_settings(dataset_settings={'cols_to_keep': stg.COLS_TO_KEEP,
+                                           'events_fill_values': stg.EVENTS_FILL_VALUES,
+                                           'events_dtypes': stg.EVENTS_DTYPES})
+
+
+if __name__ == '__main__':
+    event_store = EventStore().build()
+    df = event_store.read_game(filename=event_store.filenames[0])
@@ -0,0 +1,89 @@
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+def frame_to_arrays(df):
+    """Convert DataFrame columns into typed numpy arrays.
+
+    Numeric columns are kept as is, categorical columns are saved as codes and strings
+    columns as fixed-width unicode arrays with a mask of missing values. Other object
+    columns, e.g. mixing strings and numbers, would not be read back as saved.
+
+    Parameters
+    ----------
+    df: pandas.DataFrame
+
+    Returns
+    -------
+    arrays: dict
+        Numpy arrays by name, see array_names()
+    schema: dict
+        Information to decode arrays by column
+
+    Raises
+    ------
+    TypeError
+        If an object column holds values other than strings and missing values
+
+    """
+    arrays, schema = OrderedDict(), OrderedDict()
+
+    for col in df.columns:
+        series = df[col]
+        if series.dtype.name == 'category':
+            arrays[col] = series.cat.codes.values
+            schema[col] = {'kind': 'category',
+                           'categories': series.cat.categories.tolist()}
+        elif series.dtype != object:
+            arrays[col] = series.values
+            schema[col] = {'kind': 'numeric'}
+        else:
+            if pd.api.types.infer_dtype(series, skipna=True) not in ('string', 'empty'):
+                raise TypeError('Column {} holds {} values, only strings are saved from object columns'
+                                .format(col, pd.api.types.infer_dtype(series, skipna=True)))
+            is_null = series.isnull().values
+            arrays[col] = np.array(series.where(~is_null, '').tolist(), dtype=str)
+            schema[col] = {'kind': 'string', 'has_null': bool(is_null.any())}
+            if schema[col]['has_null']:
+                arrays['{}.isnull'.format(col)] = is_null
+
+    return arrays, schema
+
+
+def arrays_to_frame(arrays, schema):
+    """Convert arrays built by frame_to_arrays() back into a DataFrame.
+
+    Parameters
+    ----------
+    arrays: dict
+    schema: dict
+
+    Returns
+    -------
+    df: pandas.DataFrame
+
+    """
+    columns = dict()
+
+    for col, col_schema in schema.items():
+        if col_schema['kind'] == 'category':
+            columns[col] = pd.Categorical.from_codes(np.asarray(arrays[col]),
+                                                     categories=col_schema['categories'])
+        elif col_schema['kind'] == 'numeric':
+            columns[col] = np.array(arrays[col])
+        else:
+            values = np.asarray(arrays[col]).astype(object)
+            if col_schema['has_null']:
+                values[np.asarray(arrays['{}.isnull'.format(col)])] = np.nan
+            columns[col] = values
+
+    return pd.DataFrame(columns, columns=list(schema))
+
+
+def array_names(column, schema):
+    """List arrays names used to save column."""
+    if schema['kind'] == 'string' and schema['has_null']:
+        return [column, '{}.isnull'.format(column)]
+    return [column]
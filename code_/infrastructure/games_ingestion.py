@@ -0,0 +1,113 @@
+from collections import OrderedDict
+from functools import partial
+from multiprocessing import Pool
+
+import logging
+import pandas as pd
+
+from code_.infrastructure.frame_arrays import arrays_to_frame, frame_to_arrays
+import settings as stg
+
+
+class GamesIngestor():
+    """Apply a function to every game file in parallel processes.
+
+    Function is run in a pool of workers, each one sending back its DataFrame as typed
+    numpy arrays (see frame_arrays.frame_to_arrays) rather than as a pickled DataFrame.
+    Results are returned in files order whatever the order of completion, and a file
+    raising an error is logged and skipped without stopping other files.
+
+    Attributes
+    ----------
+    n_jobs: integer
+        Number of worker processes, files are processed in current process if 1
+    errors: dict
+        Error message by filename for files that failed during last run
+
+    """
+
+    def __init__(self, n_jobs=stg.INGESTION_N_JOBS):
+        """Initialize class.
+
+        Parameters
+        ----------
+        n_jobs: integer, default INGESTION_N_JOBS in settings
+
+        """
+        self.n_jobs = n_jobs
+        self.errors = OrderedDict()
+
+    def map(self, function, filenames, **kwargs):
+        """Run function on every file.
+
+        Parameters
+        ----------
+        function: callable
+            Module level function taking filename and kwargs, returning a pandas.DataFrame
+        filenames: list
+        kwargs: other arguments of function, same for all files
+
+        Returns
+        -------
+        results: dict
+            DataFrame by filename, in filenames order, failed files excluded
+
+        """
+        self.errors = OrderedDict()
+        results = OrderedDict()
+        run_on_file = partial(_run_on_file, function, kwargs)
+
+        if self.n_jobs == 1:
+            outputs = map(run_on_file, filenames)
+            self._gather_outputs(outputs=outputs, results=results, nb_files=len(filenames))
+        else:
+            with Pool(processes=self.n_jobs) as pool:
+                outputs = pool.imap(run_on_file, filenames)
+                self._gather_outputs(outputs=outputs, results=results, nb_files=len(filenames))
+
+        if self.errors:
+            logging.warning('{}/{} files could not be processed: {}'
+                            .format(len(self.errors), len(filenames), list(self.errors)))
+        return results
+
+    def concat(self, function, filenames, **kwargs):
+        """Run function on every file and concatenate results.
+
+        Parameters
+        ----------
+        function: callable
+        filenames: list
+        kwargs: other arguments of function
+
+        Returns
+        -------
+        df_all: pandas.DataFrame
+            Results of all files one after the other, with new index
+
+        """
+        results = self.map(function, filenames, **kwargs)
+        if not results:
+            return pd.DataFrame()
+        return pd.concat(list(results.values()), axis=0, ignore_index=True, sort=False)
+
+    def _gather_outputs(self, outputs, results, nb_files):
+        for number_of_processed_files, (filename, index, arrays, schema, error) in enumerate(outputs, 1):
+            if error is not None:
+                self.errors[filename] = error
+                logging.error('.. {}/{} - Failed to process file {}: {}'
+                              .format(number_of_processed_files, nb_files, filename, error))
+                continue
+
+            results[filename] = arrays_to_frame(arrays=arrays, schema=schema)
+            results[filename].index = index
+            logging.debug('.. {}/{} - Sucessfully processed file {}'
+                          .format(number_of_processed_files, nb_files, filename))
+
+
+def _run_on_file(function, kwargs, filename):
+    try:
+        df = function(filename=filename, **kwargs)
+        arrays, schema = frame_to_arrays(df=df.reset_index(drop=True))
+        return filename, df.index.values, arrays, schema, None
+    except Exception as error:
+        return filename, None, None, None, '{}: {}'.format(type(error).__name__, error)
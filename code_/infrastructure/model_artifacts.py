@@ -0,0 +1,44 @@
+from os.path import splitext
+from sklearn.externals.joblib import dump, load
+
+import settings as stg
+
+
+def dump_mapped_artifact(model, file_path):
+    """Save model with its numpy arrays uncompressed, to be memory mapped by load_mapped_artifact().
+
+    Joblib writes every numpy array of model raw in file, after pickle of the rest of
+    model, instead of compressing the whole file.
+
+    Parameters
+    ----------
+    model: object
+        Any picklable object
+    file_path: string
+
+    """
+    dump(model, file_path, compress=0)
+
+
+def load_mapped_artifact(file_path):
+    """Load model saved by dump_mapped_artifact(), its arrays being read-only views on a memory map of file.
+
+    Pages of arrays are read from disk only when accessed. N.B: objects copying arrays
+    when unpickled (e.g. sklearn trees) read all their pages at load, other arrays are
+    only read when used.
+
+    Parameters
+    ----------
+    file_path: string
+
+    Returns
+    -------
+    model: object
+
+    """
+    return load(file_path, mmap_mode='r')
+
+
+def get_mapped_artifact_path(file_path):
+    """Path of memory mapped version of a joblib model file."""
+    return '{}{}'.format(splitext(file_path)[0], stg.MAPPED_ARTIFACT_EXTENSION)
@@ -1,12 +1,16 @@
+import json
 import logging
 import numpy as np
 import os
 import pandas as pd
 
+from functools import lru_cache
 from lxml import etree
-from os.path import join
+from os.path import join, splitext
 
+from code_.infrastructure.dataset_cache import hash_file
 from code_.infrastructure.game import Game
+from code_.infrastructure.games_ingestion import GamesIngestor
 import settings as stg
 
 if __name__ == '__main__':
@@ -37,8 +41,9 @@ class Players():
             Filename to filter players having played more than 800 minutes
 
         """
-        self.all_players = self._get_all_players_from_file(xml_filename=xml_filename)
-        self.transfered_players = self._get_transfered_players(xml_filename=xml_filename)
+        tree = etree.parse(join(stg.DATA_DIR, xml_filename))
+        self.all_players = self._get_all_players_from_file(tree=tree)
+        self.transfered_players = self._get_transfered_players(tree=tree)
         self.players_more_800_min = self._get_players_more_800_min(read_from=saved_csv_filename)
 
     def get_eligible_players_list(self):
@@ -47,19 +52,19 @@ class Players():
         Returns
         -------
         eligible_players: list
+            Players ids as integers, as in games events
 
         """
-        ids_800_min = self.players_more_800_min[stg.PLAYER_COL].apply(str).tolist()
-        ids_transfered = self.transfered_players[stg.PLAYER_COL].apply(str).tolist()
+        ids_800_min = self.players_more_800_min[stg.PLAYER_COL].astype(int).tolist()
+        ids_transfered = self.transfered_players[stg.PLAYER_COL].astype(int).tolist()
         ids_loaned_to_exclude = self.all_players\
                                     .query('{} == "1"'.format(stg.LOAN_COL))\
-                                    .query('{} >= "2017-01-01"'.format(stg.ARRIVAL_DATE))[stg.PLAYER_COL].apply(str).tolist()
+                                    .query('{} >= "2017-01-01"'.format(stg.ARRIVAL_DATE))[stg.PLAYER_COL].astype(int).tolist()
 
         eligible_players = list(set(ids_800_min) - set(ids_transfered) - set(ids_loaned_to_exclude))
         return eligible_players
 
-    def _get_all_players_from_file(self, xml_filename):
-        tree = etree.parse(join(stg.DATA_DIR, xml_filename))
+    def _get_all_players_from_file(self, tree):
         all_players = pd.DataFrame()
 
         for team in tree.xpath(stg.XML_PATH_TO_TEAMS):
@@ -74,14 +79,15 @@ class Players():
 
     def _get_players_from_team(self, team_xml_element):
         players = team_xml_element.findall(stg.XML_PLAYER_TAG)
+        detailed_info = [self._get_detailed_info_for_player(player) for player in players]
 
         df_team = pd.DataFrame({
             stg.PLAYER_COL: list(map(lambda x: x.get(stg.XML_PLAYER_ID_ATTRIBUTE), players)),
             stg.LOAN_COL: list(map(lambda x: x.get(stg.XML_LOAN_ATTRIBUTE), players)),
             stg.NAME_COL: list(map(lambda x: x.find(stg.XML_PLAYER_NAME_TAG).text, players)),
             stg.POSITION_COL: list(map(lambda x: x.find(stg.XML_PLAYER_POSITION_TAG).text, players)),
-            stg.ARRIVAL_DATE: list(map(lambda x: self._get_detailed_info_for_player(x)[stg.XML_PLAYER_JOIN_DATE], players)),
-            stg.LEAVE_DATE: list(map(lambda x: self._get_detailed_info_for_player(x)[stg.XML_PLAYER_LEAVE_DATE], players))
+            stg.ARRIVAL_DATE: list(map(lambda x: x[stg.XML_PLAYER_JOIN_DATE], detailed_info)),
+            stg.LEAVE_DATE: list(map(lambda x: x[stg.XML_PLAYER_LEAVE_DATE], detailed_info))
         })
         return df_team
 
@@ -94,8 +100,7 @@ class Players():
         dict_stat_text.setdefault(stg.XML_PLAYER_LEAVE_DATE, np.nan)
         return dict_stat_text
 
-    def _get_transfered_players(self, xml_filename):
-        tree = etree.parse(join(stg.DATA_DIR, xml_filename))
+    def _get_transfered_players(self, tree):
         transfered_players = pd.DataFrame()
 
         for team in tree.xpath(stg.XML_PATH_TO_TRANSFERS):
@@ -113,17 +118,7 @@ class Players():
             return pd.read_csv(join(stg.OUTPUTS_DIR, read_from))
         except FileNotFoundError:
             logging.debug('Start computing players time spent on pitch..')
-            number_of_processed_files = 0
-
-            df_players = pd.DataFrame()
-
-            for file_ in os.listdir(stg.GAMES_DIR):
-                play_time = Game(filename=file_).get_play_time_by_player()
-                df_players = pd.concat([df_players, play_time],
-                                       axis=0, ignore_index=True)
-                number_of_processed_files += 1
-                logging.debug('.. {}/{} - Sucessfully loaded file {}'
-                              .format(number_of_processed_files, len(os.listdir(stg.GAMES_DIR)), file_))
+            df_players = GamesIngestor().concat(get_play_time_by_player, sorted(os.listdir(stg.GAMES_DIR)))
 
             players_more_800_min = df_players.groupby(stg.PLAYER_COL, as_index=False)\
                                              .agg({stg.GAME_TIME_COL: 'sum'})\
@@ -134,6 +129,148 @@ class Players():
             return players_more_800_min
 
 
+class PlayerRegistry():
+    """Eligible players, see Players.get_eligible_players_list(), with fast lookups.
+
+    Eligibility is kept in a boolean array indexed by player ID, so that checking a
+    player is a single array access and filtering events is vectorized.
+
+    Attributes
+    ----------
+    player_ids: numpy.ndarray
+        Sorted IDs of eligible players
+    is_eligible: numpy.ndarray
+        Boolean array, True at index of eligible player IDs
+
+    """
+
+    def __init__(self, player_ids):
+        """Initialize class.
+
+        Parameters
+        ----------
+        player_ids: list
+            IDs of eligible players
+
+        """
+        self.player_ids = np.unique(np.asarray(player_ids, dtype=np.int64))
+        self.is_eligible = np.zeros(self.player_ids.max() + 1 if self.player_ids.size else 0, dtype=bool)
+        self.is_eligible[self.player_ids] = True
+
+    def __contains__(self, player_id):
+        """Check a player is eligible."""
+        return 0 <= player_id < self.is_eligible.shape[0] and bool(self.is_eligible[player_id])
+
+    def __len__(self):
+        """Nb of eligible players."""
+        return self.player_ids.shape[0]
+
+    def isin(self, player_ids):
+        """Check eligibility of several players.
+
+        Parameters
+        ----------
+        player_ids: array-like of integers
+
+        Returns
+        -------
+        mask: numpy.ndarray
+            Boolean array, True for eligible players
+
+        """
+        player_ids = np.asarray(player_ids, dtype=np.int64)
+        in_range = (player_ids >= 0) & (player_ids < self.is_eligible.shape[0])
+
+        mask = np.zeros(player_ids.shape, dtype=bool)
+        mask[in_range] = self.is_eligible[player_ids[in_range]]
+        return mask
+
+    def tolist(self):
+        """List IDs of eligible players."""
+        return self.player_ids.tolist()
+
+    def save(self, source_hashes, filename=stg.FILENAME_ELIGIBLE_PLAYERS):
+        """Save eligible players IDs in OUTPUTS_DIR, with hashes of players files they are built from.
+
+        Parameters
+        ----------
+        source_hashes: dict
+            SHA-1 of players files by filename, see hash_players_files()
+        filename: string, default FILENAME_ELIGIBLE_PLAYERS in settings
+
+        """
+        np.save(join(stg.OUTPUTS_DIR, filename), self.player_ids)
+        with open(_get_source_hashes_path(filename), 'w') as hashes_file:
+            json.dump(source_hashes, hashes_file, indent=2, sort_keys=True)
+
+    @classmethod
+    def load(cls, filename=stg.FILENAME_ELIGIBLE_PLAYERS):
+        """Load registry saved with save(), with hashes of players files it was built from.
+
+        Returns
+        -------
+        registry: PlayerRegistry
+        source_hashes: dict
+            SHA-1 of players files by filename, see hash_players_files()
+
+        """
+        with open(_get_source_hashes_path(filename)) as hashes_file:
+            source_hashes = json.load(hashes_file)
+        return cls(player_ids=np.load(join(stg.OUTPUTS_DIR, filename))), source_hashes
+
+
+@lru_cache(maxsize=None)
+def get_player_registry(filename=stg.FILENAME_ELIGIBLE_PLAYERS):
+    """Get eligible players registry, built once by process.
+
+    Registry is read from OUTPUTS_DIR if saved from the current players files, built from
+    players files and saved otherwise.
+
+    Parameters
+    ----------
+    filename: string, default FILENAME_ELIGIBLE_PLAYERS in settings
+
+    Returns
+    -------
+    registry: PlayerRegistry
+
+    """
+    try:
+        registry, source_hashes = PlayerRegistry.load(filename=filename)
+        if source_hashes == hash_players_files():
+            return registry
+        logging.info('Players files changed since {} was saved, rebuilding it..'.format(filename))
+    except FileNotFoundError:
+        pass
+
+    registry = PlayerRegistry(player_ids=Players().get_eligible_players_list())
+    registry.save(source_hashes=hash_players_files(), filename=filename)
+    logging.info('Successfully saved {} eligible players.'.format(len(registry)))
+    return registry
+
+
+def hash_players_files(xml_filename=stg.FILENAME_ALL_PLAYERS, saved_csv_filename=stg.FILENAME_PLAYERS_MORE_800):
+    """Compute SHA-1 of players files eligible players are built from, see Players.
+
+    Raises
+    ------
+    FileNotFoundError
+        If players with 800+ minutes are not saved yet
+
+    """
+    return {xml_filename: hash_file(join(stg.DATA_DIR, xml_filename)),
+            saved_csv_filename: hash_file(join(stg.OUTPUTS_DIR, saved_csv_filename))}
+
+
+def _get_source_hashes_path(filename):
+    return join(stg.OUTPUTS_DIR, '{}_sources.json'.format(splitext(filename)[0]))
+
+
+def get_play_time_by_player(filename):
+    """Compute time played by every player of a game, see Game.get_play_time_by_player()."""
+    return Game(filename=filename).get_play_time_by_player()
+
+
 if __name__ == '__main__':
     players = Players()
     toto = players.get_eligible_players_list()
@@ -0,0 +1,51 @@
+from os.path import join
+
+import logging
+import re
+
+import settings as stg
+
+
+CODE_IMPORT_PATTERN = re.compile(r'^from (code_\.\w+\.(\w+)) import', flags=re.MULTILINE)
+
+
+def copy_submission_modules(modules=stg.SUBMISSION_SHARED_MODULES, submission_dir=stg.SUBMISSION_DIR):
+    """Copy modules of code_ used by submission in submission folder, imports of code_ being made flat.
+
+    Submission loads its modules from its own folder, without code_: modules shared with
+    code_ are copied when building submission instead of being maintained twice. Copies
+    are not versioned, original modules being the only ones to edit.
+
+    Parameters
+    ----------
+    modules: list, default SUBMISSION_SHARED_MODULES in settings
+        Names of modules, e.g. 'code_.domain.compiled_pipeline'
+    submission_dir: string, default SUBMISSION_DIR in settings
+
+    Returns
+    -------
+    copied_paths: list
+        Paths of copies in submission folder
+
+    Raises
+    ------
+    ValueError
+        If a module imports a module of code_ which is not copied, copy failing to import
+
+    """
+    copied_paths = list()
+    for module in modules:
+        with open(join(stg.REPO_DIR, *module.split('.')) + '.py') as module_file:
+            source = module_file.read()
+
+        missing_modules = [imported for imported, _ in CODE_IMPORT_PATTERN.findall(source) if imported not in modules]
+        if missing_modules:
+            raise ValueError('{} imports {} which are not copied in submission'.format(module, missing_modules))
+
+        copied_path = join(submission_dir, '{}.py'.format(module.split('.')[-1]))
+        with open(copied_path, 'w') as copied_file:
+            copied_file.write('# Copied from {} by copy_submission_modules(), edit original module\n'.format(module))
+            copied_file.write(CODE_IMPORT_PATTERN.sub(r'from \2 import', source))
+        copied_paths.append(copied_path)
+        logging.debug('{} copied to {}'.format(module, copied_path))
+    return copied_paths
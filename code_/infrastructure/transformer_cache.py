@@ -0,0 +1,171 @@
+from collections import OrderedDict
+from os.path import getsize, isfile, join
+from sklearn.base import clone
+from sklearn.externals.joblib import dump, hash as joblib_hash, load
+
+import logging
+import os
+import threading
+
+import settings as stg
+
+
+class TransformerCache():
+    """Fitted transformers and their outputs, found back from configuration of transformer and input data.
+
+    Key of an entry is a hash of unfitted transformer parameters and of data it is fitted
+    on, so that fitting an identical transformer on identical data, e.g. FastICA of player
+    pipeline for several forests, reuses fitted transformer and transformed data instead
+    of fitting again. Entries are kept in memory and on disk, both bounded in size: least
+    recently used entries are evicted first.
+
+    Attributes
+    ----------
+    cache_dir: string
+    max_memory_bytes: integer
+    max_disk_bytes: integer
+    nb_hits: integer
+    nb_misses: integer
+
+    """
+
+    def __init__(self, cache_dir=stg.TRANSFORMER_CACHE_DIR, max_memory_mo=stg.TRANSFORMER_CACHE_MEMORY_MO,
+                 max_disk_mo=stg.TRANSFORMER_CACHE_DISK_MO):
+        """Initialize class.
+
+        Parameters
+        ----------
+        cache_dir: string, default TRANSFORMER_CACHE_DIR in settings
+        max_memory_mo: float, default TRANSFORMER_CACHE_MEMORY_MO in settings
+        max_disk_mo: float, default TRANSFORMER_CACHE_DISK_MO in settings
+
+        """
+        self.cache_dir = cache_dir
+        self.max_memory_bytes, self.max_disk_bytes = max_memory_mo * 1e6, max_disk_mo * 1e6
+        self.nb_hits, self.nb_misses = 0, 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def fit_transform(self, transformer, X, y=None):
+        """Fit transformer and transform X, or get them from cache.
+
+        Parameters
+        ----------
+        transformer: sklearn transformer
+            Not fitted, left unchanged
+        X: pandas.DataFrame or numpy.ndarray
+        y: pandas.Series or numpy.ndarray, default None
+
+        Returns
+        -------
+        fitted_transformer: sklearn transformer
+        Xt: numpy.ndarray
+
+        """
+        key = joblib_hash([clone(transformer), X, y])
+        entry = self._get(key=key)
+        if entry is not None:
+            self.nb_hits += 1
+            return entry
+
+        self.nb_misses += 1
+        fitted_transformer = clone(transformer)
+        Xt = fitted_transformer.fit_transform(X, y)
+        self._put(key=key, entry=(fitted_transformer, Xt))
+        return fitted_transformer, Xt
+
+    def clear(self):
+        """Remove all entries from memory and disk."""
+        with self._lock:
+            self._entries.clear()
+        for file_path in self._list_files():
+            os.remove(file_path)
+        return self
+
+    def _get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+        file_path = self._get_file_path(key)
+        if not isfile(file_path):
+            return None
+        try:
+            entry = load(file_path)
+        except (EOFError, OSError):
+            # File evicted or being written by another process
+            return None
+        os.utime(file_path)
+        self._put_in_memory(key=key, entry=entry)
+        logging.debug('Transformer found on disk: {}'.format(key))
+        return entry
+
+    def _put(self, key, entry):
+        self._put_in_memory(key=key, entry=entry)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Written under another name first, so that other processes never read a partial file
+        temporary_path = '{}.{}.tmp'.format(self._get_file_path(key), os.getpid())
+        dump(entry, temporary_path)
+        os.replace(temporary_path, self._get_file_path(key))
+        self._evict_from_disk()
+
+    def _put_in_memory(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > 1 and \
+                    sum(_get_nbytes(Xt) for _, Xt in self._entries.values()) > self.max_memory_bytes:
+                self._entries.popitem(last=False)
+
+    def _evict_from_disk(self):
+        # Access time is tracked by modification time, updated on every hit
+        files = list()
+        for file_path in self._list_files():
+            try:
+                files.append((os.path.getmtime(file_path), getsize(file_path), file_path))
+            except OSError:
+                # Evicted by another process in the meantime
+                continue
+        files.sort()
+
+        disk_bytes = sum(file_size for _, file_size, _ in files)
+        for _, file_size, file_path in files[:-1]:
+            if disk_bytes <= self.max_disk_bytes:
+                break
+            disk_bytes -= file_size
+            try:
+                os.remove(file_path)
+            except OSError:
+                continue
+
+    def _list_files(self):
+        if not os.path.isdir(self.cache_dir):
+            return list()
+        return [join(self.cache_dir, filename) for filename in os.listdir(self.cache_dir)
+                if filename.endswith('.joblib')]
+
+    def _get_file_path(self, key):
+        return join(self.cache_dir, '{}.joblib'.format(key))
+
+    def __getstate__(self):
+        # Entries in memory are not sent to other processes, which share entries on disk
+        state = self.__dict__.copy()
+        state['_entries'], state['_lock'] = OrderedDict(), None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __deepcopy__(self, memo):
+        # sklearn clone() deep copies parameters: clones of a pipeline share its cache
+        return self
+
+
+def _get_nbytes(X):
+    if hasattr(X, 'nbytes'):
+        return X.nbytes
+    return X.values.nbytes
@@ -16,7 +16,14 @@ GAMES_DIR = os.path.join(DATA_DIR, 'French-Ligue-One-20162017-season-Match-Day-1
 OUTPUTS_DIR = os.path.join(REPO_DIR, 'outputs')
 MODELS_DIR = os.path.join(REPO_DIR, 'models')
 LOGS_DIR = os.path.join(REPO_DIR, 'logs')
+EVENT_STORE_DIR = os.path.join(OUTPUTS_DIR, 'event_store')
+DATASETS_CACHE_DIR = os.path.join(OUTPUTS_DIR, 'datasets')
+TRANSFORMER_CACHE_DIR = os.path.join(OUTPUTS_DIR, 'transformer_cache')
 SUBMISSION_DIR = os.path.join(REPO_DIR, 'submission')
+# Modules of code_ used by submission, copied in SUBMISSION_DIR when building it, see submission_modules
+SUBMISSION_SHARED_MODULES = ['code_.infrastructure.model_artifacts', 'code_.domain.pipeline_inspection',
+                             'code_.domain.compiled_pipeline', 'code_.domain.early_exit_forest',
+                             'code_.domain.team_routing', 'code_.domain.cascade_model']
 
 
 # Logging
@@ -39,10 +46,14 @@ def enable_logging(log_filename, logging_level=logging.DEBUG):
 # Manage XML files provided by OPTA
 XML_PATH_TO_GAME_INFO = '/Games/Game'
 XML_PATH_TO_EVENTS = '/Games/Game/Event'
+XML_GAME_TAG = 'Game'
+XML_EVENT_TAG = 'Event'
 XML_PATH_TO_TEAMS = '/SoccerFeed/SoccerDocument/Team'
 XML_PATH_TO_TRANSFERS = '/SoccerFeed/SoccerDocument/PlayerChanges/Team'
 XML_QUALIFIER_TAG = 'Q'
 XML_QUALIFIER_VALUE_ATTRIBUTE = 'value'
+# Nb of parsed game files kept in memory, None for no bound, 0 to disable
+GAME_DOCUMENT_CACHE_SIZE = 8
 XML_CLUB_NAME_ATTRIBUTE = 'short_club_name'
 XML_PLAYER_TAG = 'Player'
 XML_LOAN_ATTRIBUTE = 'loan'
@@ -59,23 +70,23 @@ PERIOD_COL = 'period_id'
 EVENT_COL = 'event_id'
 EVENT_TYPE_COL = 'type_id'
 EVENTS_MAP = {
-    'PASS': '1',
-    'FOUL': '4',
-    'CORNER_AWARDED': '6',
-    'KICKOFF': '34',
-    'PLAYER_OFF': '18',
-    'PLAYER_ON': '19',
-    'START_PERIOD': '32',
-    'END_PERIOD': '30',
-    'DELETED_EVENT': '43'
+    'PASS': 1,
+    'FOUL': 4,
+    'CORNER_AWARDED': 6,
+    'KICKOFF': 34,
+    'PLAYER_OFF': 18,
+    'PLAYER_ON': 19,
+    'START_PERIOD': 32,
+    'END_PERIOD': 30,
+    'DELETED_EVENT': 43
 }
 OUTCOME_COL = 'outcome'
 KEYPASS_COL = 'keypass'
 ASSIST_COL = 'assist'
 
-GK_EVENTS = ['10', '11', '41', '52', '53', '54', '58']
+GK_EVENTS = [10, 11, 41, 52, 53, 54, 58]
 GK_EVENTS_COL = 'gk_events'
-SHOTS_EVENTS = ['13', '14', '15', '16']
+SHOTS_EVENTS = [13, 14, 15, 16]
 SHOTS_COL = 'shots'
 FREE_KICK_COL = 'free_kick'
 CORNER_COL = 'corner'
@@ -85,10 +96,16 @@ QUALIFIER_MAP = {
     'ALL_PLAYERS': '30',
     'ZONE': '56'
 }
+ZONE_COL = '{}_{}'.format(QUALIFIER_COL, QUALIFIER_MAP['ZONE'])
+NO_POSITION = 'no_position'
 
 # Players info from OPTA
 TEAM_COL = 'team_id'
+# OPTA ID of club of a team, team_id being binarized (1 for home team, 0 for away team)
+CLUB_COL = 'club_id'
 PLAYER_COL = 'player_id'
+MISSING_PLAYER_ID = -1
+PLAYER_TO_PREDICT_ID = 1
 PLAYER_START_COL = 'start_game'
 PLAYER_EXTRA_TIME_FIRST_HALF = 'has_played_extra_time_first_half'
 PLAYER_END_COL = 'end_game'
@@ -109,23 +126,101 @@ LEAVE_DATE = 'leave_date'
 # Outputs filenames
 FILENAME_ALL_PLAYERS = 'Noms des joueurs et IDs - F40 - L1 20162017.xml'
 FILENAME_PLAYERS_MORE_800 = 'players_more_800_min.csv'
+FILENAME_ELIGIBLE_PLAYERS = 'eligible_players.npy'
 FILENAME_STATS_AGGREGATED = 'first_half_stats_by_player.csv'
 FILENAME_NEXT_EVENT = 'first_half_next_event.csv'
 
 GAME_ID_COL = 'game'
 GAME_TIME_COL = 'game_time_in_sec'
 
-COLS_TO_KEEP = [GAME_ID_COL, EVENT_TYPE_COL, '{}_{}'.format(QUALIFIER_COL, QUALIFIER_MAP['ZONE']),
+# Read cleaned games from event store (built once from GAMES_DIR) instead of XML files
+BOOL_USE_EVENT_STORE = True
+# Nb of processes used to read and process games files, 1 to stay in current process
+INGESTION_N_JOBS = 3
+
+COLS_TO_KEEP = [GAME_ID_COL, EVENT_TYPE_COL, ZONE_COL,
                 PERIOD_COL, GAME_TIME_COL, PLAYER_COL, TEAM_COL, OUTCOME_COL, KEYPASS_COL, ASSIST_COL,
                 X_COL, Y_COL]
+# Types of cleaned events, applied once after missing values are filled
+# Player IDs are OPTA IDs as int32 (str() gives back XML value), MISSING_PLAYER_ID if event has no player
+EVENTS_FILL_VALUES = {ZONE_COL: NO_POSITION, PLAYER_COL: MISSING_PLAYER_ID,
+                      KEYPASS_COL: 0, ASSIST_COL: 0}
+EVENTS_DTYPES = {GAME_ID_COL: 'category', EVENT_TYPE_COL: 'int16', ZONE_COL: 'category',
+                 PERIOD_COL: 'int8', GAME_TIME_COL: 'int32', PLAYER_COL: 'int32', TEAM_COL: 'int8',
+                 OUTCOME_COL: 'int8', KEYPASS_COL: 'int8', ASSIST_COL: 'int8',
+                 X_COL: 'float32', Y_COL: 'float32'}
+
+# Models artifacts
+# Memory mapped version of a model, joblib file with numpy arrays stored uncompressed
+MAPPED_ARTIFACT_EXTENSION = '.mmap'
+# Pipeline compiled to numpy arrays, see compiled_pipeline
+COMPILED_PIPELINE_EXTENSION = '.compiled'
+# Remove no-op steps and duplicate or unused copied columns of fitted pipelines before saving them
+BOOL_OPTIMIZE_PIPELINES = True
+
+# Cascade: first stage answers when confident enough, full model otherwise
+# Thresholds and first stages by pipeline, see _tune_cascade_thresholds.py
+CASCADE_CONFIG_FILENAME = 'cascade_config.h5'
+CASCADE_FIRST_STAGE_NAME = '{model}_first_stage.h5'
+# First stages tried: first trees of full forest, light model and linear model
+CASCADE_FIRST_STAGE_NB_TREES = [3, 5, 10, 20]
+CASCADE_CONFIDENCES = ['probability', 'margin']
+# Average single row latency to reach with minimal loss of accuracy, in ms
+CASCADE_TARGET_LATENCY_MS = {'player_model': 30, 'next_team_model': 15}
+CASCADE_NB_LATENCY_ROWS = 100
+CASCADE_TUNING_FILENAME = 'cascade_tuning_{model}.csv'
+
+# Early-exit voting of forests: number of trees evaluated between two checks of votes margins
+EARLY_EXIT_BATCH_SIZE = 5
+
+# Fitted transformers and transformed data reused by pipelines, see transformer_cache
+# Least recently used entries are evicted beyond these sizes
+TRANSFORMER_CACHE_MEMORY_MO = 2000
+TRANSFORMER_CACHE_DISK_MO = 10000
+
+# Scores of hyperparameters searches, reused by next searches on same data, see evaluation_store
+EVALUATION_STORE_FILENAME = 'evaluation_store.jsonl'
+# Random searches draw same candidates at every run, so that interrupted searches resume
+RANDOM_SEARCH_NB_ITER = 30
+RANDOM_SEARCH_RANDOM_STATE = 42
+# Search on hyperparameters when RS flags of models are set ['random', 'successive_halving']
+HYPERPARAMS_SEARCH = 'random'
+# Successive halving evaluates candidates on growing shares of a resource ['games', 'rows', 'trees'],
+# keeping best 1 / factor of them at every rung, see resumable_search
+SUCCESSIVE_HALVING_RESOURCE = 'games'
+SUCCESSIVE_HALVING_NB_CANDIDATES = 81
+SUCCESSIVE_HALVING_FACTOR = 3
+
+# Selection of pipelines within budgets of submission, see constrained_selector
+# Challenge limits files to 50 Mo, test computer may have 4 Go only
+SELECTOR_BUDGETS = {'size_mo': 50, 'load_time': 5, 'p99_latency_ms': 100, 'peak_rss_mo': 3500}
+# Serialization formats tried for every pipeline, with compression of joblib files
+SELECTOR_FORMATS = [('joblib', 0), ('joblib', ('lz4', 3)), ('joblib', ('lz4', 9)), ('joblib', ('zlib', 3)),
+                    ('mapped', None), ('compiled', None)]
+SELECTOR_NB_LATENCY_ROWS = 200
+# Problem of _get_best_pipeline_with_constraints.py, ['player', 'next_team', 'x_coords', 'y_coords']
+SELECTOR_PROBLEM = 'player'
+SELECTOR_LOG_FILENAME = 'pipelines_with_constraints_{problem}.csv'
+# Sweep of forests: largest forest is fitted once by seed, smaller and shallower ones are derived from it
+BOOL_SELECTOR_FOREST_SWEEP = True
+SELECTOR_SWEEP_SEEDS = [0, 1, 2]
+SELECTOR_SWEEP_NB_TREES = list(range(60, 151, 5))
+SELECTOR_SWEEP_MAX_DEPTHS = list(range(18, 25))
+SELECTOR_SWEEP_FORMATS = [('joblib', ('lz4', 9))]
+SELECTOR_SWEEP_NB_LATENCY_ROWS = 20
 
 # Model 1 - Players prediction
 PLAYER_TARGET = 'player_id'
-EVENTS_COMPUTE_NUMBER = ['3', '4', '7', '8', '10', '14', '16', '17', '18', '19', '44', '61']
-EVENTS_COMPUTE_SUCCESS_RATE = ['1']
+# Stats are computed on sliding windows within each half
+STATS_WINDOW_LENGTH_MIN = 15
+PERIODS_START_MIN = {1: 0, 2: 45}
+PERIOD_LENGTH_MIN = 45
+ZONES = ['Back', 'Center', 'Left', 'Right']
+EVENTS_COMPUTE_NUMBER = [3, 4, 7, 8, 10, 14, 16, 17, 18, 19, 44, 61]
+EVENTS_COMPUTE_SUCCESS_RATE = [1]
 PLAYER_FEATURES = ['team_id']\
     + ['nb_assist', 'nb_keypass', 'nb_gk_events', 'nb_shots', 'nb_free_kick', 'nb_corner']\
-    + ['Back', 'Center', 'Left', 'Right']\
+    + ZONES\
     + ['p_{}_nb'.format(el) for el in EVENTS_COMPUTE_SUCCESS_RATE]\
     + ['p_{}_success_rate'.format(el) for el in EVENTS_COMPUTE_SUCCESS_RATE]\
     + ['p_{}_nb'.format(el) for el in EVENTS_COMPUTE_NUMBER]\
@@ -137,6 +232,9 @@ PLAYER_FEATURES_MEDIAN_FILENAME = 'player_model_missing_values.h5'
 
 PLAYER_MODEL_NAME = 'player_model.h5'
 PLAYER_MODEL_LIGHT_NAME = 'player_model_light.h5'
+# Player model with a sub-model by club: index file, and file of every sub-model
+PLAYER_TEAM_MODEL_NAME = 'player_model_by_team.h5'
+PLAYER_TEAM_SUBMODEL_NAME = 'player_model_team{team}.h5'
 PLAYER_TPOT_FILENAME = 'tpot_player.py'
 # ---------------
 BOOL_TPOT_PLAYER = False
@@ -165,6 +263,17 @@ PLAYER_MODELS_HYPERPARAMS = {
             'n_jobs': 1,
             'max_depth': 15
         },
+        'team_et_classif': {
+            'estimator__n_estimators': 100,
+            'estimator__n_jobs': 1,
+            'estimator__max_depth': 15
+        },
+        'ica_et_classif': {
+            'extratreesclassifier__n_estimators': 75,
+            'extratreesclassifier__n_jobs': 1,
+            'extratreesclassifier__max_depth': 18,
+            'extratreesclassifier__max_features': 0.1
+        },
         'xgb_classif': {
             'objective': ['multi:softmax'],
             'num_class': 227,
@@ -187,6 +296,18 @@ PLAYER_MODELS_HYPERPARAMS = {
             'max_depth': [None, 4, 8, 10, 12, 15],
             'criterion': ['gini', 'entropy']
         },
+        'team_et_classif': {
+            'estimator__n_estimators': [50, 100, 200, 500],
+            'estimator__max_features': [None, 'sqrt', 10, 15, 20],
+            'estimator__max_depth': [None, 4, 8, 10, 12, 15],
+            'estimator__criterion': ['gini', 'entropy']
+        },
+        'ica_et_classif': {
+            'extratreesclassifier__n_estimators': [50, 75, 100, 200],
+            'extratreesclassifier__max_features': [0.1, 'sqrt', 10, 15, 20],
+            'extratreesclassifier__max_depth': [None, 12, 15, 18, 21],
+            'extratreesclassifier__criterion': ['gini', 'entropy']
+        },
         'xgb_classif': {
             'objective': ['multi:softmax'],
             'num_class': 227,
@@ -204,6 +325,13 @@ PLAYER_MODELS_HYPERPARAMS = {
 }
 PLAYER_MODEL_BASE_HYPERPARAMS = PLAYER_MODELS_HYPERPARAMS['base'][PLAYER_MODEL_TYPE]
 PLAYER_RANDOM_SEARCH_HYPERPARAMS = PLAYER_MODELS_HYPERPARAMS['random_search'][PLAYER_MODEL_TYPE]
+# Model types with a sub-model by club, reading CLUB_COL in addition to PLAYER_FEATURES
+PLAYER_TEAM_MODEL_TYPES = ['team_et_classif']
+# Parameter setting number of jobs of model types whose forest is not the model itself
+PLAYER_MODEL_N_JOBS_PARAMS = {'team_et_classif': 'estimator__n_jobs', 'ica_et_classif': 'extratreesclassifier__n_jobs'}
+# Parameter setting number of trees of these model types, budget of successive halving on trees
+PLAYER_MODEL_TREES_PARAMS = {'team_et_classif': 'estimator__n_estimators',
+                             'ica_et_classif': 'extratreesclassifier__n_estimators'}
 
 # Model 2 - Next team prediction
 NEXT_EVENT_COLS_TO_LAG = [PERIOD_COL, EVENT_TYPE_COL, TEAM_COL,
@@ -0,0 +1,155 @@
+"""Predict many test sets at once, loading models a single time.
+
+Usage:
+    python3 batch_psgx.py instructions/ --output res_psgx_batch.csv
+    python3 batch_psgx.py test_set_1.xml test_set_2.xml
+"""
+from multiprocessing import get_context
+from os.path import basename, isdir, join, splitext
+
+import argparse
+import csv
+import logging
+import os
+import pandas as pd
+import sys
+import time
+
+from main_psgx import (build_test_set_features, compute_next_event_predictions, compute_player_predictions,
+                       load_next_event_pipelines, load_player_pipelines, load_shared_pipelines)
+
+import settings as stg
+
+import warnings
+warnings.simplefilter(action='ignore', category=FutureWarning)
+
+if __name__ == '__main__':
+    stg.enable_logging(log_filename='{}.log'.format(splitext(basename(__file__))[0]),
+                       logging_level=logging.INFO)
+
+
+RESULT_COLUMNS = ['filename', stg.PLAYER_COL, stg.TEAM_COL, stg.Y_COL, stg.X_COL]
+# Pipelines used by current worker process
+_worker_pipelines = dict()
+
+
+def run_batch(xml_filenames, result_filename=stg.BATCH_RESULT_FILENAME, n_jobs=stg.BATCH_N_JOBS,
+              chunk_size=stg.BATCH_CHUNK_SIZE, fork_after_load=stg.BATCH_FORK_AFTER_LOAD):
+    """Predict player, next team, y and x of every test set and write them in csv file.
+
+    Test sets are split in chunks predicted in a pool of processes: features of every
+    test set of a chunk are built, stacked and predicted with one call by model, then
+    rows are written to csv as soon as chunk is done.
+    Test sets whose features cannot be built get default predictions, as Result() does.
+
+    Parameters
+    ----------
+    xml_filenames: list
+    result_filename: string, default BATCH_RESULT_FILENAME in settings
+    n_jobs: integer, default BATCH_N_JOBS in settings
+    chunk_size: integer, default BATCH_CHUNK_SIZE in settings
+        Maximum number of test sets by chunk, lowered to give a chunk to every process
+    fork_after_load: boolean, default BATCH_FORK_AFTER_LOAD in settings
+        Load models once before forking processes sharing them, every process loads
+        its own copy otherwise
+
+    Returns
+    -------
+    throughput: float
+        Number of test sets predicted by second, models loading included
+
+    """
+    start = time.time()
+    if fork_after_load:
+        load_shared_pipelines(nb_workers=n_jobs)
+        logging.info('Pipelines loaded: {}'.format(time.time() - start))
+        context = get_context('fork')
+    else:
+        context = get_context()
+
+    chunk_size = max(1, min(chunk_size, -(-len(xml_filenames) // n_jobs)))
+    chunks = [xml_filenames[first:first + chunk_size] for first in range(0, len(xml_filenames), chunk_size)]
+
+    with context.Pool(processes=n_jobs, initializer=_load_worker_pipelines, initargs=(n_jobs,)) as pool, \
+            open(result_filename, mode='w') as result_file:
+        prediction_writer = csv.writer(result_file, delimiter=',', quoting=csv.QUOTE_MINIMAL)
+        prediction_writer.writerow(RESULT_COLUMNS)
+
+        number_of_files = 0
+        for rows in pool.imap(_predict_files, chunks):
+            prediction_writer.writerows(rows)
+            result_file.flush()
+            number_of_files += len(rows)
+            logging.info('.. {}/{} - Test sets predicted: {}'.format(number_of_files, len(xml_filenames),
+                                                                    time.time() - start))
+
+    throughput = len(xml_filenames) / (time.time() - start)
+    logging.info('{} test sets predicted in {}s - {:.1f} test sets by second'
+                 .format(len(xml_filenames), time.time() - start, throughput))
+    return throughput
+
+
+def get_xml_filenames(paths):
+    """List XML files given directly or in directories."""
+    xml_filenames = list()
+    for path in paths:
+        if isdir(path):
+            xml_filenames.extend(join(path, filename) for filename in sorted(os.listdir(path))
+                                 if filename.endswith('.xml'))
+        else:
+            xml_filenames.append(path)
+    return xml_filenames
+
+
+def _load_worker_pipelines(nb_workers):
+    # Pipelines loaded before fork are shared with parent process, see load_shared_pipelines()
+    _worker_pipelines.update(load_player_pipelines(nb_model_copies=nb_workers), **load_next_event_pipelines())
+
+
+def _predict_files(xml_filenames):
+    chunk = [_build_features(xml_filename=xml_filename) for xml_filename in xml_filenames]
+    predictions = pd.DataFrame([[xml_filename, stg.DEFAULT_PLAYER_PREDICTION] + stg.DEFAULT_NEXT_EVENT_PREDICTION
+                                for xml_filename, _, _ in chunk],
+                               columns=RESULT_COLUMNS)
+
+    players_rows = [row for row, (_, player_stats, _) in enumerate(chunk) if player_stats is not None]
+    if players_rows:
+        player_stats = pd.concat([chunk[row][1] for row in players_rows], axis=0, ignore_index=True, sort=False)
+        predictions.loc[players_rows, stg.PLAYER_COL] = \
+            compute_player_predictions(player_stats=player_stats, pipelines=_worker_pipelines)
+
+    events_rows = [row for row, (_, _, df_events) in enumerate(chunk) if df_events is not None]
+    if events_rows:
+        df_events = pd.concat([chunk[row][2] for row in events_rows], axis=0, ignore_index=True, sort=False)
+        predictions.loc[events_rows, [stg.TEAM_COL, stg.Y_COL, stg.X_COL]] = \
+            compute_next_event_predictions(df_events=df_events, pipelines=_worker_pipelines)
+
+    return [[xml_filename, int(player_id), int(team_id), y, x]
+            for xml_filename, player_id, team_id, y, x in predictions.itertuples(index=False)]
+
+
+def _build_features(xml_filename):
+    try:
+        player_stats, df_events = build_test_set_features(xml_filename=xml_filename)
+    except Exception as error:
+        logging.error('Failed to build features of {}: {}'.format(xml_filename, error))
+        player_stats, df_events = None, None
+    return xml_filename, player_stats, df_events
+
+
+def _parse_arguments(arguments):
+    parser = argparse.ArgumentParser(description='Predict many test sets, loading models once')
+    parser.add_argument('paths', nargs='+', help='Test sets XML files or directories containing them')
+    parser.add_argument('--output', default=stg.BATCH_RESULT_FILENAME, help='CSV file to write predictions in')
+    parser.add_argument('--n_jobs', type=int, default=stg.BATCH_N_JOBS)
+    parser.add_argument('--no_fork_after_load', action='store_true',
+                        help='Load models in every process instead of sharing models loaded once')
+    return parser.parse_args(arguments)
+
+
+if __name__ == '__main__':
+    args = _parse_arguments(sys.argv[1:])
+    throughput = run_batch(xml_filenames=get_xml_filenames(paths=args.paths),
+                           result_filename=args.output, n_jobs=args.n_jobs,
+                           fork_after_load=not args.no_fork_after_load)
+    print('{:.1f} test sets by second'.format(throughput))
@@ -1,6 +1,10 @@
+import numpy as np
 import pandas as pd
 
+from collections import OrderedDict
+from functools import lru_cache
 from lxml import etree
+from os.path import abspath, getmtime
 
 import settings as stg
 import logging
@@ -16,6 +20,8 @@ class Game():
         All events recorded in file
     home_id: string
     away_id: string
+    document: GameDocument
+        Parsed content of file, shared with other Game instances on same file
 
     """
 
@@ -28,8 +34,9 @@ class Game():
 
         """
         self.filename = filename
-        self.data = self._gather_events()
-        self.home_id, self.away_id = self._get_home_and_away_id()
+        self.document = load_game_document(file_path=self.filename)
+        self.data = self.document.events
+        self.home_id, self.away_id = self.document.home_id, self.document.away_id
 
     def clean_game_data(self):
         """Perform data cleaning operations.
@@ -44,12 +51,13 @@ class Game():
         _first_second_half = self._keep_first_second_half(df=game_data)
         _time_in_sec = self._convert_time_to_seconds(df=_first_second_half)
         _filter_events = self._drop_events(df=_time_in_sec,
-                                           events_id_list=[stg.EVENTS_MAP['DELETED_EVENT']])
+                                           events_id_list=[str(stg.EVENTS_MAP['DELETED_EVENT'])])
         _add_game_teams = self._add_game_teams_index(df=_filter_events)
         _replace_teams_id = self._substitute_team_id(df=_add_game_teams)
+        _keep_columns = self._keep_game_columns_if_exists(df=_replace_teams_id,
+                                                          list_cols=stg.COLS_TO_KEEP)
 
-        clean_data = self._keep_game_columns_if_exists(df=_replace_teams_id,
-                                                       list_cols=stg.COLS_TO_KEEP)
+        clean_data = self._apply_events_schema(df=_keep_columns)
         return clean_data
 
     def _keep_first_second_half(self, df):
@@ -59,7 +67,7 @@ class Game():
     def _convert_time_to_seconds(self, df):
         df_out = df.copy()
         df_out[stg.GAME_TIME_COL] = \
-            60 * df_out[stg.MINUTES_COL].apply(int) + df_out[stg.SECONDS_COL].apply(int)
+            60 * df_out[stg.MINUTES_COL].astype(int) + df_out[stg.SECONDS_COL].astype(int)
         return df_out
 
     def _drop_events(self, df, events_id_list):
@@ -85,45 +93,114 @@ class Game():
                 df[col] = '0'
         return df[[col for col in list_cols if col in df.columns]]
 
-    def _gather_events(self):
-        tree = etree.parse(self.filename)
+    def _apply_events_schema(self, df):
+        df_out = df.fillna(value=stg.EVENTS_FILL_VALUES)\
+                   .astype({col: dtype for col, dtype in stg.EVENTS_DTYPES.items()
+                            if col in df.columns})
+        return df_out
+
+
+class GameDocument():
+    """Content of an OPTA events file gathered in a single parse.
+
+    Attributes
+    ----------
+    file_path: string
+    events: pandas.DataFrame
+        All events recorded in file
+    home_id: string
+    away_id: string
+    teams_start_list: list
+        Players starting the game, read from kickoff events
+    end_of_periods: tuple
+        End of first and second halves in seconds, -1 if not found
 
-        df_events = pd.DataFrame()
+    """
 
-        for event in tree.xpath(stg.XML_PATH_TO_EVENTS):
-            df_event = pd.DataFrame(dict(event.attrib), index=[0])
-            df_qualifiers = self._get_qualifiers_for_event(event_xml_element=event)
-            with_qualifiers = pd.merge(left=df_event, right=df_qualifiers,
-                                       left_index=True, right_index=True, how='left')
+    def __init__(self, file_path):
+        """Initialize class.
 
-            df_events = pd.concat([df_events, with_qualifiers],
-                                  axis=0, ignore_index=True, sort=False)
+        Parameters
+        ----------
+        file_path: string
 
-        return df_events
+        """
+        self.file_path = file_path
+        self.home_id, self.away_id = None, None
+        self.teams_start_list = list()
+        self.end_of_periods = (-1, -1)
+        self.events = self._parse()
+
+    def _parse(self):
+        columns = OrderedDict()
+        nb_events = 0
+        end_of_periods = {'1': -1, '2': -1}
+
+        for action, element in etree.iterparse(self.file_path, events=('start', 'end'),
+                                               tag=(stg.XML_GAME_TAG, stg.XML_EVENT_TAG)):
+            if element.tag == stg.XML_GAME_TAG:
+                if action == 'start' and self.home_id is None:
+                    self.home_id, self.away_id = element.get('home_team_id'), element.get('away_team_id')
+                continue
+            if action == 'start':
+                continue
+
+            qualifiers = self._get_qualifiers_for_event(event_xml_element=element)
+            row = OrderedDict(element.attrib)
+            if stg.QUALIFIER_MAP['ZONE'] in qualifiers:
+                row[stg.ZONE_COL] = qualifiers[stg.QUALIFIER_MAP['ZONE']]
+            self._append_row_to_columns(columns=columns, row=row, row_number=nb_events)
+            nb_events += 1
+
+            if row.get(stg.EVENT_TYPE_COL) == str(stg.EVENTS_MAP['KICKOFF']) \
+                    and stg.QUALIFIER_MAP['ALL_PLAYERS'] in qualifiers:
+                self.teams_start_list.extend(qualifiers[stg.QUALIFIER_MAP['ALL_PLAYERS']].split(', ')[:11])
+            elif row.get(stg.EVENT_TYPE_COL) == str(stg.EVENTS_MAP['END_PERIOD']) \
+                    and row.get(stg.PERIOD_COL) in end_of_periods:
+                end_of_periods[row[stg.PERIOD_COL]] = \
+                    60 * int(row[stg.MINUTES_COL]) + int(row[stg.SECONDS_COL])
+
+            # Free parsed elements as we go, only current event is needed
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+
+        self.end_of_periods = (end_of_periods['1'], end_of_periods['2'])
+        return pd.DataFrame(columns)
 
     def _get_qualifiers_for_event(self, event_xml_element):
-        # qualifiers = event_xml_element.findall(stg.XML_QUALIFIER_TAG)
-        # To filter on qualifier 56
-        qualifiers = event_xml_element.findall('{}/[@{}="{}"]'.format(stg.XML_QUALIFIER_TAG,
-                                                                      stg.QUALIFIER_COL,
-                                                                      stg.QUALIFIER_MAP['ZONE']))
-
-        df_qualifiers = pd.DataFrame({
-            stg.QUALIFIER_COL: list(map(lambda x: x.get(stg.QUALIFIER_COL), qualifiers)),
-            stg.XML_QUALIFIER_VALUE_ATTRIBUTE: list(map(lambda x: x.get(stg.XML_QUALIFIER_VALUE_ATTRIBUTE), qualifiers)),
-        })
-
-        df_in_row = df_qualifiers.set_index(stg.QUALIFIER_COL)\
-                                 .transpose()\
-                                 .reset_index(drop=True)\
-                                 .fillna('value')
-        df_in_row.columns = ['{}_{}'.format(stg.QUALIFIER_COL, col)
-                             for col in df_in_row.columns]
-
-        return df_in_row
-
-    def _get_home_and_away_id(self):
-        tree = etree.parse(self.filename)
-
-        game_info = tree.xpath(stg.XML_PATH_TO_GAME_INFO)[0]
-        return game_info.get('home_team_id'), game_info.get('away_team_id')
+        return {qualifier.get(stg.QUALIFIER_COL): qualifier.get(stg.XML_QUALIFIER_VALUE_ATTRIBUTE, 'value')
+                for qualifier in event_xml_element.iterfind(stg.XML_QUALIFIER_TAG)}
+
+    def _append_row_to_columns(self, columns, row, row_number):
+        for col, value in row.items():
+            if col not in columns:
+                columns[col] = [np.nan] * row_number
+            columns[col].append(value)
+
+        for values in columns.values():
+            if len(values) == row_number:
+                values.append(np.nan)
+
+
+def load_game_document(file_path):
+    """Get parsed content of file, parsing it only if not in cache.
+
+    Cache is a LRU bounded by GAME_DOCUMENT_CACHE_SIZE in settings (None for no bound, 0 to disable).
+
+    Parameters
+    ----------
+    file_path: string
+
+    Returns
+    -------
+    document: GameDocument
+
+    """
+    return _load_game_document(abspath(file_path), getmtime(file_path))
+
+
+@lru_cache(maxsize=stg.GAME_DOCUMENT_CACHE_SIZE)
+def _load_game_document(file_path, modification_time):
+    return GameDocument(file_path=file_path)
+
@@ -1,5 +1,7 @@
+from collections import OrderedDict
 from os.path import basename, splitext
 import logging
+import numpy as np
 import pandas as pd
 
 from game import Game
@@ -31,6 +33,9 @@ class NextEventInGame():
     def build_next_event_dataset(self, columns_to_lag, lags_to_add):
         """Build dataset with previous events.
 
+        Lags are read by position within every game and period, events of a period being
+        consecutive. Events without all their lags in same game and period are dropped.
+
         Attributes
         ----------
         columns_to_lag: list
@@ -46,42 +51,41 @@ class NextEventInGame():
         """
         try:
             assert(stg.PERIOD_COL in columns_to_lag)
-
-            dataset = self._get_targets()
-
-            for lag in lags_to_add:
-                lag_df = self._lag_dataset(lag=lag)
-                columns_name_lagged = ['{}_lag{}'.format(col, lag) for col in columns_to_lag]
-                dataset = dataset.merge(right=lag_df[columns_name_lagged], how='left',
-                                        right_index=True, left_index=True)\
-                                 .query('{period} == {period}_lag{lag}'.format(period=stg.PERIOD_COL, lag=lag))\
-                                 .drop(labels='{}_lag{}'.format(stg.PERIOD_COL, lag), axis=1)
-            return dataset
         except AssertionError:
             raise KeyError('{} not in columns_to_lag list'.format(stg.PERIOD_COL))
 
+        position_in_period = self.game.groupby(by=[stg.GAME_ID_COL, stg.PERIOD_COL], sort=False, observed=True)\
+                                      .cumcount()\
+                                      .values
+        rows = np.flatnonzero(position_in_period >= max(lags_to_add, default=0))
+
+        df_targets = self._get_targets().iloc[rows]
+        lagged_columns = OrderedDict(('{}_lag{}'.format(col, lag), self.game[col].values[rows - lag])
+                                     for lag in lags_to_add
+                                     for col in columns_to_lag if col != stg.PERIOD_COL)
+
+        df_lags = pd.DataFrame(lagged_columns, index=df_targets.index, columns=list(lagged_columns))
+
+        dataset = pd.concat([df_targets, df_lags], axis=1)
+        return dataset
+
     def _get_targets(self):
         df_target = self.game[[stg.GAME_ID_COL, stg.PERIOD_COL, stg.TEAM_COL,
                                stg.X_PROJECTED_COL, stg.Y_PROJECTED_COL]]
         return df_target
 
-    def _lag_dataset(self, lag):
-        df_lagged = self.game.shift(lag)\
-                             .rename(columns={col: '{}_lag{}'.format(col, lag)
-                                              for col in self.game.columns})
-        return df_lagged
-
-    def _filter_game_events(self, **kwargs):
-        return Game(**kwargs)\
-            .clean_game_data()\
+    def _filter_game_events(self, game=None, **kwargs):
+        if game is None:
+            game = Game(**kwargs).clean_game_data()
+        return game\
             .reset_index(drop=True)\
             .query('{} not in {}'.format(stg.EVENT_TYPE_COL,
                                          [stg.EVENTS_MAP['START_PERIOD'], stg.EVENTS_MAP['END_PERIOD']]))
 
     def _project_coordinates_along_team1_axis(self, df):
-        df_projections = df.assign(**{stg.X_PROJECTED_COL: lambda x: x[stg.TEAM_COL].apply(int) * x[stg.X_COL].apply(float) + (1 - x[stg.TEAM_COL].apply(int)) * (100 - x[stg.X_COL].apply(float)),
-                                      stg.Y_PROJECTED_COL: lambda x: x[stg.TEAM_COL].apply(int) * x[stg.Y_COL].apply(float) + (1 - x[stg.TEAM_COL].apply(int)) * (100 - x[stg.Y_COL].apply(float))
-                                      })
+        is_team1 = df[stg.TEAM_COL] == 1
+        df_projections = df.assign(**{stg.X_PROJECTED_COL: df[stg.X_COL].where(is_team1, 100 - df[stg.X_COL]),
+                                      stg.Y_PROJECTED_COL: df[stg.Y_COL].where(is_team1, 100 - df[stg.Y_COL])})
 
         return df_projections
 
@@ -101,7 +105,7 @@ class StatsGameAnalyzer():
     def __init__(self, **kwargs):
         """Initialize class."""
         try:
-            self.game = self._fillna_game_data_and_convert_types(**kwargs)
+            self.game = self._get_game_events_with_player(**kwargs)
         except TypeError as error:
             raise NameError('Error in StatsGameAnalyzer initialization - {}'.format(error))
 
@@ -121,7 +125,7 @@ class StatsGameAnalyzer():
             Dataframe to make predictions on
 
         """
-        df_players = df_15_min.query('{} == "1"'.format(stg.PLAYER_COL))\
+        df_players = df_15_min.query('{} == {}'.format(stg.PLAYER_COL, stg.PLAYER_TO_PREDICT_ID))\
                               .filter(items=[stg.PLAYER_COL, stg.TEAM_COL])\
                               .drop_duplicates()
 
@@ -145,23 +149,19 @@ class StatsGameAnalyzer():
         return df_stats
 
     def _get_player_position(self, df_with_events):
-        QUALIFIER_COLNAME = '{}_{}'.format(stg.QUALIFIER_COL, stg.QUALIFIER_MAP['ZONE'])
-
-        player_pct_positions = df_with_events.query('{} != "no_position"'.format(QUALIFIER_COLNAME))\
-                                             .groupby(by=[stg.PLAYER_COL, QUALIFIER_COLNAME])\
-                                             .agg({QUALIFIER_COLNAME: 'count'}) \
-                                             .groupby(level=0).apply(lambda x: 100 * x / float(x.sum())) \
-                                             .rename(columns={QUALIFIER_COLNAME: 'nb'}) \
-                                             .reset_index() \
-                                             .pivot(index=stg.PLAYER_COL, columns=QUALIFIER_COLNAME, values='nb')\
-                                             .fillna(0)\
-                                             .reset_index()
+        df_positions = df_with_events[df_with_events[stg.ZONE_COL] != stg.NO_POSITION]
+
+        nb_by_position = df_positions.groupby(by=[df_positions[stg.PLAYER_COL],
+                                                  df_positions[stg.ZONE_COL].astype(str)])\
+                                     .size()\
+                                     .unstack(fill_value=0)
+        player_pct_positions = (100 * nb_by_position).div(nb_by_position.sum(axis=1), axis=0)\
+                                                     .rename_axis(None, axis=1)\
+                                                     .reset_index()
 
         return player_pct_positions
 
     def _build_dataset_from_bool_columns(self, df_with_events):
-        players = pd.DataFrame({stg.PLAYER_COL: list()})
-
         nb_keypass = self._count_number_by_player_and_col(df=df_with_events, column=stg.KEYPASS_COL)
         nb_assist = self._count_number_by_player_and_col(df=df_with_events, column=stg.ASSIST_COL)
         nb_gk_events = self._compute_nb_gk_events(df=df_with_events)
@@ -173,44 +173,31 @@ class StatsGameAnalyzer():
                                                       previous_event_id=stg.EVENTS_MAP['CORNER_AWARDED'],
                                                       colname=stg.CORNER_COL)
 
-        df_out = players.merge(right=nb_keypass, on=stg.PLAYER_COL, how='outer')\
-                        .merge(right=nb_assist, on=stg.PLAYER_COL, how='outer')\
-                        .merge(right=nb_gk_events, on=stg.PLAYER_COL, how='outer')\
-                        .merge(right=nb_shots, on=stg.PLAYER_COL, how='outer')\
-                        .merge(right=nb_free_kick_pass, on=stg.PLAYER_COL, how='outer')\
-                        .merge(right=nb_corner, on=stg.PLAYER_COL, how='outer')
+        df_out = pd.concat([nb_keypass, nb_assist, nb_gk_events, nb_shots, nb_free_kick_pass, nb_corner],
+                           axis=1, sort=False)\
+                   .reset_index()
 
         return df_out
 
     def _compute_nb_gk_events(self, df):
-        df_gk_events = df.assign(**{stg.GK_EVENTS_COL: lambda x: x[stg.EVENT_TYPE_COL].apply(lambda x: 1 if x in stg.GK_EVENTS else 0)
-                                    })
+        df_gk_events = df.assign(**{stg.GK_EVENTS_COL: df[stg.EVENT_TYPE_COL].isin(stg.GK_EVENTS)})
 
         df_gk_by_player = self._count_number_by_player_and_col(df=df_gk_events,
                                                                column=stg.GK_EVENTS_COL)
         return df_gk_by_player
 
     def _compute_nb_shots(self, df):
-        df_shots = df.assign(**{stg.SHOTS_COL: lambda x: x[stg.EVENT_TYPE_COL].apply(lambda x: 1 if x in stg.SHOTS_EVENTS else 0)})
+        df_shots = df.assign(**{stg.SHOTS_COL: df[stg.EVENT_TYPE_COL].isin(stg.SHOTS_EVENTS)})
 
         df_shots_by_player = self._count_number_by_player_and_col(df=df_shots,
                                                                   column=stg.SHOTS_COL)
         return df_shots_by_player
 
     def _compute_nb_pass_after_event(self, df, previous_event_id, colname):
-        PREVIOUS_EVENT = '{}_previous_event'.format(stg.EVENT_TYPE_COL)
+        bool_event = df[stg.EVENT_TYPE_COL] == stg.EVENTS_MAP['PASS']
+        bool_prev_event = df[stg.EVENT_TYPE_COL].shift(1) == previous_event_id
 
-        df_previous_event = df.shift(1)[[stg.EVENT_TYPE_COL]]\
-                              .rename(columns={stg.EVENT_TYPE_COL: PREVIOUS_EVENT})
-
-        with_prev_event = df.merge(right=df_previous_event, right_index=True,
-                                   left_index=True, how='inner')
-
-        with_prev_event['bool_event'] = with_prev_event[stg.EVENT_TYPE_COL] == stg.EVENTS_MAP['PASS']
-        with_prev_event['bool_prev_event'] = with_prev_event[PREVIOUS_EVENT] == previous_event_id
-        with_prev_event[colname] = with_prev_event['bool_event'] & with_prev_event['bool_prev_event']
-
-        df_nb = self._count_number_by_player_and_col(df=with_prev_event,
+        df_nb = self._count_number_by_player_and_col(df=df.assign(**{colname: bool_event & bool_prev_event}),
                                                      column=colname)
         return df_nb
 
@@ -257,7 +244,7 @@ class StatsGameAnalyzer():
                                                 list_event_type_id=list_event_type_id)
 
         df_success = df.query('{} in {}'.format(stg.EVENT_TYPE_COL, list_event_type_id))\
-                       .query('{} == "1"'.format(stg.OUTCOME_COL))\
+                       .query('{} == 1'.format(stg.OUTCOME_COL))\
                        .groupby(by=[agg_column, stg.EVENT_TYPE_COL])\
                        .agg({stg.EVENT_TYPE_COL: 'count'})\
                        .rename(columns={stg.EVENT_TYPE_COL: 'success'})\
@@ -275,12 +262,26 @@ class StatsGameAnalyzer():
 
         return df_stats
 
-    def _fillna_game_data_and_convert_types(self, **kwargs):
-        game_data = Game(**kwargs).clean_game_data()\
-                                  .fillna(value={stg.KEYPASS_COL: '0',
-                                                 stg.ASSIST_COL: '0',
-                                                 '{}_{}'.format(stg.QUALIFIER_COL, stg.QUALIFIER_MAP['ZONE']): 'no_position'})\
-                                  .assign(**{stg.KEYPASS_COL: lambda x: x[stg.KEYPASS_COL].apply(int),
-                                             stg.ASSIST_COL: lambda x: x[stg.ASSIST_COL].apply(int)})
+    def _get_game_events_with_player(self, game=None, **kwargs):
+        game_data = Game(**kwargs).clean_game_data() if game is None else game
+
+        return game_data[game_data[stg.PLAYER_COL] != stg.MISSING_PLAYER_ID].dropna().reset_index(drop=True)
+
 
-        return game_data.dropna().reset_index(drop=True)
+def get_club_ids(game_ids, team_ids):
+    """Get OPTA IDs of clubs from games IDs and binarized teams IDs.
+
+    Parameters
+    ----------
+    game_ids: array-like
+        Values of GAME_ID_COL, as '<home club ID>-<away club ID>'
+    team_ids: array-like
+        Values of TEAM_COL, 1 for home team and 0 for away team
+
+    Returns
+    -------
+    club_ids: numpy.ndarray
+
+    """
+    home_away_ids = np.array([str(game_id).split('-', 1) for game_id in game_ids]).reshape(-1, 2)
+    return np.where(np.asarray(team_ids).astype(int) == 1, home_away_ids[:, 0], home_away_ids[:, 1])
@@ -0,0 +1,315 @@
+from collections import Counter, deque, namedtuple, OrderedDict
+from lxml import etree
+from os.path import basename, splitext
+import logging
+import numpy as np
+import pandas as pd
+import time
+
+import settings as stg
+
+if __name__ == '__main__':
+    stg.enable_logging(log_filename='{}.log'.format(splitext(basename(__file__))[0]),
+                       logging_level=logging.DEBUG)
+
+
+LaggedEvent = namedtuple('LaggedEvent', [stg.EVENT_TYPE_COL, stg.TEAM_COL,
+                                         stg.X_PROJECTED_COL, stg.Y_PROJECTED_COL])
+WindowEvent = namedtuple('WindowEvent', ['game_time', 'player', 'team', 'keys', 'team_keys'])
+
+
+class LiveFeatureState():
+    """Features of a game updated event by event, as received from a live OPTA feed.
+
+    Events are cleaned one at a time with the same rules as Game.clean_game_data().
+    Lags for next event models are read from ring buffers of last events of current
+    period, as NextEventInGame would do on the whole game. Stats for player model
+    are running counters by player and by team, incremented when an event enters
+    window and decremented when it leaves it, as StatsGameAnalyzer would compute on
+    events of window. Every update costs O(1) whatever the number of events received.
+
+    Attributes
+    ----------
+    home_id: string
+    away_id: string
+    lags: list
+        Lags of next event features
+    window_length_sec: integer
+        Length of window of player stats, events of previous periods are always out of window
+    period: integer
+        Period of last received event, None before first event
+    game_time: integer
+        Game time in seconds of last received event, None before first event
+
+    """
+
+    NO_PREVIOUS_EVENT = -1
+    EVENTS = 'events'
+    POSITIONED = 'positioned'
+
+    def __init__(self, home_id, away_id, lags=stg.NEXT_EVENT_LAGS,
+                 window_length_min=stg.STATS_WINDOW_LENGTH_MIN):
+        """Initialize class.
+
+        Parameters
+        ----------
+        home_id: string
+            OPTA ID of home team, team_id 1 once cleaned
+        away_id: string
+            OPTA ID of away team, team_id 0 once cleaned
+        lags: list, default NEXT_EVENT_LAGS in settings
+        window_length_min: integer, default STATS_WINDOW_LENGTH_MIN in settings
+
+        """
+        self.home_id, self.away_id = home_id, away_id
+        self.lags = lags
+        self.window_length_sec = 60 * window_length_min
+        self.period, self.game_time = None, None
+
+        self._last_events = deque(maxlen=max(lags, default=0))
+        self._window = deque()
+        self._previous_event_type = self.NO_PREVIOUS_EVENT
+        self._players_counts = dict()
+        self._players_teams = dict()
+        self._teams_counts = dict()
+        self._zones_counts = Counter()
+
+    def update(self, event):
+        """Add an event received from feed.
+
+        Parameters
+        ----------
+        event: dict
+            Attributes of an OPTA event as strings, as read in XML file, and
+            zone of event in ZONE_COL if any
+
+        Returns
+        -------
+        self: LiveFeatureState
+
+        """
+        if event.get(stg.PERIOD_COL) not in ('1', '2') \
+                or int(event[stg.EVENT_TYPE_COL]) == stg.EVENTS_MAP['DELETED_EVENT']:
+            return self
+
+        period = int(event[stg.PERIOD_COL])
+        event_type = int(event[stg.EVENT_TYPE_COL])
+        team = int({self.home_id: '1', self.away_id: '0'}.get(event[stg.TEAM_COL], event[stg.TEAM_COL]))
+        game_time = 60 * int(event[stg.MINUTES_COL]) + int(event[stg.SECONDS_COL])
+        x, y = np.float32(event.get(stg.X_COL, np.nan)), np.float32(event.get(stg.Y_COL, np.nan))
+
+        if period != self.period:
+            self._start_period(period=period)
+        self.game_time = game_time
+
+        if event_type not in (stg.EVENTS_MAP['START_PERIOD'], stg.EVENTS_MAP['END_PERIOD']):
+            is_team1 = team == 1
+            self._last_events.append(LaggedEvent(event_type, team,
+                                                 x if is_team1 else np.float32(100) - x,
+                                                 y if is_team1 else np.float32(100) - y))
+
+        player = int(event.get(stg.PLAYER_COL, stg.MISSING_PLAYER_ID))
+        if player != stg.MISSING_PLAYER_ID and not (np.isnan(x) or np.isnan(y)):
+            self._add_to_window(event=event, event_type=event_type, player=player, team=team)
+        self._expire_window()
+        return self
+
+    def update_from_xml(self, event_xml_element):
+        """Add an event received as an OPTA XML element.
+
+        Parameters
+        ----------
+        event_xml_element: lxml.etree._Element
+
+        Returns
+        -------
+        self: LiveFeatureState
+
+        """
+        return self.update(event=read_event(event_xml_element=event_xml_element))
+
+    def get_next_event_features(self, features=stg.NEXT_TEAM_FEATURES):
+        """Get features to predict event following last received one.
+
+        Parameters
+        ----------
+        features: list, default NEXT_TEAM_FEATURES in settings
+            Lagged columns to return, e.g. X_PROJ_FEATURES or Y_PROJ_FEATURES in settings
+
+        Returns
+        -------
+        X: pandas.DataFrame
+            Single row of features, None if current period has fewer events than largest lag
+
+        """
+        if len(self._last_events) < self._last_events.maxlen:
+            return None
+
+        lagged_values = {'{}_lag{}'.format(col, lag): getattr(self._last_events[-lag], col)
+                         for lag in self.lags
+                         for col in LaggedEvent._fields}
+        return pd.DataFrame([[lagged_values[feature] for feature in features]], columns=features)
+
+    def get_player_features(self, player_id=stg.PLAYER_TO_PREDICT_ID):
+        """Get stats of a player on events of window.
+
+        Parameters
+        ----------
+        player_id: integer, default PLAYER_TO_PREDICT_ID in settings
+
+        Returns
+        -------
+        X: pandas.DataFrame
+            Single row with PLAYER_FEATURES in settings, None if player has no event in window
+
+        """
+        if player_id not in self._players_counts:
+            return None
+
+        team = self._players_teams[player_id]
+        player_counts, team_counts = self._players_counts[player_id], self._teams_counts[team]
+
+        features = OrderedDict([(stg.TEAM_COL, team)])
+        for col in [stg.ASSIST_COL, stg.KEYPASS_COL, stg.GK_EVENTS_COL, stg.SHOTS_COL,
+                    stg.FREE_KICK_COL, stg.CORNER_COL]:
+            features['nb_{}'.format(col)] = player_counts[col]
+        for zone in stg.ZONES:
+            # Zones without any event in window are missing values, as in GameWindowStats
+            features[zone] = 100 * player_counts[zone] / player_counts[self.POSITIONED] \
+                if player_counts[self.POSITIONED] and self._zones_counts[zone] else np.nan
+
+        for prefix, counts in [('p', player_counts), ('t', team_counts)]:
+            for event_id in stg.EVENTS_COMPUTE_SUCCESS_RATE:
+                features['{}_{}_nb'.format(prefix, event_id)] = counts[event_id]
+                features['{}_{}_success_rate'.format(prefix, event_id)] = \
+                    counts[(event_id, 'success')] / counts[event_id] if counts[event_id] else np.nan
+            for event_id in stg.EVENTS_COMPUTE_NUMBER:
+                features['{}_{}_nb'.format(prefix, event_id)] = counts[event_id]
+
+        return pd.DataFrame([list(features.values())], columns=list(features))[stg.PLAYER_FEATURES]
+
+    def _start_period(self, period):
+        self.period = period
+        self._last_events.clear()
+        while self._window:
+            self._remove_from_window(window_event=self._window.popleft())
+        self._previous_event_type = self.NO_PREVIOUS_EVENT
+
+    def _add_to_window(self, event, event_type, player, team):
+        keys = [self.EVENTS, event_type] + [stg.ASSIST_COL] * int(event.get(stg.ASSIST_COL, 0))\
+            + [stg.KEYPASS_COL] * int(event.get(stg.KEYPASS_COL, 0))
+        if int(event.get(stg.OUTCOME_COL, 0)) == 1:
+            keys.append((event_type, 'success'))
+        if event_type in stg.GK_EVENTS:
+            keys.append(stg.GK_EVENTS_COL)
+        if event_type in stg.SHOTS_EVENTS:
+            keys.append(stg.SHOTS_COL)
+        if event_type == stg.EVENTS_MAP['PASS']:
+            keys.extend(self._get_pass_after_event_keys())
+
+        zone = event.get(stg.ZONE_COL, stg.NO_POSITION)
+        if zone != stg.NO_POSITION:
+            keys.extend([zone, self.POSITIONED])
+
+        # Team stats only count events and successes, see StatsGameAnalyzer._get_agg_stats
+        team_keys = [key for key in keys if key == event_type or key == (event_type, 'success')]
+        window_event = WindowEvent(self.game_time, player, team, keys, team_keys)
+
+        self._window.append(window_event)
+        self._players_counts.setdefault(player, Counter()).update(keys)
+        self._teams_counts.setdefault(team, Counter()).update(team_keys)
+        if zone != stg.NO_POSITION:
+            self._zones_counts[zone] += 1
+        self._players_teams[player] = team
+        self._previous_event_type = event_type
+
+    def _get_pass_after_event_keys(self):
+        if self._previous_event_type == stg.EVENTS_MAP['FOUL']:
+            return [stg.FREE_KICK_COL]
+        if self._previous_event_type == stg.EVENTS_MAP['CORNER_AWARDED']:
+            return [stg.CORNER_COL]
+        return []
+
+    def _expire_window(self):
+        while self._window and self._window[0].game_time <= self.game_time - self.window_length_sec:
+            self._remove_from_window(window_event=self._window.popleft())
+
+            # First event of window has no previous event any more, as in a DataFrame shift
+            if self._window:
+                first_event = self._window[0]
+                pass_after_event_keys = [key for key in first_event.keys
+                                         if key in (stg.FREE_KICK_COL, stg.CORNER_COL)]
+                if pass_after_event_keys:
+                    self._players_counts[first_event.player].subtract(pass_after_event_keys)
+                    self._window[0] = first_event._replace(keys=[key for key in first_event.keys
+                                                                 if key not in pass_after_event_keys])
+        if not self._window:
+            self._previous_event_type = self.NO_PREVIOUS_EVENT
+
+    def _remove_from_window(self, window_event):
+        player_counts = self._players_counts[window_event.player]
+        player_counts.subtract(window_event.keys)
+        self._teams_counts[window_event.team].subtract(window_event.team_keys)
+        self._zones_counts.subtract(key for key in window_event.keys if key in stg.ZONES)
+        if not player_counts[self.EVENTS]:
+            del self._players_counts[window_event.player]
+
+
+def read_event(event_xml_element):
+    """Read attributes of an OPTA event and its zone, as Game does for a whole file.
+
+    Parameters
+    ----------
+    event_xml_element: lxml.etree._Element
+
+    Returns
+    -------
+    event: dict
+
+    """
+    event = dict(event_xml_element.attrib)
+    for qualifier in event_xml_element.iterfind(stg.XML_QUALIFIER_TAG):
+        if qualifier.get(stg.QUALIFIER_COL) == stg.QUALIFIER_MAP['ZONE']:
+            event[stg.ZONE_COL] = qualifier.get(stg.XML_QUALIFIER_VALUE_ATTRIBUTE, 'value')
+    return event
+
+
+def iter_game_feed(file_path):
+    """Replay an OPTA file as a live feed.
+
+    Parameters
+    ----------
+    file_path: string
+
+    Yields
+    ------
+    home_id: string
+    away_id: string
+    event: dict
+        Output of read_event(), one event after the other in file order
+
+    """
+    home_id, away_id = None, None
+    for action, element in etree.iterparse(file_path, events=('start', 'end'),
+                                           tag=(stg.XML_GAME_TAG, stg.XML_EVENT_TAG)):
+        if element.tag == stg.XML_GAME_TAG:
+            if action == 'start' and home_id is None:
+                home_id, away_id = element.get('home_team_id'), element.get('away_team_id')
+            continue
+        if action == 'end':
+            yield home_id, away_id, read_event(event_xml_element=element)
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+
+
+if __name__ == '__main__':
+    start = time.time()
+    state = None
+    for number_of_events, (home_id, away_id, event) in enumerate(iter_game_feed('cleaned_test_set.xml'), 1):
+        state = state or LiveFeatureState(home_id=home_id, away_id=away_id)
+        state.update(event=event)
+        state.get_next_event_features()
+        state.get_player_features()
+    logging.info('{} events replayed with features after every event: {}'.format(number_of_events,
+                                                                               time.time() - start))
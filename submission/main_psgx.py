@@ -1,16 +1,24 @@
-from multiprocessing import Process, Value, Array
-from os.path import splitext, basename
+from multiprocessing import Array, Pipe, Process, Value
+from os.path import isfile, splitext, basename
 from psutil import virtual_memory
 from sklearn.externals.joblib import load
 
 import csv
+import gc
 import logging
+import numpy as np
 import os
 import pandas as pd
 import sys
 import time
 
-from games_info import StatsGameAnalyzer, NextEventInGame
+from cascade_model import CascadeModel
+from compiled_pipeline import CompiledPipeline, get_compiled_pipeline_path
+from early_exit_forest import EarlyExitForest, is_early_exit_compatible
+from game import Game
+from games_info import StatsGameAnalyzer, NextEventInGame, get_club_ids
+from model_artifacts import get_mapped_artifact_path, load_mapped_artifact
+from team_routing import TeamPlayerModel
 
 import settings as stg
 
@@ -23,137 +31,377 @@ if __name__ == '__main__':
     stg.enable_logging(log_filename='{}.log'.format(splitext(basename(__file__))[0]),
                        logging_level=logging.INFO)
 
+# Pipelines loaded before forking workers, see load_shared_pipelines()
+SHARED_PIPELINES = dict()
+NEXT_EVENT_PIPELINES_NAMES = ['next_team_model', 'next_team_feat_eng_dict',
+                              'xcoords_model', 'xcoords_feat_eng_dict',
+                              'ycoords_model', 'ycoords_feat_eng_dict']
 
-def Result(xml_filename='instructions/cleaned_test_set.xml'):
-    """Compute result for test set."""
-    predicted_player = Value('i', 59957)
-    predicted_next_event = Array('d', [0, 50, 50])
 
-    p1 = Process(target=predict_player, args=(predicted_player, 'instructions/cleaned_test_set.xml'))
-    p2 = Process(target=predict_next_team_and_coords, args=(predicted_next_event, 'instructions/cleaned_test_set.xml'))
+def Result(xml_filename='instructions/cleaned_test_set.xml', fork_after_load=stg.BOOL_FORK_AFTER_LOAD):
+    """Compute result for test set.
+
+    Models of both problems are loaded in two processes started first. Meanwhile,
+    test set is parsed and cleaned once in current process and features of both
+    problems are built from same cleaned events, then sent to the processes to be
+    predicted as soon as their models are loaded.
+
+    With fork_after_load, all models are instead loaded in current process before
+    starting the processes, which share them (see load_shared_pipelines()).
+
+    """
+    start = time.time()
+    if fork_after_load:
+        load_shared_pipelines(nb_workers=2)
+        logging.info('Pb 1, 2 & 3 - After model load: {}'.format(time.time() - start))
+    predicted_player = Value('i', stg.DEFAULT_PLAYER_PREDICTION)
+    predicted_next_event = Array('d', stg.DEFAULT_NEXT_EVENT_PREDICTION)
+    player_features_receiver, player_features_sender = Pipe(duplex=False)
+    next_event_features_receiver, next_event_features_sender = Pipe(duplex=False)
+
+    p1 = Process(target=predict_player, args=(predicted_player, player_features_receiver, start))
+    p2 = Process(target=predict_next_team_and_coords, args=(predicted_next_event, next_event_features_receiver, start))
     p1.start()
     p2.start()
+
+    try:
+        player_stats, df_events = build_test_set_features(xml_filename=xml_filename)
+        logging.info('Pb 1, 2 & 3 - After feature engineering: {}'.format(time.time() - start))
+    except Exception:
+        logging.exception('Feature engineering failed - default predictions kept')
+        player_stats, df_events = None, None
+    player_features_sender.send(player_stats)
+    next_event_features_sender.send(df_events)
+
     p1.join()
     p2.join()
 
-    with open('./res_psgx.csv', mode='w') as result_file:
+    write_result(prediction=[predicted_player.value] + list(predicted_next_event))
+
+
+def write_result(prediction, result_filename=stg.RESULT_FILENAME):
+    """Write predicted player, next team, y and x in csv file."""
+    with open(result_filename, mode='w') as result_file:
         prediction_writer = csv.writer(result_file, delimiter=',',
                                        quoting=csv.QUOTE_MINIMAL)
-        prediction_writer.writerow([int(predicted_player.value),
-                                    int(predicted_next_event[0]),
-                                    predicted_next_event[1],
-                                    predicted_next_event[2]
+        prediction_writer.writerow([int(prediction[0]),
+                                    int(prediction[1]),
+                                    prediction[2],
+                                    prediction[3]
                                     ])
 
 
-def predict_player(player_id, xml_filename='instructions/cleaned_test_set.xml'):
+def predict_player(player_id, features_receiver, start):
     """Predict player.
 
     Parameters
     ----------
     player_id: multiprocessing.Value object
         Contains predicted player_id
+    features_receiver: multiprocessing.Connection object
+        Receives stats of player to predict, None if they could not be computed
+    start: float
+        Start time of Result(), for timings
+
+    """
+    pipelines = load_player_pipelines()
+    logging.info('Pb 1 - After model load: {}'.format(time.time() - start))
+
+    player_stats = features_receiver.recv()
+    if player_stats is None:
+        return
+
+    player_id.value = compute_player_predictions(player_stats=player_stats, pipelines=pipelines)[0]
+    logging.info('Pb 1 - After prediction {}'.format(time.time() - start))
+
+
+def predict_next_team_and_coords(next_event_array, features_receiver, start):
+    """Predict next event characteristics.
+
+    Parameters
+    ----------
+    next_event_array: multiprocessing.Array object
+        Contains predictions for next team, y and x
+    features_receiver: multiprocessing.Connection object
+        Receives lags of events preceding the one to predict, None if they could not be computed
+    start: float
+        Start time of Result(), for timings
+
+    """
+    pipelines = load_next_event_pipelines()
+    logging.info('Pb 2 & 3 - After model load: {}'.format(time.time() - start))
+
+    df_events = features_receiver.recv()
+    if df_events is None:
+        return
+
+    next_event_array[:] = compute_next_event_predictions(df_events=df_events, pipelines=pipelines)[0]
+    logging.info('Pb 2 & 3 - After prediction: {}'.format(time.time() - start))
+
+
+def build_test_set_features(xml_filename):
+    """Build features of player and next event models for a test set.
+
+    Parameters
+    ----------
     xml_filename: string
-        Path to access test XML filename
+
+    Returns
+    -------
+    player_stats: pandas.DataFrame
+        Stats of player to predict, None if he has no event
+    df_events: pandas.DataFrame
+        Single row with lags of events preceding the one to predict, None if not enough events
 
     """
-    start = time.time()
-    sga = StatsGameAnalyzer(filename=xml_filename)
+    # XML file is parsed and cleaned once for both problems
+    game = Game(filename=xml_filename).clean_game_data()
+
+    sga = StatsGameAnalyzer(game=game)
     player_stats = sga.build_stats_for_test_set(df_15_min=sga.game.head(-10),
                                                 list_events_number=stg.EVENTS_COMPUTE_NUMBER,
                                                 list_events_with_success_rate=stg.EVENTS_COMPUTE_SUCCESS_RATE)
+    player_stats[stg.CLUB_COL] = get_club_ids(game_ids=game[stg.GAME_ID_COL].iloc[:1].repeat(len(player_stats)),
+                                              team_ids=player_stats[stg.TEAM_COL])
+
+    df_events = NextEventInGame(game=game)\
+        .build_next_event_dataset(columns_to_lag=stg.NEXT_EVENT_COLS_TO_LAG,
+                                  lags_to_add=stg.NEXT_EVENT_LAGS)\
+        .tail(1)
+
+    return (player_stats.head(1) if player_stats.shape[0] else None,
+            df_events if df_events.shape[0] else None)
+
+
+def load_shared_pipelines(nb_workers=1):
+    """Load all pipelines in current process, before forking workers sharing them.
+
+    Workers forked afterwards read pipelines from SHARED_PIPELINES instead of loading
+    them: arrays of fitted models are shared copy-on-write with current process, so
+    that memory stays close to a single copy whatever the number of workers.
+
+    Parameters
+    ----------
+    nb_workers: integer, default 1
+        Number of workers to be forked, not used for RAM check as pipelines are shared
+
+    Returns
+    -------
+    pipelines: dict
+
+    """
+    SHARED_PIPELINES.update(load_player_pipelines(nb_model_copies=1), **load_next_event_pipelines())
+    if isinstance(SHARED_PIPELINES['player_model'], TeamPlayerModel):
+        SHARED_PIPELINES['player_model'].load_all()
+    # Objects loaded once are never freed: keep garbage collector from writing in their pages
+    gc.collect()
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
+    logging.info('.. Pipelines loaded once for {} forked workers'.format(nb_workers))
+    return SHARED_PIPELINES
+
+
+def load_player_pipelines(nb_model_copies=1):
+    """Load pipeline and missing values of player model.
+
+    Player model by club is used if it exists, its sub-models being loaded when used.
+    Otherwise single player model is loaded, light pipeline if RAM is too low, behind
+    first stage of cascade if configured. Forests vote with early exit.
+
+    Parameters
+    ----------
+    nb_model_copies: integer, default 1
+        Number of processes holding their own copy of player model,
+        1 if loaded once and shared by forked workers
+
+    Returns
+    -------
+    pipelines: dict
+
+    """
+    if SHARED_PIPELINES:
+        return {name: SHARED_PIPELINES[name] for name in ['player_model', 'median_train_set']}
+
+    ram_go = virtual_memory().total / 1e9
+    min_ram_go = stg.PLAYER_MODEL_RAM_GO * nb_model_copies + stg.OTHER_PROCESSES_RAM_GO
+    if stg.BOOL_USE_PLAYER_TEAM_MODEL and isfile(stg.PLAYER_TEAM_MODEL_NAME):
+        player_model = TeamPlayerModel(index_filename=stg.PLAYER_TEAM_MODEL_NAME, load_function=load_forest_model)
+    elif ram_go >= min_ram_go:
+        player_model = load_forest_model(stg.PLAYER_MODEL_NAME)
+    else:
+        logging.info('.. RAM memory lower than {} Go - Light model loaded'.format(min_ram_go))
+        player_model = load_forest_model(stg.PLAYER_MODEL_LIGHT_NAME)
+
+    if not isinstance(player_model, TeamPlayerModel):
+        player_model = add_cascade_first_stage(model=player_model, model_name='player_model')
+
+    return {'player_model': player_model,
+            'median_train_set': load_model(stg.PLAYER_FEATURES_MEDIAN_FILENAME)}
+
+
+def load_next_event_pipelines():
+    """Load pipelines and feature engineering dictionaries of next team and coordinates models.
+
+    Returns
+    -------
+    pipelines: dict
+
+    """
+    if SHARED_PIPELINES:
+        return {name: SHARED_PIPELINES[name] for name in NEXT_EVENT_PIPELINES_NAMES}
+
+    return {'next_team_model': add_cascade_first_stage(model=load_forest_model(stg.NEXT_TEAM_MODEL_NAME),
+                                                       model_name='next_team_model'),
+            'next_team_feat_eng_dict': load_model(stg.NEXT_TEAM_FEAT_ENG_DICT),
+            'xcoords_model': load_model(stg.X_PROJ_MODEL_NAME),
+            'xcoords_feat_eng_dict': load_model(stg.X_PROJ_FEAT_ENG_DICT),
+            'ycoords_model': load_model(stg.Y_PROJ_MODEL_NAME),
+            'ycoords_feat_eng_dict': load_model(stg.Y_PROJ_FEAT_ENG_DICT)}
+
+
+def compute_player_predictions(player_stats, pipelines):
+    """Predict players from their stats, with a single call to model for all rows.
+
+    Parameters
+    ----------
+    player_stats: pandas.DataFrame
+        Output of StatsGameAnalyzer.build_stats_for_test_set() or LiveFeatureState.get_player_features(),
+        one row by player to predict, with CLUB_COL for player model by club
+    pipelines: dict
+        Output of load_player_pipelines()
+
+    Returns
+    -------
+    player_pred: numpy.ndarray
+        Predicted player ID by row
 
+    """
     all_feats = pd.DataFrame(columns=stg.PLAYER_FEATURES)
     player_all_stats = pd.concat([all_feats, player_stats], axis=0, ignore_index=True, sort=False)
 
-    median_train_set = load(stg.PLAYER_FEATURES_MEDIAN_FILENAME)
-    X_test = player_all_stats.drop(labels=stg.PLAYER_COL, axis=1)\
+    X_test = player_all_stats.drop(labels=stg.PLAYER_COL, axis=1, errors='ignore')\
                              .fillna({col: 0 for col in player_all_stats.columns if col.endswith('_nb')})\
-                             .fillna(median_train_set)
-    logging.info('Pb 1 - After feature engineering: {}'.format(time.time() - start))
+                             .fillna(pipelines['median_train_set'])
 
-    ram_go = virtual_memory().total / 1e9
-    if ram_go >= 5:
-        player_model = load(stg.PLAYER_MODEL_NAME)
-    else:
-        logging.info('.. RAM memory lower than 5 Go - Light model loaded')
-        player_model = load(stg.PLAYER_MODEL_LIGHT_NAME)
-    logging.info('Pb 1 - After model load: {}'.format(time.time() - start))
+    # Player model by club also reads club of every row
+    if isinstance(pipelines['player_model'], TeamPlayerModel):
+        return pipelines['player_model'].predict(X_test[stg.PLAYER_FEATURES + [pipelines['player_model'].team_column]])
+    return pipelines['player_model'].predict(X_test[stg.PLAYER_FEATURES])
 
-    player_pred = player_model.predict(X_test)
-    logging.info('Pb 1 - After prediction {}'.format(time.time() - start))
 
-    player_id.value = player_pred[0]
+def compute_next_event_predictions(df_events, pipelines):
+    """Predict next team and coordinates from previous events, with a single call to every model for all rows.
 
+    Parameters
+    ----------
+    df_events: pandas.DataFrame
+        Lags of previous events, e.g. last row of NextEventInGame.build_next_event_dataset(),
+        one row by event to predict
+    pipelines: dict
+        Output of load_next_event_pipelines()
+
+    Returns
+    -------
+    next_event_pred: numpy.ndarray
+        Predictions for next team, y and x by row
+
+    """
+    X_next_event = _map_event_types_lags(X=df_events[stg.NEXT_TEAM_FEATURES],
+                                         feat_eng_dict=pipelines['next_team_feat_eng_dict'])
+    X_xcoords = _map_event_types_lags(X=df_events[stg.X_PROJ_FEATURES],
+                                      feat_eng_dict=pipelines['xcoords_feat_eng_dict'])
+    X_ycoords = _map_event_types_lags(X=df_events[stg.Y_PROJ_FEATURES],
+                                      feat_eng_dict=pipelines['ycoords_feat_eng_dict'])
+
+    next_team_pred = pipelines['next_team_model'].predict(X_next_event)
+    xcoords_along_team1 = pipelines['xcoords_model'].predict(X_xcoords)
+    ycoords_along_team1 = pipelines['ycoords_model'].predict(X_ycoords)
+
+    xcoord_pred = next_team_pred * xcoords_along_team1 + (1 - next_team_pred) * (100 - xcoords_along_team1)
+    ycoord_pred = next_team_pred * ycoords_along_team1 + (1 - next_team_pred) * (100 - ycoords_along_team1)
+
+    return np.column_stack([next_team_pred, ycoord_pred, xcoord_pred])
 
-def predict_next_team_and_coords(next_event_array, xml_filename='instructions/cleaned_test_set.xml'):
-    """Predict next event characteristics.
+
+def add_cascade_first_stage(model, model_name):
+    """Put model behind first stage of its cascade, if a cascade is configured for it.
 
     Parameters
     ----------
-    next_event_array: multiprocessing.Array object
-        Contains predictions for next team, y and x
-    xml_filename: string
-        Path to access test XML filename
+    model: fitted classifier
+    model_name: string
+        Key of model in CASCADE_CONFIG_FILENAME, e.g. 'player_model'
+
+    Returns
+    -------
+    model: CascadeModel or model itself if no cascade is configured
 
     """
-    start = time.time()
-    neig = NextEventInGame(filename=xml_filename)
-    df_events = neig.build_next_event_dataset(columns_to_lag=stg.NEXT_EVENT_COLS_TO_LAG,
-                                              lags_to_add=stg.NEXT_EVENT_LAGS)
+    if not (stg.BOOL_USE_CASCADE and isfile(stg.CASCADE_CONFIG_FILENAME)):
+        return model
 
-    X_next_event = df_events[stg.NEXT_TEAM_FEATURES].tail(1)
-    X_xcoords = df_events[stg.X_PROJ_FEATURES].tail(1)
-    X_ycoords = df_events[stg.Y_PROJ_FEATURES].tail(1)
+    cascade_config = load_model(stg.CASCADE_CONFIG_FILENAME).get(model_name)
+    if cascade_config is None:
+        return model
+    return CascadeModel(first_stage=load_model(cascade_config['first_stage']), second_stage=model,
+                        threshold=cascade_config['threshold'], confidence=cascade_config['confidence'])
 
-    next_team_feat_eng_dict = load(stg.NEXT_TEAM_FEAT_ENG_DICT)
-    xcoords_feat_eng_dict = load(stg.X_PROJ_FEAT_ENG_DICT)
-    ycoords_feat_eng_dict = load(stg.Y_PROJ_FEAT_ENG_DICT)
 
-    for lag in stg.NEXT_EVENT_LAGS:
-        LAG_COLUMN = '{}_lag{}'.format(stg.EVENT_TYPE_COL, lag)
-        LAG_FIRST_KEY = 'lag{}'.format(lag)
+def load_model(filename):
+    """Load model from joblib file, or from its compiled or memory mapped version if it exists.
+
+    Parameters
+    ----------
+    filename: string
+        Joblib file, compiled (see compiled_pipeline) then memory mapped (see model_artifacts)
+        versions being looked for next to it
 
-        X_next_event[LAG_COLUMN] = X_next_event[LAG_COLUMN].apply(int)\
-                                                           .map(next_team_feat_eng_dict[LAG_FIRST_KEY]['dict'])\
-                                                           .fillna(value=next_team_feat_eng_dict[LAG_FIRST_KEY]['mean'])
+    Returns
+    -------
+    model: object
 
-    logging.info('Pb 2 - After feature engineering: {}'.format(time.time() - start))
+    """
+    compiled_filename = get_compiled_pipeline_path(filename)
+    if stg.BOOL_USE_COMPILED_PIPELINES and isfile(compiled_filename):
+        return CompiledPipeline.load(compiled_filename)
 
-    next_team_model = load(stg.NEXT_TEAM_MODEL_NAME)
-    next_team_pred = next_team_model.predict(X_next_event)[0]
-    logging.info('Pb 2 - After model load and prediction: {}'.format(time.time() - start))
+    mapped_filename = get_mapped_artifact_path(filename)
+    if stg.BOOL_USE_MAPPED_ARTIFACTS and isfile(mapped_filename):
+        return load_mapped_artifact(mapped_filename)
+    return load(filename)
 
-    for lag in stg.NEXT_EVENT_LAGS:
-        LAG_COLUMN = '{}_lag{}'.format(stg.EVENT_TYPE_COL, lag)
-        LAG_FIRST_KEY = 'lag{}'.format(lag)
 
-        X_xcoords[LAG_COLUMN] = X_xcoords[LAG_COLUMN].apply(int)\
-                                                     .map(xcoords_feat_eng_dict[LAG_FIRST_KEY]['dict'])\
-                                                     .fillna(value=xcoords_feat_eng_dict[LAG_FIRST_KEY]['mean'])
+def load_forest_model(filename):
+    """Load model with load_model(), voting with early exit if it is a forest classifier.
 
-        X_ycoords[LAG_COLUMN] = X_ycoords[LAG_COLUMN].apply(int)\
-                                                     .map(ycoords_feat_eng_dict[LAG_FIRST_KEY]['dict'])\
-                                                     .fillna(value=ycoords_feat_eng_dict[LAG_FIRST_KEY]['mean'])
+    Parameters
+    ----------
+    filename: string
 
-    logging.info('Pb 3 - After feature engineering: {}'.format(time.time() - start))
+    Returns
+    -------
+    model: EarlyExitForest or model itself
 
-    xcoords_model = load(stg.X_PROJ_MODEL_NAME)
-    ycoords_model = load(stg.Y_PROJ_MODEL_NAME)
+    """
+    model = load_model(filename)
+    if stg.BOOL_USE_EARLY_EXIT_FOREST and is_early_exit_compatible(model):
+        return EarlyExitForest(model=model)
+    return model
 
-    xcoords_along_team1 = xcoords_model.predict(X_xcoords)[0]
-    ycoords_along_team1 = ycoords_model.predict(X_ycoords)[0]
 
-    xcoord_pred = next_team_pred * xcoords_along_team1 + (1 - next_team_pred) * (100 - xcoords_along_team1)
-    ycoord_pred = next_team_pred * ycoords_along_team1 + (1 - next_team_pred) * (100 - ycoords_along_team1)
-    logging.info('Pb 3 - After model load and prediction: {}'.format(time.time() - start))
+def _map_event_types_lags(X, feat_eng_dict):
+    X_mapped = X.copy()
+    for lag in stg.NEXT_EVENT_LAGS:
+        LAG_COLUMN = '{}_lag{}'.format(stg.EVENT_TYPE_COL, lag)
+        LAG_FIRST_KEY = 'lag{}'.format(lag)
 
-    next_event_array[0] = next_team_pred
-    next_event_array[1] = ycoord_pred
-    next_event_array[2] = xcoord_pred
+        X_mapped[LAG_COLUMN] = X_mapped[LAG_COLUMN].apply(int)\
+                                                   .map(feat_eng_dict[LAG_FIRST_KEY]['dict'])\
+                                                   .fillna(value=feat_eng_dict[LAG_FIRST_KEY]['mean'])
+    return X_mapped
 
 
 if __name__ == '__main__':
     start = time.time()
-    Result(xml_filename='cleaned_test_set.xml')
+    Result()
     logging.info('Time elapsed: {}'.format(time.time() - start))
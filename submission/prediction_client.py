@@ -0,0 +1,81 @@
+"""Client of prediction_server.py.
+
+Usage:
+    python3 prediction_client.py instructions/cleaned_test_set.xml
+    python3 prediction_client.py --events events.json --output res_psgx.csv
+
+File given with --events holds JSON with "home_id", "away_id" and "events" keys, or
+"new_events" instead of "events" to only send events received since previous request
+of same game, see PredictionServer.
+"""
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+import settings as stg
+
+
+def request_prediction(content, host=stg.PREDICTION_SERVER_HOST, port=stg.PREDICTION_SERVER_PORT):
+    """Send a prediction request to server.
+
+    Parameters
+    ----------
+    content: dict
+        Body of POST /predict, see PredictionServer
+    host: string, default PREDICTION_SERVER_HOST in settings
+    port: integer, default PREDICTION_SERVER_PORT in settings
+
+    Returns
+    -------
+    prediction: list
+        Predicted player, next team, y and x
+
+    """
+    request = Request(url='http://{}:{}/predict'.format(host, port),
+                      data=json.dumps(content).encode('utf-8'),
+                      headers={'Content-Type': 'application/json'})
+    try:
+        with urlopen(request) as response:
+            return json.loads(response.read().decode('utf-8'))['prediction']
+    except HTTPError as error:
+        raise RuntimeError('Prediction server error: {}'.format(json.loads(error.read().decode('utf-8'))['error']))
+
+
+def _parse_arguments(arguments):
+    parser = argparse.ArgumentParser(description='Request predictions from prediction_server.py')
+    parser.add_argument('xml_filename', nargs='?', help='Test set XML file')
+    parser.add_argument('--events', help='JSON file with home_id, away_id and events received so far, or new_events')
+    parser.add_argument('--output', help='CSV file to write prediction in, as main_psgx.py does')
+    parser.add_argument('--host', default=stg.PREDICTION_SERVER_HOST)
+    parser.add_argument('--port', type=int, default=stg.PREDICTION_SERVER_PORT)
+
+    args = parser.parse_args(arguments)
+    if (args.xml_filename is None) == (args.events is None):
+        parser.error('Give either an XML file or --events')
+    return args
+
+
+if __name__ == '__main__':
+    args = _parse_arguments(sys.argv[1:])
+    if args.events is None:
+        # Server may run from another folder
+        content = {'xml_filename': os.path.abspath(args.xml_filename)}
+    else:
+        with open(args.events, 'r') as file:
+            content = json.load(file)
+
+    start = time.time()
+    prediction = request_prediction(content=content, host=args.host, port=args.port)
+    elapsed = time.time() - start
+
+    if args.output is not None:
+        with open(args.output, mode='w') as result_file:
+            csv.writer(result_file, delimiter=',', quoting=csv.QUOTE_MINIMAL).writerow(prediction)
+    print(','.join(str(value) for value in prediction))
+    print('Answered in {:.3f}s'.format(elapsed), file=sys.stderr)
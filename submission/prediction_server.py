@@ -0,0 +1,171 @@
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from os.path import basename, splitext
+from socketserver import ThreadingMixIn
+
+import json
+import logging
+import threading
+import time
+
+from games_info import get_club_ids
+from live_features import LiveFeatureState
+from main_psgx import (build_test_set_features, compute_next_event_predictions, compute_player_predictions,
+                       load_next_event_pipelines, load_player_pipelines)
+
+import settings as stg
+
+if __name__ == '__main__':
+    stg.enable_logging(log_filename='{}.log'.format(splitext(basename(__file__))[0]),
+                       logging_level=logging.INFO)
+
+
+class PredictionServer(ThreadingMixIn, HTTPServer):
+    """Local HTTP server answering predictions with pipelines loaded once.
+
+    Every request is handled in its own thread, all threads sharing the same
+    pipelines, so that a request only costs feature extraction and prediction.
+    Features of live games are kept by game between requests: a request only sends
+    events received since previous one, which update features of its game.
+
+    Routes:
+    - GET /health: status and loaded pipelines
+    - POST /predict: JSON body with either
+        - "xml_filename": path of a test set, predicted as Result() does
+        - "home_id", "away_id" and "events": OPTA events received so far, as dicts
+          of XML attributes (see live_features.read_event), features of game being
+          rebuilt from them
+        - "home_id", "away_id" and "new_events": OPTA events received since previous
+          request of same game, added to its features
+      With events, next event is predicted after last one and player from stats of window.
+      Answer is JSON with "prediction": [player_id, team_id, y, x] as in res_psgx.csv
+
+    Attributes
+    ----------
+    pipelines: dict
+        Outputs of load_player_pipelines() and load_next_event_pipelines()
+    games: dict
+        LiveFeatureState and lock by game ID, '<home_id>-<away_id>'
+
+    """
+
+    daemon_threads = True
+
+    def __init__(self, server_address=(stg.PREDICTION_SERVER_HOST, stg.PREDICTION_SERVER_PORT)):
+        """Initialize class, loading all pipelines.
+
+        Parameters
+        ----------
+        server_address: tuple
+            Host and port, default PREDICTION_SERVER_HOST and PREDICTION_SERVER_PORT in settings
+
+        """
+        start = time.time()
+        self.pipelines = dict(load_player_pipelines(), **load_next_event_pipelines())
+        logging.info('Pipelines loaded: {}'.format(time.time() - start))
+
+        self.games = dict()
+        self._games_lock = threading.Lock()
+
+        HTTPServer.__init__(self, server_address, PredictionRequestHandler)
+
+    def predict(self, request):
+        """Predict player, next team, y and x for a request.
+
+        Parameters
+        ----------
+        request: dict
+            Body of POST /predict
+
+        Returns
+        -------
+        prediction: list
+
+        """
+        if 'xml_filename' in request:
+            player_stats, df_events = build_test_set_features(xml_filename=request['xml_filename'])
+        elif 'events' in request or 'new_events' in request:
+            is_full_payload = 'events' in request
+            player_stats, df_events = self._get_features_from_events(
+                home_id=request['home_id'], away_id=request['away_id'],
+                events=request['events'] if is_full_payload else request['new_events'],
+                is_full_payload=is_full_payload)
+        else:
+            raise KeyError('Request must contain xml_filename, events or new_events')
+
+        player_prediction = stg.DEFAULT_PLAYER_PREDICTION if player_stats is None \
+            else compute_player_predictions(player_stats=player_stats, pipelines=self.pipelines)[0]
+        next_event_prediction = stg.DEFAULT_NEXT_EVENT_PREDICTION if df_events is None \
+            else compute_next_event_predictions(df_events=df_events, pipelines=self.pipelines)[0]
+
+        return [int(player_prediction), int(next_event_prediction[0]),
+                float(next_event_prediction[1]), float(next_event_prediction[2])]
+
+    def _get_features_from_events(self, home_id, away_id, events, is_full_payload):
+        game_id = '{}-{}'.format(home_id, away_id)
+        with self._games_lock:
+            if is_full_payload or game_id not in self.games:
+                self.games[game_id] = (LiveFeatureState(home_id=home_id, away_id=away_id), threading.Lock())
+            state, state_lock = self.games[game_id]
+
+        # Requests of a game update its state one after the other, requests of other games in parallel
+        next_event_features = sorted(set(stg.NEXT_TEAM_FEATURES + stg.X_PROJ_FEATURES + stg.Y_PROJ_FEATURES))
+        with state_lock:
+            for event in events:
+                state.update(event=event)
+            player_stats = state.get_player_features()
+            df_events = state.get_next_event_features(features=next_event_features)
+
+        if player_stats is not None:
+            player_stats[stg.CLUB_COL] = get_club_ids(game_ids=[game_id] * len(player_stats),
+                                                      team_ids=player_stats[stg.TEAM_COL])
+        return player_stats, df_events
+
+
+class PredictionRequestHandler(BaseHTTPRequestHandler):
+    """Handler of PredictionServer requests."""
+
+    def do_GET(self):
+        """Answer health check."""
+        if self.path != '/health':
+            return self._send_json(status=404, content={'error': 'Unknown path {}'.format(self.path)})
+
+        return self._send_json(status=200, content={'status': 'ok',
+                                                    'pipelines': sorted(self.server.pipelines)})
+
+    def do_POST(self):
+        """Answer prediction request."""
+        if self.path != '/predict':
+            return self._send_json(status=404, content={'error': 'Unknown path {}'.format(self.path)})
+
+        start = time.time()
+        try:
+            content_length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(content_length).decode('utf-8'))
+            prediction = self.server.predict(request=request)
+        except Exception as error:
+            logging.exception('Prediction failed')
+            return self._send_json(status=400, content={'error': '{}: {}'.format(type(error).__name__, error)})
+
+        elapsed = time.time() - start
+        logging.info('Prediction {} in {:.3f}s'.format(prediction, elapsed))
+        return self._send_json(status=200, content={'prediction': prediction, 'elapsed': elapsed})
+
+    def log_message(self, format, *args):
+        logging.debug('{} - {}'.format(self.address_string(), format % args))
+
+    def _send_json(self, status, content):
+        body = json.dumps(content).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+if __name__ == '__main__':
+    server = PredictionServer()
+    logging.info('Serving predictions on {}:{}'.format(*server.server_address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -27,31 +27,35 @@ def enable_logging(log_filename, logging_level=logging.DEBUG):
 # Manage XML files provided by OPTA
 XML_PATH_TO_GAME_INFO = '/Games/Game'
 XML_PATH_TO_EVENTS = '/Games/Game/Event'
+XML_GAME_TAG = 'Game'
+XML_EVENT_TAG = 'Event'
 XML_QUALIFIER_TAG = 'Q'
 XML_QUALIFIER_VALUE_ATTRIBUTE = 'value'
+# Nb of parsed game files kept in memory, None for no bound, 0 to disable
+GAME_DOCUMENT_CACHE_SIZE = 8
 
 # Game info from OPTA
 PERIOD_COL = 'period_id'
 EVENT_COL = 'event_id'
 EVENT_TYPE_COL = 'type_id'
 EVENTS_MAP = {
-    'PASS': '1',
-    'FOUL': '4',
-    'CORNER_AWARDED': '6',
-    'KICKOFF': '34',
-    'PLAYER_OFF': '18',
-    'PLAYER_ON': '19',
-    'START_PERIOD': '32',
-    'END_PERIOD': '30',
-    'DELETED_EVENT': '43'
+    'PASS': 1,
+    'FOUL': 4,
+    'CORNER_AWARDED': 6,
+    'KICKOFF': 34,
+    'PLAYER_OFF': 18,
+    'PLAYER_ON': 19,
+    'START_PERIOD': 32,
+    'END_PERIOD': 30,
+    'DELETED_EVENT': 43
 }
 OUTCOME_COL = 'outcome'
 KEYPASS_COL = 'keypass'
 ASSIST_COL = 'assist'
 
-GK_EVENTS = ['10', '11', '41', '52', '53', '54', '58']
+GK_EVENTS = [10, 11, 41, 52, 53, 54, 58]
 GK_EVENTS_COL = 'gk_events'
-SHOTS_EVENTS = ['13', '14', '15', '16']
+SHOTS_EVENTS = [13, 14, 15, 16]
 SHOTS_COL = 'shots'
 FREE_KICK_COL = 'free_kick'
 CORNER_COL = 'corner'
@@ -61,10 +65,16 @@ QUALIFIER_MAP = {
     'ALL_PLAYERS': '30',
     'ZONE': '56'
 }
+ZONE_COL = '{}_{}'.format(QUALIFIER_COL, QUALIFIER_MAP['ZONE'])
+NO_POSITION = 'no_position'
 
 # Players info from OPTA
 TEAM_COL = 'team_id'
+# OPTA ID of club of a team, team_id being binarized (1 for home team, 0 for away team)
+CLUB_COL = 'club_id'
 PLAYER_COL = 'player_id'
+MISSING_PLAYER_ID = -1
+PLAYER_TO_PREDICT_ID = 1
 MINUTES_COL = 'min'
 SECONDS_COL = 'sec'
 X_COL = 'x'
@@ -75,16 +85,42 @@ Y_PROJECTED_COL = 'y_along_team1_axis'
 GAME_ID_COL = 'game'
 GAME_TIME_COL = 'game_time_in_sec'
 
-COLS_TO_KEEP = [GAME_ID_COL, EVENT_TYPE_COL, '{}_{}'.format(QUALIFIER_COL, QUALIFIER_MAP['ZONE']),
+COLS_TO_KEEP = [GAME_ID_COL, EVENT_TYPE_COL, ZONE_COL,
                 PERIOD_COL, GAME_TIME_COL, PLAYER_COL, TEAM_COL, OUTCOME_COL, KEYPASS_COL, ASSIST_COL,
                 X_COL, Y_COL]
+# Types of cleaned events, applied once after missing values are filled
+# Player IDs are OPTA IDs as int32 (str() gives back XML value), MISSING_PLAYER_ID if event has no player
+EVENTS_FILL_VALUES = {ZONE_COL: NO_POSITION, PLAYER_COL: MISSING_PLAYER_ID,
+                      KEYPASS_COL: 0, ASSIST_COL: 0}
+EVENTS_DTYPES = {GAME_ID_COL: 'category', EVENT_TYPE_COL: 'int16', ZONE_COL: 'category',
+                 PERIOD_COL: 'int8', GAME_TIME_COL: 'int32', PLAYER_COL: 'int32', TEAM_COL: 'int8',
+                 OUTCOME_COL: 'int8', KEYPASS_COL: 'int8', ASSIST_COL: 'int8',
+                 X_COL: 'float32', Y_COL: 'float32'}
+
+# Models artifacts
+# Memory mapped version of a model, joblib file with numpy arrays stored uncompressed
+MAPPED_ARTIFACT_EXTENSION = '.mmap'
+# Load memory mapped version of a model if it exists, instead of joblib file
+BOOL_USE_MAPPED_ARTIFACTS = True
+# Pipeline compiled to numpy arrays, see compiled_pipeline, used instead of joblib file if it exists
+COMPILED_PIPELINE_EXTENSION = '.compiled'
+BOOL_USE_COMPILED_PIPELINES = True
+# Cascade: first stage answers when confident enough, full model otherwise (if configuration file exists)
+CASCADE_CONFIG_FILENAME = 'cascade_config.h5'
+BOOL_USE_CASCADE = True
+# Early-exit voting of forests, skipping trees which cannot change predictions anymore
+EARLY_EXIT_BATCH_SIZE = 5
+BOOL_USE_EARLY_EXIT_FOREST = True
 
 # Model 1 - Players prediction
-EVENTS_COMPUTE_NUMBER = ['3', '4', '7', '8', '10', '14', '16', '17', '18', '19', '44', '61']
-EVENTS_COMPUTE_SUCCESS_RATE = ['1']
+# Length of window of events stats are computed on
+STATS_WINDOW_LENGTH_MIN = 15
+ZONES = ['Back', 'Center', 'Left', 'Right']
+EVENTS_COMPUTE_NUMBER = [3, 4, 7, 8, 10, 14, 16, 17, 18, 19, 44, 61]
+EVENTS_COMPUTE_SUCCESS_RATE = [1]
 PLAYER_FEATURES = ['team_id']\
     + ['nb_assist', 'nb_keypass', 'nb_gk_events', 'nb_shots', 'nb_free_kick', 'nb_corner']\
-    + ['Back', 'Center', 'Left', 'Right']\
+    + ZONES\
     + ['p_{}_nb'.format(el) for el in EVENTS_COMPUTE_SUCCESS_RATE]\
     + ['p_{}_success_rate'.format(el) for el in EVENTS_COMPUTE_SUCCESS_RATE]\
     + ['p_{}_nb'.format(el) for el in EVENTS_COMPUTE_NUMBER]\
@@ -96,6 +132,14 @@ PLAYER_FEATURES_MEDIAN_FILENAME = 'player_model_missing_values.h5'
 
 PLAYER_MODEL_NAME = 'player_model.h5'
 PLAYER_MODEL_LIGHT_NAME = 'player_model_light.h5'
+# Player model with a sub-model by club: index file, and file of every sub-model
+PLAYER_TEAM_MODEL_NAME = 'player_model_by_team.h5'
+PLAYER_TEAM_SUBMODEL_NAME = 'player_model_team{team}.h5'
+# Use player model by club instead of single player model if its index file exists
+BOOL_USE_PLAYER_TEAM_MODEL = True
+# RAM used by a copy of player model and by everything else, light model is loaded if RAM is lower
+PLAYER_MODEL_RAM_GO = 4
+OTHER_PROCESSES_RAM_GO = 1
 
 # Model 2 - Next team prediction
 NEXT_EVENT_COLS_TO_LAG = [PERIOD_COL, EVENT_TYPE_COL, TEAM_COL,
@@ -126,3 +170,23 @@ Y_PROJ_FEATURES = ['{}_lag{}'.format(col, lag)
 
 Y_PROJ_FEAT_ENG_DICT = 'coords_y_feature_engineering_dict.h5'
 Y_PROJ_MODEL_NAME = 'coords_y_proj_model.h5'
+
+# Predictions
+RESULT_FILENAME = './res_psgx.csv'
+# Load all models once then fork processes sharing them, instead of loading models in every process
+BOOL_FORK_AFTER_LOAD = False
+# Predictions written if a model cannot predict: player, next team, y and x
+DEFAULT_PLAYER_PREDICTION = 59957
+DEFAULT_NEXT_EVENT_PREDICTION = [0, 50, 50]
+
+# Prediction server, models are loaded once and shared by all requests
+PREDICTION_SERVER_HOST = '127.0.0.1'
+PREDICTION_SERVER_PORT = 8765
+
+# Batch predictions on many test sets
+# Nb of processes predicting test sets, max nb of test sets predicted together by every model
+BATCH_N_JOBS = 2
+BATCH_CHUNK_SIZE = 256
+BATCH_RESULT_FILENAME = './res_psgx_batch.csv'
+# Load models once then fork processes sharing them
+BATCH_FORK_AFTER_LOAD = True